@@ -3,6 +3,7 @@ import os
 from django.db import models
 from django.utils import timezone
 from datetime import timedelta
+from apps.tools.sidecar import remove_sidecars
 
 def daily_upload_path(instance, filename):
     return f"documents/{instance.id}/{filename}"
@@ -26,6 +27,7 @@ class Document(models.Model):
         if self.file:
             if os.path.isfile(self.file.path):
                 os.remove(self.file.path)
+            remove_sidecars(self.file.path)
         super().delete(*args, **kwargs)
 
     def __str__(self):
@@ -2,6 +2,7 @@ import os
 from rest_framework import generics, status
 from rest_framework.response import Response
 from rest_framework.parsers import MultiPartParser, FormParser
+from apps.tools.csv import overlay, trigram
 from .models import Document
 from .serializers import DocumentSerializer, DocumentUploadSerializer
 from drf_spectacular.utils import extend_schema
@@ -31,6 +32,9 @@ class DocumentUploadView(generics.CreateAPIView):
                     file_type=file_ext,
                     file_size=file_size
                 )
+                if file_ext == 'csv' and settings.TRIGRAM_INDEX_ON_UPLOAD:
+                    # Substring searches use it once it's ready
+                    trigram.build_in_background(doc.file.path)
                 
                 return Response(DocumentSerializer(doc, context={'request': request}).data, status=status.HTTP_201_CREATED)
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -49,3 +53,18 @@ class DocumentDetailView(generics.RetrieveDestroyAPIView):
     queryset = Document.objects.all()
     serializer_class = DocumentSerializer
     lookup_field = 'pk'
+
+    def destroy(self, request, *args, **kwargs):
+        doc = self.get_object()
+        # Overlays (lazy edits) read their rows from this file; deleting it would break them
+        dependents = [
+            str(other.pk)
+            for other in Document.objects.filter(file__endswith=overlay.OVERLAY_SUFFIX).exclude(pk=doc.pk)
+            if overlay.base_name(other.file.path) == doc.file.name
+        ]
+        if dependents:
+            return Response(
+                {'error': 'Edited copies still read from this document; delete or materialize them first', 'dependents': dependents},
+                status=status.HTTP_409_CONFLICT,
+            )
+        return super().destroy(request, *args, **kwargs)
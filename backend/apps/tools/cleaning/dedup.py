@@ -0,0 +1,129 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from apps.tools.csv import spill
+
+# Streaming 'deduplicate' (keep the first copy of each row, as
+# DataFrame.drop_duplicates does). Rows are identified by a 128-bit digest of
+# their values (two independently keyed 64-bit hashes), or of the `subset`
+# columns. While the input fits the spill budget it is deduplicated in memory;
+# past it, the rows are spilled to a scratch file in order and their digests
+# hash-partitioned to others. Each digest partition is small enough to find
+# its duplicates alone; the dropped rows are marked in a disk-backed mask and
+# the kept rows streamed back out in one pass.
+
+HASH_KEYS = ('sarva-dedup-key1', 'sarva-dedup-key2')
+DIGEST_PARTITIONS = 64
+
+
+def _number_key(value):
+    value = float(value) if not isinstance(value, (int, np.integer)) else int(value)
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value)
+
+
+def _hashable(series, null_kinds=False):
+    """
+    Three columns (text, numbers, other values) that hash the same exactly
+    when drop_duplicates finds the values equal. Hashing the values directly
+    would equate 1 with '1'; Python equality equates 1, 1.0 and True. Missing
+    values are all equal, except that a single-column comparison (which
+    pandas runs through Series.duplicated) tells None, NaN, NA, NaT apart.
+    """
+    if series.dtype == object and pd.api.types.infer_dtype(series, skipna=True) in ('string', 'empty'):
+        other = pd.Series([None] * len(series), dtype=object)
+        missing = series.isna().to_numpy()
+        if null_kinds and missing.any():
+            other[missing] = [type(v).__name__ for v in series[missing]]
+        return [series.reset_index(drop=True), pd.Series([None] * len(series), dtype=object), other]
+    text, numbers, other = [], [], []
+    for value in series.astype(object):
+        kind = None
+        if isinstance(value, str):
+            kind = text
+        elif not pd.isna(value):
+            if isinstance(value, (int, float, bool, np.number, np.bool_)):
+                kind, value = numbers, _number_key(value)
+            else:
+                kind, value = other, repr(value)
+        elif null_kinds:
+            kind, value = other, type(value).__name__
+        for column in (text, numbers, other):
+            column.append(value if column is kind else None)
+    return [pd.Series(column, dtype=object) for column in (text, numbers, other)]
+
+
+def row_digests(df, subset=None):
+    """(high, low) 64-bit halves of each row's digest."""
+    columns = list(subset) if subset else list(df.columns)
+    null_kinds = len(columns) == 1 and df.columns.is_unique
+    parts = {}
+    for k, column in enumerate(columns):
+        for j, part in enumerate(_hashable(df[column], null_kinds)):
+            parts[f"{k}.{j}"] = part
+    frame = pd.DataFrame(parts, index=pd.RangeIndex(len(df)))
+    return tuple(
+        pd.util.hash_pandas_object(frame, index=False, hash_key=key).to_numpy()
+        for key in HASH_KEYS
+    )
+
+
+def deduplicate(chunks, params):
+    """Planner step for 'deduplicate': the chunks without repeated rows."""
+    subset = params.get('subset', None)
+    budget = spill.memory_budget()
+    buffered, digests, used = [], [], 0
+    chunks = iter(chunks)
+    for chunk in chunks:
+        high, low = row_digests(chunk, subset)
+        buffered.append(chunk)
+        digests.append((high, low))
+        used += spill.frame_bytes(chunk) + high.nbytes + low.nbytes
+        if used > budget:
+            break
+    else:
+        keys = pd.DataFrame({
+            'high': np.concatenate([h for h, _ in digests]),
+            'low': np.concatenate([l for _, l in digests]),
+        })
+        drop = keys.duplicated().to_numpy()
+        offset = 0
+        for chunk in buffered:
+            yield chunk[~drop[offset:offset + len(chunk)]]
+            offset += len(chunk)
+        return
+
+    with spill.scratch_dir('dedup') as directory:
+        rows = spill.Partitions(directory, 'rows', 1)
+        keys = spill.Partitions(directory, 'digests', DIGEST_PARTITIONS)
+        total = 0
+
+        def spill_chunk(chunk, high, low):
+            nonlocal total
+            rows.append(0, chunk)
+            frame = pd.DataFrame({'high': high, 'low': low, 'row': np.arange(total, total + len(chunk))})
+            for k, part in frame.groupby(high % np.uint64(DIGEST_PARTITIONS), sort=False):
+                keys.append(int(k), part)
+            total += len(chunk)
+
+        for chunk, (high, low) in zip(buffered, digests):
+            spill_chunk(chunk, high, low)
+        buffered = digests = None
+        for chunk in chunks:
+            spill_chunk(chunk, *row_digests(chunk, subset))
+
+        # Partitions list their rows in order, so the first copy comes first
+        dropped = np.memmap(os.path.join(directory, 'dropped.mask'), dtype=np.bool_, mode='w+', shape=(max(total, 1),))
+        for k in range(DIGEST_PARTITIONS):
+            if keys.rows[k]:
+                part = keys.read(k, ['high', 'low', 'row'])
+                dropped[part['row'].to_numpy()[part.duplicated(['high', 'low']).to_numpy()]] = True
+
+        offset = 0
+        for chunk in rows.iter(0):
+            yield chunk[~dropped[offset:offset + len(chunk)]]
+            offset += len(chunk)
+        del dropped
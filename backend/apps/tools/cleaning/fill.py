@@ -0,0 +1,135 @@
+import os
+import pickle
+
+import pandas as pd
+
+from apps.tools.csv import spill
+from .operations import _fillna, fill_method
+
+# Streaming forward/backward fill ('fillna' with a method) for the planner.
+#
+# Forward fill carries the last value of each column across chunk
+# boundaries. Backward fill needs the next value instead: chunks wait in a
+# look-ahead buffer until every column that ends in blanks has met a value in
+# a later chunk. A column that stays blank for long (or for good) would hold
+# the buffer open, so past the spill budget the rest of the table is written
+# to scratch files and filled in one pass from the last chunk back.
+
+def _fill_with(chunk, values):
+    """chunk with the blanks of each column in `values` set to its value."""
+    chunk = chunk.copy(deep=False)
+    for column, value in values.items():
+        chunk[column] = _fillna(chunk[column], value)
+    return chunk
+
+
+def _within(chunk, columns, method):
+    chunk = chunk.copy(deep=False)
+    # Text stays text rather than being downcast (pandas' future behaviour)
+    with pd.option_context('future.no_silent_downcasting', True):
+        chunk[columns] = getattr(chunk[columns], method)()
+    return chunk
+
+
+def _edge_values(chunk, columns, row):
+    """{column: value} of the non-blank cells of one row (0 or -1) of a chunk."""
+    if not len(chunk):
+        return {}
+    values = chunk[columns].iloc[row]
+    return {c: v for c, v in values.items() if not pd.isna(v)}
+
+
+def forward_fill(chunks, columns=None):
+    carry = {}
+    for chunk in chunks:
+        cols = list(columns or chunk.columns)
+        chunk = _within(chunk, cols, 'ffill')
+        # Blanks left are at the start of the chunk, before each column's first value
+        chunk = _fill_with(chunk, {c: v for c, v in carry.items() if c in cols})
+        carry.update(_edge_values(chunk, cols, -1))
+        yield chunk
+
+
+def backward_fill(chunks, columns=None):
+    budget = spill.memory_budget()
+    pending = []  # [chunk, columns still ending in blanks, bytes]
+    used = 0
+    chunks = iter(chunks)
+    for chunk in chunks:
+        cols = list(columns or chunk.columns)
+        chunk = _within(chunk, cols, 'bfill')
+        _resolve(pending, chunk, cols)
+        size = spill.frame_bytes(chunk)
+        pending.append([chunk, set(c for c in cols if len(chunk) and pd.isna(chunk[c].iloc[-1])), size])
+        used += size
+        while pending and not pending[0][1]:
+            done, _, size = pending.pop(0)
+            used -= size
+            yield done
+        if used > budget:
+            yield from _reverse_pass([entry[0] for entry in pending], chunks, columns)
+            return
+    for chunk, _, _ in pending:
+        yield chunk
+
+
+def _resolve(pending, chunk, columns):
+    """Fill the trailing blanks of pending chunks from the first values after them."""
+    following = chunk
+    for entry in reversed(pending):
+        earlier, unresolved, _ = entry
+        if not len(earlier):
+            continue
+        values = {}
+        if unresolved and len(following):
+            values = {c: v for c, v in _edge_values(following, columns, 0).items() if c in unresolved}
+        if not values:
+            # This chunk's first row is unchanged, so nothing before it can change either
+            break
+        following = entry[0] = _fill_with(earlier, values)
+        unresolved.difference_update(values)
+
+
+def _reverse_pass(buffered, rest, columns):
+    with spill.scratch_dir('bfill') as directory:
+        paths = []
+
+        def save(chunk):
+            path = os.path.join(directory, f"chunk.{len(paths)}.pkl")
+            with open(path, 'wb') as f:
+                pickle.dump(chunk, f, protocol=pickle.HIGHEST_PROTOCOL)
+            paths.append(path)
+
+        for chunk in buffered:
+            save(chunk)
+        buffered = None
+        for chunk in rest:
+            save(chunk)
+
+        carry = {}
+        for path in reversed(paths):
+            with open(path, 'rb') as f:
+                chunk = pickle.load(f)
+            cols = list(columns or chunk.columns)
+            chunk = _within(chunk, cols, 'bfill')
+            chunk = _fill_with(chunk, {c: v for c, v in carry.items() if c in cols})
+            if len(chunk):
+                # A column blank at the start is blank throughout, and already had no carry
+                carry = _edge_values(chunk, cols, 0)
+            with open(path, 'wb') as f:
+                pickle.dump(chunk, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+        for path in paths:
+            with open(path, 'rb') as f:
+                chunk = pickle.load(f)
+            os.remove(path)
+            yield chunk
+
+
+def fill_step(chunks, params):
+    """Planner step for 'fillna' with a method."""
+    method = fill_method(params.get('method'))
+    columns = params.get('columns', None)
+    if method == 'ffill':
+        return forward_fill(chunks, columns)
+    return backward_fill(chunks, columns)
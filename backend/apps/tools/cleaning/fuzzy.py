@@ -0,0 +1,219 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from apps.tools.csv import spill
+
+# 'fuzzy_deduplicate': rows whose text is nearly the same (case, spacing and
+# small typos aside) form a cluster, found in near-linear time:
+#   1. each row's text (the chosen columns, casefolded, whitespace collapsed)
+#      is cut into character trigrams, and summarised by a MinHash signature
+#      of NUM_PERM minimums; two signatures agree at a position with
+#      probability equal to the Jaccard similarity of the trigram sets;
+#   2. signatures are cut into bands, and rows sharing a band's values land
+#      in the same bucket (locality-sensitive hashing); the band width is
+#      chosen so that pairs near `threshold` are likely to share one;
+#   3. each bucket member is checked against the bucket's first row by the
+#      share of equal signature positions, and rows that pass are joined.
+# A cluster's canonical row is its first one; its position is the cluster id.
+# Rows are spilled to scratch files past the budget, as for 'deduplicate'.
+
+NUM_PERM = 64
+SHINGLE = 3
+ACTIONS = ('remove', 'label')
+# Rows hashed at once; bounds the (trigrams x NUM_PERM) matrix
+HASH_BATCH_ROWS = 2_000
+_EMPTY = np.iinfo(np.uint32).max
+
+_rng = np.random.default_rng(0x5A4A)
+# Odd multipliers and offsets of the NUM_PERM multiply-shift hash functions
+_A = _rng.integers(1, 2 ** 63, NUM_PERM, dtype=np.uint64) | np.uint64(1)
+_B = _rng.integers(0, 2 ** 63, NUM_PERM, dtype=np.uint64)
+
+
+def _mix(x):
+    """splitmix64 finaliser, element-wise over a uint64 array."""
+    x = x ^ (x >> np.uint64(30))
+    x = x * np.uint64(0xBF58476D1CE4E5B9)
+    x = x ^ (x >> np.uint64(27))
+    x = x * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def _shingles(text):
+    """Character trigrams of text, each packed into one integer (as in the trigram index)."""
+    codes = [ord(c) for c in text]
+    if 0 < len(codes) < SHINGLE:
+        codes += [0] * (SHINGLE - len(codes))
+    return {(a << 42) | (b << 21) | c for a, b, c in zip(codes, codes[1:], codes[2:])}
+
+
+def row_texts(chunk, columns):
+    """The normalized text of each row: its columns' values, casefolded, whitespace collapsed."""
+    text = None
+    for column in columns:
+        values = chunk[column].astype(object).where(chunk[column].notna(), '').astype(str)
+        text = values if text is None else text.str.cat(values, sep=' ')
+    if text is None:
+        return [''] * len(chunk)
+    return text.str.casefold().str.split().str.join(' ').tolist()
+
+
+def signatures(texts):
+    """(len(texts), NUM_PERM) MinHash signatures; rows without text get _EMPTY throughout."""
+    result = np.full((len(texts), NUM_PERM), _EMPTY, dtype=np.uint32)
+    for start in range(0, len(texts), HASH_BATCH_ROWS):
+        grams, rows = [], []
+        for k, text in enumerate(texts[start:start + HASH_BATCH_ROWS]):
+            found = _shingles(text)
+            grams.extend(found)
+            rows.extend([start + k] * len(found))
+        if not grams:
+            continue
+        hashed = _mix(np.array(grams, dtype=np.uint64))
+        # Multiply-shift: the high 32 bits of a*x + b (mod 2**64) per hash function
+        hashed = ((hashed[:, None] * _A + _B) >> np.uint64(32)).astype(np.uint32)
+        rows = np.array(rows)
+        starts = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]])
+        result[rows[starts]] = np.minimum.reduceat(hashed, starts, axis=0)
+    return result
+
+
+def bands(threshold):
+    """
+    (bands, rows per band) whose LSH curve turns up closest below `threshold`:
+    candidates are verified afterwards, so recall matters more than precision.
+    """
+    options = [(NUM_PERM // r, r) for r in range(1, NUM_PERM + 1) if NUM_PERM % r == 0]
+    below = [o for o in options if (1 / o[0]) ** (1 / o[1]) <= threshold]
+    return max(below, key=lambda o: (1 / o[0]) ** (1 / o[1])) if below else options[0]
+
+
+def _band_keys(sig):
+    key = np.zeros(len(sig), dtype=np.uint64)
+    for j in range(sig.shape[1]):
+        key = _mix(key ^ sig[:, j].astype(np.uint64))
+    return key
+
+
+def clusters(sig, threshold):
+    """Cluster id of each row: the position of the first row of its cluster."""
+    n = len(sig)
+    labels = np.arange(n)
+    valid = np.flatnonzero((np.asarray(sig) != _EMPTY).any(axis=1))
+    if len(valid) < 2:
+        return labels
+
+    band_count, width = bands(threshold)
+    pairs = []
+    for band in range(band_count):
+        keys = _band_keys(np.asarray(sig[valid, band * width:(band + 1) * width]))
+        order = np.argsort(keys, kind='stable')
+        ordered = keys[order]
+        first = np.r_[True, ordered[1:] != ordered[:-1]]
+        # Pair every bucket member with the bucket's first row
+        heads = order[np.flatnonzero(first)[np.cumsum(first) - 1]]
+        member = ~first
+        pairs.append(np.stack([valid[heads[member]], valid[order[member]]], axis=1))
+    pairs = np.unique(np.concatenate(pairs), axis=0)
+
+    similar = np.zeros(len(pairs), dtype=bool)
+    for start in range(0, len(pairs), HASH_BATCH_ROWS):
+        u, v = pairs[start:start + HASH_BATCH_ROWS].T
+        similar[start:start + HASH_BATCH_ROWS] = (np.asarray(sig[u]) == np.asarray(sig[v])).mean(axis=1) >= threshold
+    u, v = pairs[similar].T
+
+    # Connected components by min-label propagation with pointer jumping
+    while len(u):
+        low = np.minimum(labels[u], labels[v])
+        if (labels[u] == low).all() and (labels[v] == low).all():
+            break
+        np.minimum.at(labels, u, low)
+        np.minimum.at(labels, v, low)
+        while True:
+            jumped = labels[labels]
+            if (jumped == labels).all():
+                break
+            labels = jumped
+    return labels
+
+
+def _options(params):
+    try:
+        threshold = float(params.get('threshold', 0.8))
+    except (TypeError, ValueError):
+        raise ValueError(f"threshold must be a number, not {params.get('threshold')!r}")
+    if not 0 < threshold <= 1:
+        raise ValueError("threshold must be in (0, 1]")
+    action = params.get('action', 'remove')
+    if action not in ACTIONS:
+        raise ValueError(f"Unknown action '{action}', expected one of: {', '.join(ACTIONS)}")
+    return params.get('columns', None), threshold, action, params.get('cluster_column', 'cluster_id')
+
+
+def _chunk_signatures(chunk, columns):
+    columns = list(columns or chunk.columns)
+    missing = [c for c in columns if c not in chunk.columns]
+    if missing:
+        raise ValueError(f"Unknown column(s): {', '.join(map(str, missing))}")
+    return signatures(row_texts(chunk, columns))
+
+
+def _emit(chunks, labels, action, cluster_column):
+    offset = 0
+    for chunk in chunks:
+        ids = labels[offset:offset + len(chunk)]
+        if action == 'remove':
+            yield chunk[ids == np.arange(offset, offset + len(chunk))]
+        else:
+            chunk = chunk.copy(deep=False)
+            chunk[cluster_column] = ids
+            yield chunk
+        offset += len(chunk)
+
+
+def fuzzy_deduplicate(chunks, params):
+    """
+    Planner step for 'fuzzy_deduplicate'. params: columns (default all),
+    threshold (estimated Jaccard similarity of trigram sets, default 0.8),
+    action ('remove' non-canonical rows, or 'label' each row with its
+    cluster id in cluster_column).
+    """
+    columns, threshold, action, cluster_column = _options(params)
+    budget = spill.memory_budget()
+    buffered, sigs, used = [], [], 0
+    chunks = iter(chunks)
+    for chunk in chunks:
+        sig = _chunk_signatures(chunk, columns)
+        buffered.append(chunk)
+        sigs.append(sig)
+        used += spill.frame_bytes(chunk) + sig.nbytes
+        if used > budget:
+            break
+    else:
+        labels = clusters(np.concatenate(sigs), threshold)
+        yield from _emit(buffered, labels, action, cluster_column)
+        return
+
+    with spill.scratch_dir('fuzzy') as directory:
+        rows = spill.Partitions(directory, 'rows', 1)
+        sig_path = os.path.join(directory, 'signatures.u32')
+        with open(sig_path, 'wb') as f:
+            for chunk, sig in zip(buffered, sigs):
+                rows.append(0, chunk)
+                f.write(sig.tobytes())
+            buffered = sigs = None
+            for chunk in chunks:
+                rows.append(0, chunk)
+                f.write(_chunk_signatures(chunk, columns).tobytes())
+
+        sig = np.memmap(sig_path, dtype=np.uint32, mode='r', shape=(rows.rows[0], NUM_PERM))
+        labels = clusters(sig, threshold)
+        del sig
+        yield from _emit(rows.iter(0), labels, action, cluster_column)
+
+
+def fuzzy_deduplicate_frame(df, params):
+    """fuzzy_deduplicate over one in-memory frame."""
+    return pd.concat(list(fuzzy_deduplicate([df], params)))
@@ -0,0 +1,59 @@
+import pandas as pd
+
+from apps.tools.csv import spill
+from .operations import apply_operation
+
+# Streaming 'drop_missing' over columns (axis=1), as DataFrame.dropna does:
+# a column goes when it has any blank ('any') or only blanks ('all'). Which
+# columns those are is known only after the last row, so the first pass
+# counts the non-blank cells of each column while holding the chunks (in
+# memory up to the spill budget, then in a scratch file); the second pass
+# yields them without the dropped columns.
+
+
+def _dropped(columns, counts, rows, how):
+    if how == 'all':
+        return [c for c in columns if counts.get(c, 0) == 0]
+    return [c for c in columns if counts.get(c, 0) != rows]
+
+
+def drop_missing_columns(chunks, params):
+    """Planner step for 'drop_missing' with axis=1 (or 'columns')."""
+    how = params.get('how', 'any')
+    if how not in ('any', 'all'):
+        raise ValueError(f"Unknown how '{how}', expected 'any' or 'all'")
+    if params.get('subset'):
+        # A subset names rows here, which only the whole table has
+        op = {'type': 'drop_missing', 'params': params}
+        yield apply_operation(pd.concat(list(chunks)), op)
+        return
+
+    budget = spill.memory_budget()
+    buffered, used, spilling = [], 0, False
+    columns, counts, rows = None, {}, 0
+    with spill.scratch_dir('dropna') as directory:
+        spilled = spill.Partitions(directory, 'rows', 1)
+        for chunk in chunks:
+            columns = list(chunk.columns)
+            for column, count in chunk.notna().sum().items():
+                counts[column] = counts.get(column, 0) + int(count)
+            rows += len(chunk)
+            used += spill.frame_bytes(chunk)
+            if not spilling and used > budget:
+                spilling = True
+                for earlier in buffered:
+                    spilled.append(0, earlier)
+                buffered = None
+            if spilling:
+                spilled.append(0, chunk)
+            else:
+                buffered.append(chunk)
+
+        dropped = _dropped(columns or [], counts, rows, how)
+        emitted = False
+        for chunk in (spilled.iter(0) if spilling else buffered):
+            emitted = True
+            yield chunk.drop(columns=dropped)
+        if not emitted and columns is not None:
+            # Every chunk was empty; the columns still reach the output
+            yield pd.DataFrame({c: pd.Series(dtype=object) for c in columns if c not in dropped})
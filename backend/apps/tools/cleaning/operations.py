@@ -0,0 +1,77 @@
+import pandas as pd
+
+from . import fuzzy
+
+
+def _fillna(series, value):
+    try:
+        return series.fillna(value)
+    except (TypeError, ValueError):
+        # Compact dtypes (categories, nullable ints, Arrow strings) only hold
+        # values of their own kind, e.g. not '' in an integer column
+        return series.astype(object).fillna(value)
+
+
+# fillna methods, with the aliases fillna(method=...) used to accept
+FILL_METHODS = {'ffill': 'ffill', 'pad': 'ffill', 'bfill': 'bfill', 'backfill': 'bfill'}
+
+
+def fill_method(method):
+    if method not in FILL_METHODS:
+        raise ValueError(f"Unknown fill method '{method}', expected one of: {', '.join(FILL_METHODS)}")
+    return FILL_METHODS[method]
+
+
+def apply_operation(df, op):
+    """
+    Apply one cleaning operation { 'type', 'params' } to df and return the
+    result. df itself is left as it is.
+    """
+    op_type = op.get('type')
+    params = op.get('params') or {}
+
+    if op_type == 'deduplicate':
+        subset = params.get('subset', None)  # List of columns to check
+        return df.drop_duplicates(subset=subset)
+
+    if op_type == 'fuzzy_deduplicate':
+        return fuzzy.fuzzy_deduplicate_frame(df, params)
+
+    if op_type == 'fillna':
+        value = params.get('value', '')
+        method = params.get('method', None)  # 'ffill', 'bfill'
+        cols = params.get('columns', None)  # Specific columns or all
+        df = df.copy(deep=False)
+        if method:
+            method = fill_method(method)
+            with pd.option_context('future.no_silent_downcasting', True):
+                if cols:
+                    df[cols] = getattr(df[cols], method)()
+                else:
+                    df = getattr(df, method)()
+        else:
+            for col in cols or df.columns:
+                df[col] = _fillna(df[col], value)
+        return df
+
+    if op_type == 'drop_missing':
+        axis = params.get('axis', 0)  # 0 for rows, 1 for columns
+        how = params.get('how', 'any')  # 'any' or 'all'
+        subset = params.get('subset', None)
+        return df.dropna(axis=axis, how=how, subset=subset)
+
+    if op_type == 'drop_cols':
+        cols = params.get('columns', [])
+        return df.drop(columns=cols, errors='ignore')
+
+    if op_type == 'rename_cols':
+        mapping = params.get('mapping', {})
+        return df.rename(columns=mapping)
+
+    if op_type == 'standardize_header':
+        # Lowercase and replace spaces with underscores
+        df = df.copy(deep=False)
+        df.columns = df.columns.str.lower().str.replace(' ', '_')
+        return df
+
+    return df
@@ -0,0 +1,101 @@
+import pandas as pd
+
+from . import dedup, fill, fuzzy, missing
+from .operations import apply_operation
+
+# Cleaning pipelines as streams of chunks. Each operation is either
+#   row-local  its effect on a row depends on that row alone (fill with a
+#              value, drop/rename columns, standardize the header, drop rows
+#              with missing values), or
+#   global     it needs to see other rows (deduplicate, fuzzy_deduplicate,
+#              forward/backward fill, drop columns with missing values).
+# Consecutive row-local operations are fused into one stage that runs on each
+# chunk as it passes. A global operation is a stage of its own, taking the
+# upstream chunks and yielding its own; those without a streaming
+# implementation in GLOBAL_STEPS gather their input first.
+
+ROW_LOCAL = 'row-local'
+GLOBAL = 'global'
+_ROW_LOCAL_TYPES = {'fillna', 'drop_missing', 'drop_cols', 'rename_cols', 'standardize_header'}
+OUTPUT_CHUNK_ROWS = 100_000
+
+# op type -> step(chunks, params) yielding the result chunks (at least one,
+# if empty, so the columns reach the output)
+GLOBAL_STEPS = {
+    'deduplicate': dedup.deduplicate,
+    'fillna': fill.fill_step,
+    'fuzzy_deduplicate': fuzzy.fuzzy_deduplicate,
+    'drop_missing': missing.drop_missing_columns,
+}
+
+
+def classify(op):
+    params = op.get('params') or {}
+    op_type = op.get('type')
+    if op_type == 'fillna' and params.get('method'):
+        return GLOBAL
+    if op_type == 'drop_missing' and params.get('axis', 0) in (1, 'columns'):
+        return GLOBAL
+    # Unknown operations are global, so they never see a partial table
+    return ROW_LOCAL if op_type in _ROW_LOCAL_TYPES else GLOBAL
+
+
+def plan(operations):
+    """[(ROW_LOCAL, [op, ...]) | (GLOBAL, [op])] in pipeline order, row-local runs fused."""
+    stages = []
+    for op in operations:
+        kind = classify(op)
+        if kind == ROW_LOCAL and stages and stages[-1][0] == ROW_LOCAL:
+            stages[-1][1].append(op)
+        else:
+            stages.append((kind, [op]))
+    return stages
+
+
+def _row_local(chunks, ops):
+    for chunk in chunks:
+        for op in ops:
+            chunk = apply_operation(chunk, op)
+        yield chunk
+
+
+def _gathered(chunks, op):
+    df = apply_operation(pd.concat(list(chunks)), op)
+    for start in range(0, max(len(df), 1), OUTPUT_CHUNK_ROWS):
+        yield df.iloc[start:start + OUTPUT_CHUNK_ROWS]
+
+
+def _global(chunks, op):
+    step = GLOBAL_STEPS.get(op.get('type'))
+    if step is None:
+        return _gathered(chunks, op)
+    return step(chunks, op.get('params') or {})
+
+
+def run(chunks, operations, header):
+    """
+    Chunks of the cleaned table. `chunks` are the source table's, `header`
+    its columns (an empty table still runs through, to shape the output).
+    """
+    def source():
+        empty = True
+        for chunk in chunks:
+            empty = False
+            yield chunk
+        if empty:
+            yield pd.DataFrame({c: pd.Series(dtype=object) for c in header})
+
+    stream = source()
+    for kind, ops in plan(operations):
+        stream = _row_local(stream, ops) if kind == ROW_LOCAL else _global(stream, ops[0])
+    return stream
+
+
+def write_csv(chunks, out):
+    """Write the chunks as one CSV to the text stream `out`; returns the row count."""
+    rows, header = 0, True
+    for chunk in chunks:
+        chunk.to_csv(out, index=False, header=header)
+        rows += len(chunk)
+        header = False
+    return rows
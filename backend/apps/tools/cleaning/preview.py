@@ -0,0 +1,163 @@
+import hashlib
+import math
+
+import numpy as np
+import pandas as pd
+
+from apps.tools import sidecar
+from apps.tools.csv import columnar, formats
+from apps.tools.csv.frame_cache import frame_cache
+from . import planner
+from .operations import apply_operation
+
+# Dry runs of cleaning pipelines. Operations run on a uniform random sample of
+# the document's rows (a reservoir drawn in one streamed pass, then kept as an
+# Arrow sidecar and in the frame cache), so a preview costs milliseconds
+# however large the file. Each step reports what it did to the sample and
+# what that predicts for the whole table, with 95% Wilson score intervals.
+#
+# Estimates are only as good as a sample allows: duplicates are counted
+# within the sample, so rows repeated across the file are undercounted, and
+# forward/backward fills see sampled neighbours rather than the real ones;
+# such steps are flagged in the response.
+
+SAMPLE_ROWS = 10_000
+PREVIEW_ROWS = 20
+ROW_COLUMN = '__sarva_row__'
+_KEY_COLUMN = '__sarva_key__'
+Z_95 = 1.959964
+
+
+def wilson(successes, trials, z=Z_95):
+    """{'estimate', 'low', 'high'} of a proportion, with its Wilson score interval."""
+    if trials == 0:
+        return {'estimate': None, 'low': 0.0, 'high': 1.0}
+    p = successes / trials
+    denominator = 1 + z * z / trials
+    centre = (p + z * z / (2 * trials)) / denominator
+    margin = z * math.sqrt(p * (1 - p) / trials + z * z / (4 * trials * trials)) / denominator
+    return {'estimate': p, 'low': max(0.0, centre - margin), 'high': min(1.0, centre + margin)}
+
+
+def _scaled(rate, total):
+    """A rate's estimate and bounds as counts out of `total`."""
+    if rate['estimate'] is None:
+        return {'estimate': None, 'low': 0, 'high': total}
+    return {key: int(round(value * total)) for key, value in rate.items()}
+
+
+def reservoir_sample(chunks, size=SAMPLE_ROWS, seed=0):
+    """
+    (sample, total rows): `size` rows drawn uniformly from the chunks in one
+    pass (each row gets a random key, the smallest keys are kept), in file
+    order, with their positions in ROW_COLUMN.
+    """
+    rng = np.random.default_rng(seed)
+    kept, total = None, 0
+    for chunk in chunks:
+        keys = rng.random(len(chunk))
+        positions = np.arange(total, total + len(chunk))
+        total += len(chunk)
+        if kept is not None and len(kept) == size:
+            # Only rows under the current largest kept key can get in
+            wanted = keys < kept[_KEY_COLUMN].max()
+            chunk, keys, positions = chunk[wanted], keys[wanted], positions[wanted]
+        chunk = chunk.assign(**{ROW_COLUMN: positions, _KEY_COLUMN: keys})
+        kept = chunk if kept is None else pd.concat([kept, chunk], ignore_index=True)
+        if len(kept) > size:
+            kept = kept.nsmallest(size, _KEY_COLUMN)
+    if kept is None:
+        return pd.DataFrame({ROW_COLUMN: pd.Series(dtype=np.int64)}), 0
+    kept = kept.sort_values(ROW_COLUMN).drop(columns=_KEY_COLUMN).reset_index(drop=True)
+    return kept, total
+
+
+def _kind(sheet):
+    if sheet is None:
+        return 'reservoir.json'
+    return f"reservoir.{hashlib.sha1(str(sheet).encode('utf-8')).hexdigest()[:12]}.json"
+
+
+def get_sample(file_path, chunks, sheet=None):
+    """
+    The sample of a document, indexed by row position, with its total row
+    count in attrs['total_rows']. `chunks()` streams the table as text; it
+    is only called when no sample is stored. Treat the result as read-only.
+    """
+    def parse(_):
+        sample, total = reservoir_sample(chunks())
+        sidecar.save_json(file_path, _kind(sheet), total)
+        return sample
+
+    def load():
+        # The first draw stores both the sample (Arrow) and its count (JSON)
+        sample = columnar.load(file_path, parse, sheet=sheet, variant='reservoir')
+        if sidecar.load_json(file_path, _kind(sheet)) is None:
+            # A stored sample without its count; the seed makes the redraw identical
+            sample = parse(None)
+        # Text comes back from Arrow as Arrow strings; the streaming paths see Python objects
+        sample = sample.set_index(ROW_COLUMN)
+        sample = sample.astype(object).where(sample.notna(), np.nan)
+        sample.attrs['total_rows'] = sidecar.load_json(file_path, _kind(sheet))
+        return sample
+
+    return frame_cache.get_or_load(file_path, load, sheet=sheet, variant='reservoir')
+
+
+def _nulls(df):
+    return int(df.isna().to_numpy().sum())
+
+
+def preview(sample, operations):
+    """Before/after rows of the sample and the estimated impact of each operation."""
+    total = sample.attrs['total_rows']
+    df = sample
+    rows = total
+    steps = []
+    for op in operations:
+        result = apply_operation(df, op)
+        removed_rate = wilson(len(df) - len(result), len(df))
+        rows_removed = _scaled(removed_rate, rows)
+        rows -= rows_removed['estimate'] or 0
+
+        # Nulls gone from the rows and columns still there
+        common = [c for c in result.columns if c in df.columns]
+        filled = max(0, _nulls(df.loc[result.index, common]) - _nulls(result[common]))
+        fill_rate = wilson(filled, len(result) * len(result.columns))
+
+        steps.append({
+            'type': op.get('type'),
+            # Global steps depend on other rows, which a sample thins out, so
+            # their estimates are biased (a deduplication's, low)
+            'sample_biased': planner.classify(op) == planner.GLOBAL,
+            'sample_rows_in': len(df),
+            'sample_rows_removed': len(df) - len(result),
+            'rows_removed_rate': removed_rate,
+            'estimated_rows_removed': rows_removed,
+            'sample_nulls_filled': filled,
+            'nulls_filled_rate': fill_rate,
+            'estimated_nulls_filled': _scaled(fill_rate, rows * len(result.columns)),
+            'columns_removed': [str(c) for c in df.columns if c not in result.columns],
+            'columns_added': [str(c) for c in result.columns if c not in df.columns],
+        })
+        df = result
+
+    before = sample.head(PREVIEW_ROWS)
+    return {
+        'sample_rows': len(sample),
+        'total_rows': total,
+        'estimated_rows_after': _scaled(wilson(len(df), len(sample)), total),
+        'columns_before': [str(c) for c in sample.columns],
+        'columns_after': [str(c) for c in df.columns],
+        'steps': steps,
+        'before': _records(before),
+        'after': _records(df[df.index.isin(before.index)]),
+    }
+
+
+def _records(df):
+    """Preview rows as records, each with its row number in the document."""
+    records = formats.encode_page(df.rename(columns=str))
+    for record, position in zip(records, df.index):
+        record[ROW_COLUMN] = int(position)
+    return records
@@ -1,24 +1,36 @@
 import pandas as pd
 import os
 from apps.tools.base import BaseFileService
+from apps.tools.csv import columnar, overlay, schema
+from apps.tools.csv.services import CSVService
+from . import planner, preview
+from .operations import apply_operation
 
 class CleaningService(BaseFileService):
     def process(self, *args, **kwargs):
         pass
 
     def load_dataframe(self, file_path, file_type):
+        if overlay.is_overlay(file_path):
+            # Operations return new frames, so the shared cached frame is safe
+            return CSVService().get_dataframe(file_path)
         if file_type == 'csv':
-            return pd.read_csv(file_path)
+            return columnar.load(file_path, schema.read_csv)
         elif file_type in ['xlsx', 'xls']:
-            return pd.read_excel(file_path)
+            return columnar.load(file_path, pd.read_excel)
         else:
             raise ValueError(f"Unsupported file type for cleaning: {file_type}")
 
-    def save_dataframe(self, df, original_path, suffix="_clean"):
+    def output_path(self, original_path, suffix="_clean"):
+        if overlay.is_overlay(original_path):
+            original_path = original_path[:-len(overlay.OVERLAY_SUFFIX)] + '.csv'
         base, ext = os.path.splitext(original_path)
-        new_path = f"{base}{suffix}{ext}"
+        return f"{base}{suffix}{ext}"
+
+    def save_dataframe(self, df, original_path, suffix="_clean"):
+        new_path = self.output_path(original_path, suffix)
         
-        if ext.lower() == '.csv':
+        if new_path.lower().endswith('.csv'):
             df.to_csv(new_path, index=False)
         else:
             df.to_excel(new_path, index=False)
@@ -29,48 +41,38 @@ class CleaningService(BaseFileService):
         """
         operations: list of dicts { 'type': 'deduplicate'|'fillna'|'drop_cols'|'rename_cols', 'params': {} }
         """
+        if file_type == 'csv' and not CSVService().is_excel(file_path):
+            return self.clean_csv_streamed(file_path, operations)
+
         df = self.load_dataframe(file_path, file_type)
-        
         for op in operations:
-            op_type = op.get('type')
-            params = op.get('params', {})
-            
-            if op_type == 'deduplicate':
-                subset = params.get('subset', None) # List of columns to check
-                df.drop_duplicates(subset=subset, inplace=True)
-            
-            elif op_type == 'fillna':
-                value = params.get('value', '')
-                method = params.get('method', None) # 'ffill', 'bfill'
-                cols = params.get('columns', None) # Specific columns or all
-                
-                if cols:
-                    if method:
-                        df[cols] = df[cols].fillna(method=method)
-                    else:
-                        df[cols] = df[cols].fillna(value)
-                else:
-                    if method:
-                        df.fillna(method=method, inplace=True)
-                    else:
-                        df.fillna(value, inplace=True)
-
-            elif op_type == 'drop_missing':
-                 axis = params.get('axis', 0) # 0 for rows, 1 for columns
-                 how = params.get('how', 'any') # 'any' or 'all'
-                 subset = params.get('subset', None)
-                 df.dropna(axis=axis, how=how, subset=subset, inplace=True)
-
-            elif op_type == 'drop_cols':
-                cols = params.get('columns', [])
-                df.drop(columns=cols, errors='ignore', inplace=True)
-                
-            elif op_type == 'rename_cols':
-                mapping = params.get('mapping', {})
-                df.rename(columns=mapping, inplace=True)
+            df = apply_operation(df, op)
+        return self.save_dataframe(df, file_path)
 
-            elif op_type == 'standardize_header':
-                # Lowercase and replace spaces with underscores
-                df.columns = df.columns.str.lower().str.replace(' ', '_')
+    def clean_csv_streamed(self, file_path, operations):
+        """
+        Run the pipeline over the CSV's text chunks (see planner.py) and stream
+        the result to the output file, so memory stays flat for row-local steps.
+        """
+        csv_service = CSVService()
+        new_path = self.output_path(file_path)
+        chunks = planner.run(csv_service.iter_text_chunks(file_path), operations, csv_service.read_header(file_path))
+        try:
+            with open(new_path, 'w', newline='', encoding='utf-8') as out:
+                planner.write_csv(chunks, out)
+        except Exception:
+            if os.path.exists(new_path):
+                os.remove(new_path)
+            raise
+        return new_path
 
-        return self.save_dataframe(df, file_path)
+    def preview(self, file_path, file_type, operations):
+        """Dry run of the operations on a cached sample of the document (see preview.py)."""
+        if file_type == 'csv' and not CSVService().is_excel(file_path):
+            chunks = lambda: CSVService().iter_text_chunks(file_path)
+        elif file_type in ['csv', 'xlsx', 'xls']:
+            from apps.tools.xlsx.services import XLSXService
+            chunks = lambda: XLSXService().iter_text_chunks(file_path)
+        else:
+            raise ValueError(f"Unsupported file type for cleaning: {file_type}")
+        return preview.preview(preview.get_sample(file_path, chunks), operations)
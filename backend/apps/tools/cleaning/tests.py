@@ -0,0 +1,184 @@
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+from django.test import SimpleTestCase, override_settings
+
+from apps.tools.csv.frame_cache import FrameCache
+from . import planner, preview
+from .operations import apply_operation
+
+
+class MediaRootTestCase(SimpleTestCase):
+    """Runs against a throwaway MEDIA_ROOT, where spill and sidecar files go."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.media_root = tempfile.mkdtemp()
+        cls.settings_override = override_settings(MEDIA_ROOT=cls.media_root)
+        cls.settings_override.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.settings_override.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+        super().tearDownClass()
+
+
+class StreamedStepTestCase(MediaRootTestCase):
+    """Streamed global steps against apply_operation on the whole frame."""
+
+    def chunked(self, df, size):
+        return [df.iloc[start:start + size] for start in range(0, max(len(df), 1), size)]
+
+    def streamed(self, df, op, size):
+        chunks = planner.run(self.chunked(df, size), [op], list(df.columns))
+        return pd.concat(list(chunks))
+
+    def assertStreamedMatches(self, df, op, sizes=(1, 2, 3, 7, 1000)):
+        expected = apply_operation(df, op)
+        # Budgets that never spill, spill part way through, and spill from the first chunk on
+        for budget in (1 << 30, 2_000, 1):
+            with override_settings(SPILL_MEMORY_BYTES=budget):
+                for size in sizes:
+                    with self.subTest(budget=budget, size=size):
+                        pd.testing.assert_frame_equal(self.streamed(df, op, size), expected)
+
+
+class DropMissingColumnsTests(StreamedStepTestCase):
+    def test_matches_dropna(self):
+        df = pd.DataFrame({
+            'full': list('abcdefg'),
+            'some': ['a', None, 'c', 'd', None, 'f', 'g'],
+            'late': ['a', 'b', 'c', 'd', 'e', 'f', np.nan],
+            'none': [None] * 7,
+        }, dtype=object)
+        for how in ('any', 'all'):
+            self.assertStreamedMatches(df, {'type': 'drop_missing', 'params': {'axis': 1, 'how': how}})
+
+    def test_empty_table_keeps_its_columns(self):
+        df = pd.DataFrame({'a': pd.Series(dtype=object), 'b': pd.Series(dtype=object)})
+        out = self.streamed(df, {'type': 'drop_missing', 'params': {'axis': 'columns'}}, 10)
+        self.assertEqual(list(out.columns), ['a', 'b'])
+
+
+class DeduplicateTests(StreamedStepTestCase):
+    def frame(self):
+        rng = np.random.default_rng(5)
+        values = np.array(['a', 'b', None, np.nan, 'c'], dtype=object)
+        return pd.DataFrame({
+            'k': values[rng.integers(len(values), size=120)],
+            'g': rng.integers(3, size=120).astype(str).astype(object),
+            'v': values[rng.integers(len(values), size=120)],
+        }, dtype=object)
+
+    def test_matches_drop_duplicates(self):
+        for subset in (None, ['k'], ['k', 'g'], ['v']):
+            with self.subTest(subset=subset):
+                params = {'subset': subset} if subset else {}
+                self.assertStreamedMatches(self.frame(), {'type': 'deduplicate', 'params': params}, sizes=(1, 16, 1000))
+
+    def test_mixed_types(self):
+        df = pd.DataFrame({'k': [1, 1.0, '1', True, None, np.nan, 'x', 2, 2.5, '1']}, dtype=object)
+        self.assertStreamedMatches(df, {'type': 'deduplicate', 'params': {}}, sizes=(1, 3, 10))
+
+
+class FillTests(StreamedStepTestCase):
+    def frame(self):
+        # Runs of blanks at the start, the end, and across every chunk boundary
+        return pd.DataFrame({
+            'a': [None, None, 'x', None, None, None, None, 'y', None, 'z', None, None],
+            'b': [None] * 12,
+            'c': ['1', None, None, None, None, None, None, None, None, None, None, '2'],
+            'd': list('abcdefghijkl'),
+        }, dtype=object)
+
+    def test_forward_and_backward_fill(self):
+        for method in ('ffill', 'bfill', 'pad', 'backfill'):
+            for columns in (None, ['a', 'c']):
+                params = {'method': method}
+                if columns:
+                    params['columns'] = columns
+                with self.subTest(method=method, columns=columns):
+                    self.assertStreamedMatches(self.frame(), {'type': 'fillna', 'params': params})
+
+    def test_random_blanks(self):
+        rng = np.random.default_rng(3)
+        df = pd.DataFrame(rng.integers(0, 100, (300, 4)).astype(str), columns=list('abcd'), dtype=object)
+        df = df.mask(rng.random(df.shape) < 0.8)
+        for method in ('ffill', 'bfill'):
+            with self.subTest(method=method):
+                self.assertStreamedMatches(df, {'type': 'fillna', 'params': {'method': method}}, sizes=(1, 13, 64))
+
+
+class FuzzyDeduplicateTests(StreamedStepTestCase):
+    def frame(self):
+        rng = np.random.default_rng(11)
+        names = ['Acme Corporation', 'Globex Industries', 'Initech Software', 'Umbrella Holdings', 'Stark Enterprises']
+        rows = []
+        for _ in range(120):
+            name = names[rng.integers(len(names))]
+            variant = rng.integers(3)
+            if variant == 1:
+                name = '  ' + name.upper().replace(' ', '   ')
+            elif variant == 2:
+                name = name + '.'
+            rows.append([name, str(rng.integers(1000))])
+        return pd.DataFrame(rows, columns=['name', 'n'], dtype=object)
+
+    def test_clusters_are_stable_across_chunking_and_spilling(self):
+        for action in ('label', 'remove'):
+            with self.subTest(action=action):
+                op = {'type': 'fuzzy_deduplicate', 'params': {'columns': ['name'], 'threshold': 0.7, 'action': action}}
+                self.assertStreamedMatches(self.frame(), op, sizes=(1, 7, 50, 1000))
+
+    def test_variants_share_a_cluster(self):
+        df = self.frame()
+        op = {'type': 'fuzzy_deduplicate', 'params': {'columns': ['name'], 'threshold': 0.7, 'action': 'label'}}
+        labelled = apply_operation(df, op)
+        canonical = df['name'].str.casefold().str.split().str.join(' ').str.rstrip('.')
+        # One cluster per name, identified by its first row
+        for _, group in labelled.groupby(canonical):
+            self.assertEqual(set(group['cluster_id']), {group.index[0]})
+
+    def test_invalid_threshold(self):
+        for threshold in (None, [0.5], 'high', 0, 1.5):
+            with self.subTest(threshold=threshold):
+                op = {'type': 'fuzzy_deduplicate', 'params': {'threshold': threshold}}
+                with self.assertRaises(ValueError):
+                    apply_operation(self.frame(), op)
+
+
+class PreviewTests(MediaRootTestCase):
+    def test_wilson_interval(self):
+        for successes, trials, low, high in ((50, 100, 0.4038, 0.5962), (0, 10, 0.0, 0.2775),
+                                             (10, 10, 0.7225, 1.0), (1, 1000, 0.0002, 0.0056)):
+            with self.subTest(successes=successes, trials=trials):
+                rate = preview.wilson(successes, trials)
+                self.assertEqual(rate['estimate'], successes / trials)
+                self.assertAlmostEqual(rate['low'], low, places=4)
+                self.assertAlmostEqual(rate['high'], high, places=4)
+        self.assertEqual(preview.wilson(0, 0), {'estimate': None, 'low': 0.0, 'high': 1.0})
+
+    def test_sample_is_drawn_once(self):
+        path = os.path.join(self.media_root, 'big.csv')
+        pd.DataFrame({'a': np.arange(25_000).astype(str), 'b': ['x', None, 'y', 'z', None] * 5_000}).to_csv(path, index=False)
+        draws = []
+
+        def chunks():
+            draws.append(1)
+            return pd.read_csv(path, chunksize=4_000, dtype=str)
+
+        samples = []
+        for _ in range(2):
+            # A new worker, or an evicted entry: nothing in the frame cache
+            with mock.patch.object(preview, 'frame_cache', FrameCache(max_bytes=0)):
+                samples.append(preview.get_sample(path, chunks))
+        self.assertEqual(len(draws), 1)
+        pd.testing.assert_frame_equal(samples[0], samples[1])
+        self.assertEqual(samples[1].attrs['total_rows'], 25_000)
+        self.assertEqual(len(samples[1]), preview.SAMPLE_ROWS)
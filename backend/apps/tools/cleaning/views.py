@@ -3,19 +3,21 @@ from rest_framework.response import Response
 from rest_framework import status
 from django.shortcuts import get_object_or_404
 from apps.documents.models import Document
+from apps.tools.csv import overlay
 from .services import CleaningService
 from drf_spectacular.utils import extend_schema
 from rest_framework import serializers
 
 class CleaningOperationSerializer(serializers.Serializer):
     type = serializers.ChoiceField(choices=[
-        'deduplicate', 'fillna', 'drop_missing', 'drop_cols', 'rename_cols', 'standardize_header'
+        'deduplicate', 'fuzzy_deduplicate', 'fillna', 'drop_missing', 'drop_cols', 'rename_cols', 'standardize_header'
     ])
     params = serializers.DictField(required=False, default={})
 
 class CleanFileSerializer(serializers.Serializer):
     file_id = serializers.UUIDField()
     operations = serializers.ListField(child=CleaningOperationSerializer())
+    dry_run = serializers.BooleanField(default=False, help_text="Preview the operations on a sample instead of writing a new document")
 
 class CleanFileView(APIView):
     @extend_schema(request=CleanFileSerializer)
@@ -29,6 +31,9 @@ class CleanFileView(APIView):
             service = CleaningService()
             
             try:
+                if serializer.validated_data['dry_run']:
+                    return Response(service.preview(doc.file.path, doc.file_type, operations))
+
                 # Determine file type based on extension if not stored specifically (though model has file_type)
                 # doc.file_type is reliable
                 output_path = service.clean_file(doc.file.path, doc.file_type, operations)
@@ -37,6 +42,9 @@ class CleanFileView(APIView):
                 import os
                 from django.core.files import File
                 filename = os.path.basename(output_path)
+                if overlay.is_overlay(doc.file.path):
+                    # An overlay's file is its edit log; name the result after the document
+                    filename = f"{os.path.splitext(doc.filename)[0]}_clean.csv"
                 
                 new_doc = Document.objects.create(
                     filename=filename,
@@ -50,6 +58,8 @@ class CleanFileView(APIView):
                      os.remove(output_path)
                      
                 return Response({'id': new_doc.id, 'file': new_doc.file.url}, status=status.HTTP_201_CREATED)
+            except ValueError as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
             except Exception as e:
                 return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         
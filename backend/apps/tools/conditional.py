@@ -0,0 +1,47 @@
+import functools
+import hashlib
+import json
+
+from django.http import HttpResponseNotModified
+from django.shortcuts import get_object_or_404
+from django.utils.http import parse_etags
+
+from apps.documents.models import Document
+from apps.tools import sidecar
+
+# Conditional GET for read-only views of one document. The ETag is a hash of
+# (document id, file name, file size and mtime, query parameters): the same
+# request against an unchanged file always gets the same tag, and a matching
+# If-None-Match is answered with 304 before the view runs. Checking a tag is
+# a stat call; the file's content is never read for it.
+
+
+def document_etag(doc, request):
+    params = sorted((key, sorted(values)) for key, values in request.query_params.lists())
+    key = json.dumps([str(doc.pk), doc.file.name, sidecar.source_signature(doc.file.path), params])
+    return f'"{hashlib.sha256(key.encode("utf-8")).hexdigest()}"'
+
+
+def conditional_get(get):
+    """Decorate an APIView.get(request, file_id) with strong ETags and 304 answers."""
+    @functools.wraps(get)
+    def wrapper(self, request, file_id, *args, **kwargs):
+        doc = get_object_or_404(Document, pk=file_id)
+        try:
+            etag = document_etag(doc, request)
+        except (OSError, ValueError):
+            # No readable file: let the view report it
+            return get(self, request, file_id, *args, **kwargs)
+
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match and (etag in parse_etags(if_none_match) or if_none_match.strip() == '*'):
+            response = HttpResponseNotModified()
+        else:
+            response = get(self, request, file_id, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+        response['ETag'] = etag
+        # Let clients keep the body but revalidate it on every use
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+    return wrapper
@@ -0,0 +1,265 @@
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+
+from . import row_index
+from .sketches import hash_values, hll_estimates, hll_positions
+
+# Group-by aggregation as a streaming computation. Each chunk of rows is
+# reduced to a partial result per group (sums, counts, minima, maxima, and the
+# distinct (group, value) pairs for distinct counts); partials are merged
+# with the same reductions, so memory follows the number of groups rather
+# than the number of rows. Distinct counts are exact up to
+# DISTINCT_EXACT_PAIRS pairs; past that each group keeps a HyperLogLog of
+# 2**DISTINCT_SKETCH_P registers instead (about 1.6% error). Large CSVs are split at row-index checkpoints
+# and, when AGGREGATE_PROCESSES is set, the ranges are reduced in one pool of
+# that many processes per web worker, started on first use and then reused.
+
+FUNCS = ('sum', 'count', 'mean', 'min', 'max', 'distinct_count')
+NUMERIC_FUNCS = {'sum', 'mean'}
+CHUNK_ROWS = 100_000
+# Below this many rows handing ranges to other processes costs more than it saves
+PARALLEL_MIN_ROWS = 1_000_000
+DISTINCT_EXACT_PAIRS = 1_000_000
+DISTINCT_SKETCH_P = 12
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+class Aggregation:
+    """
+    A group-by over text chunks. `aggregations` is a list of
+    {'column', 'func'} (column may be omitted for 'count': rows per group);
+    `numeric` names the value columns compared and summed as numbers.
+    """
+
+    def __init__(self, group_by, aggregations, numeric=()):
+        self.group_by = list(group_by)
+        self.specs = [(a.get('column'), a['func']) for a in aggregations]
+        self.numeric = set(numeric)
+        # Counts are the same over text; every other function reads numbers
+        self.coerced = {c for c, func in self.specs if func != 'count'} & self.numeric - set(self.group_by)
+        for column, func in self.specs:
+            if func not in FUNCS:
+                raise ValueError(f"Unknown aggregation '{func}'")
+            if column is None and func != 'count':
+                raise ValueError(f"'{func}' needs a column")
+            if func in NUMERIC_FUNCS and column not in self.numeric:
+                raise ValueError(f"'{func}' needs a numeric column, '{column}' is not")
+
+    @property
+    def columns(self):
+        """Columns a chunk must hold."""
+        return list(dict.fromkeys(self.group_by + [c for c, _ in self.specs if c is not None]))
+
+    def output_names(self):
+        return [f"{column}_{func}" if column is not None else 'count' for column, func in self.specs]
+
+    def _parts(self):
+        """(partial column, source column, reduction within a chunk, reduction across partials)."""
+        parts = []
+        for k, (column, func) in enumerate(self.specs):
+            if func in ('sum', 'mean'):
+                parts.append((f"{k}.sum", column, 'sum', 'sum'))
+            if func in ('count', 'mean'):
+                parts.append((f"{k}.count", column, 'count' if column is not None else 'size', 'sum'))
+            if func in ('min', 'max'):
+                parts.append((f"{k}.{func}", column, func, func))
+        return parts
+
+    def partial(self, chunk):
+        """Reduce one chunk: (per-group frame, {spec: distinct (group, value) pairs})."""
+        chunk = chunk[self.columns].copy()
+        for column in self.coerced:
+            numbers = pd.to_numeric(chunk[column], errors='coerce')
+            # The column was judged numeric from a sample; a value past it
+            # must not silently drop out of sums, means and extremes
+            invalid = chunk[column][numbers.isna() & chunk[column].notna()]
+            if len(invalid):
+                raise ValueError(
+                    f"Column '{column}' holds non-numeric values (e.g. '{invalid.iloc[0]}') "
+                    f"past the rows its type was judged from"
+                )
+            chunk[column] = numbers
+        grouped = chunk.groupby(self.group_by, dropna=False, sort=False)
+
+        sizes = grouped.size()
+        values = {}
+        for name, column, reduce, _ in self._parts():
+            if reduce == 'size':
+                values[name] = sizes
+            elif reduce == 'sum':
+                values[name] = grouped[column].sum(min_count=1)
+            elif reduce == 'count':
+                values[name] = grouped[column].count()
+            else:
+                values[name] = _extreme(chunk, self.group_by, column, reduce)
+        frame = pd.DataFrame(values, index=sizes.index)
+
+        pairs = {}
+        for k, (column, func) in enumerate(self.specs):
+            if func == 'distinct_count':
+                pairs[k] = chunk[self.group_by + [column]].dropna(subset=[column]).drop_duplicates()
+        return frame, pairs
+
+    def merge(self, partials):
+        partials = list(partials)
+        frames = [frame for frame, _ in partials]
+        levels = list(range(len(self.group_by)))
+        combined = pd.concat(frames)
+        grouped = combined.groupby(level=levels, dropna=False, sort=False)
+        index = grouped.size().index
+        values = {}
+        for name, _, _, reduce in self._parts():
+            if reduce == 'sum':
+                values[name] = grouped[name].sum(min_count=1)
+            else:
+                values[name] = _extreme(combined[[name]], levels, name, reduce)
+        frame = pd.DataFrame(values, index=index)
+
+        pairs = {}
+        for k in partials[0][1]:
+            pairs[k] = self._merge_distinct([p[k] for _, p in partials], self.specs[k][0])
+        return frame, pairs
+
+    def _merge_distinct(self, parts, column):
+        """Distinct (group, value) pairs of several partials, or their sketch once there are too many."""
+        exact = [part for part in parts if not isinstance(part, DistinctSketch)]
+        sketches = [part for part in parts if isinstance(part, DistinctSketch)]
+        pairs = pd.concat(exact).drop_duplicates() if exact else None
+        if not sketches and len(pairs) <= DISTINCT_EXACT_PAIRS:
+            return pairs
+        if pairs is not None:
+            sketches.append(DistinctSketch.from_pairs(pairs, self.group_by, column))
+        return DistinctSketch.merge(sketches, len(self.group_by))
+
+    def finish(self, partial):
+        """The result table: group columns, then one column per aggregation."""
+        frame, pairs = partial
+        result = pd.DataFrame(index=frame.index)
+        for k, ((column, func), name) in enumerate(zip(self.specs, self.output_names())):
+            if func == 'mean':
+                result[name] = frame[f"{k}.sum"] / frame[f"{k}.count"].replace(0, np.nan)
+            elif func == 'count':
+                result[name] = frame[f"{k}.count"].fillna(0).astype(np.int64)
+            elif func == 'distinct_count':
+                if isinstance(pairs[k], DistinctSketch):
+                    counts = pairs[k].counts()
+                else:
+                    counts = pairs[k].groupby(self.group_by, dropna=False)[column].nunique()
+                result[name] = counts.reindex(frame.index).fillna(0).astype(np.int64).to_numpy()
+            else:
+                result[name] = frame[f"{k}.{func}"]
+        return result.reset_index().sort_values(self.group_by, kind='stable', na_position='last')
+
+
+class DistinctSketch:
+    """One row of HyperLogLog registers per group, indexed like the partial frames."""
+
+    def __init__(self, registers, index):
+        self.registers = registers
+        self.index = index
+
+    @classmethod
+    def from_pairs(cls, pairs, group_by, column):
+        grouped = pairs.groupby(group_by, dropna=False, sort=False)
+        buckets, rank = hll_positions(hash_values(pairs[column].astype(str)), DISTINCT_SKETCH_P)
+        registers = np.zeros((grouped.ngroups, 1 << DISTINCT_SKETCH_P), dtype=np.uint8)
+        np.maximum.at(registers, (grouped.ngroup().to_numpy(), buckets), rank)
+        return cls(registers, grouped.size().index)
+
+    @classmethod
+    def merge(cls, sketches, levels):
+        index = sketches[0].index.append([s.index for s in sketches[1:]])
+        grouped = pd.Series(0, index=index).groupby(level=list(range(levels)), dropna=False, sort=False)
+        registers = np.zeros((grouped.ngroups, 1 << DISTINCT_SKETCH_P), dtype=np.uint8)
+        np.maximum.at(registers, grouped.ngroup().to_numpy(), np.concatenate([s.registers for s in sketches]))
+        return cls(registers, grouped.size().index)
+
+    def counts(self):
+        return pd.Series(hll_estimates(self.registers), index=self.index)
+
+
+def _extreme(frame, keys, column, func):
+    """Per-group min or max of a column, skipping blanks (object columns can't skip them in place)."""
+    values = frame[frame[column].notna()]
+    if isinstance(keys[0], int):
+        grouped = values.groupby(level=keys, dropna=False, sort=False)
+    else:
+        grouped = values.groupby(keys, dropna=False, sort=False)
+    return getattr(grouped[column], func)()
+
+
+def _empty_partial(aggregation, header):
+    return aggregation.partial(pd.DataFrame({c: pd.Series(dtype=object) for c in header}))
+
+
+def _reduce_range(file_path, index, start, end, header, aggregation):
+    """Partial result of data rows [start, end) of a CSV, read chunk by chunk."""
+    partials = []
+    for lo in range(start, end, CHUNK_ROWS):
+        chunk = row_index.read_rows(file_path, index, lo, min(CHUNK_ROWS, end - lo), header,
+                                    dtype=str, usecols=aggregation.columns)
+        partials.append(aggregation.partial(chunk))
+    if not partials:
+        return _empty_partial(aggregation, header)
+    return aggregation.merge(partials)
+
+
+def process_pool():
+    """This worker's pool of AGGREGATE_PROCESSES processes, or None when that is under 2."""
+    global _pool
+    if settings.AGGREGATE_PROCESSES < 2:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=settings.AGGREGATE_PROCESSES)
+        return _pool
+
+
+def _discard_pool(pool):
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def run_parallel(file_path, aggregation, header, pool):
+    """Aggregate a plain CSV with its row ranges reduced in the processes of `pool`."""
+    index = row_index.get_row_index(file_path)
+    total = index['total_rows']
+    workers = settings.AGGREGATE_PROCESSES
+    # Ranges start on checkpoints, so each worker seeks straight to its rows
+    step = -(-total // workers)
+    step = max(-(-step // index['stride']) * index['stride'], CHUNK_ROWS)
+    ranges = [(lo, min(lo + step, total)) for lo in range(0, total, step)]
+    try:
+        futures = [
+            pool.submit(_reduce_range, file_path, index, lo, hi, header, aggregation)
+            for lo, hi in ranges
+        ]
+        partials = [f.result() for f in futures]
+    except BrokenProcessPool:
+        # A pool process died (killed, out of memory): start afresh next time
+        _discard_pool(pool)
+        raise
+    if not partials:
+        partials = [_empty_partial(aggregation, header)]
+    return aggregation.finish(aggregation.merge(partials))
+
+
+def run_chunks(chunks, aggregation, header):
+    """Aggregate a table given as an iterable of text chunks, in this process."""
+    partial = None
+    for chunk in chunks:
+        step = aggregation.partial(chunk)
+        partial = step if partial is None else aggregation.merge([partial, step])
+    if partial is None:
+        partial = _empty_partial(aggregation, header)
+    return aggregation.finish(partial)
@@ -0,0 +1,97 @@
+import hashlib
+import json
+import logging
+
+import pandas as pd
+import pyarrow as pa
+
+from apps.tools import sidecar
+
+logger = logging.getLogger(__name__)
+
+_SIGNATURE_KEY = b'sarva.signature'
+
+
+def _kind(sheet, variant):
+    parts = ['columnar']
+    if variant is not None:
+        parts.append(variant)
+    if sheet is not None:
+        parts.append(hashlib.sha1(str(sheet).encode('utf-8')).hexdigest()[:12])
+    return '.'.join(parts + ['arrow'])
+
+
+def _read(file_path, kind, columns, rows=None):
+    path = sidecar.sidecar_path(file_path, kind)
+    try:
+        source = pa.memory_map(path, 'r')
+    except (OSError, pa.ArrowException):
+        return None
+    try:
+        reader = pa.ipc.open_file(source)
+        metadata = reader.schema.metadata or {}
+        if json.loads(metadata.get(_SIGNATURE_KEY, b'null')) != sidecar.source_signature(file_path):
+            return None
+        table = reader.read_all()
+        if columns is not None:
+            table = table.select(list(columns))
+        if rows is not None:
+            table = table.take(pa.array(rows, type=pa.int64()))
+        # Arrow-backed string columns come back as such, not as Python strings
+        with pd.option_context('mode.string_storage', 'pyarrow'):
+            return table.to_pandas()
+    except (OSError, ValueError, KeyError, pa.ArrowException):
+        return None
+    finally:
+        source.close()
+
+
+def _write(file_path, kind, df):
+    if not all(isinstance(c, str) for c in df.columns):
+        # Arrow stores field names as strings; caching would rename e.g. the
+        # integer headers of a spreadsheet.
+        return
+    try:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+    except (TypeError, ValueError, pa.ArrowException) as e:
+        # Mixed-type object columns have no Arrow equivalent; parse as before.
+        logger.info("Not caching %s: %s", file_path, e)
+        return
+    metadata = dict(table.schema.metadata or {})
+    metadata[_SIGNATURE_KEY] = json.dumps(sidecar.source_signature(file_path)).encode()
+    table = table.replace_schema_metadata(metadata)
+
+    def write(tmp_path):
+        # Uncompressed IPC so later reads can memory-map the buffers directly.
+        with pa.OSFile(tmp_path, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+    sidecar.write_atomic(sidecar.sidecar_path(file_path, kind), write)
+
+
+def load(file_path, parse, columns=None, sheet=None, variant=None):
+    """Return the DataFrame of file_path (or one sheet of it) through its Arrow sidecar.
+
+    The first call runs parse(file_path) and stores the result as an Arrow IPC
+    file next to the source; later calls memory-map that file and materialise
+    only `columns`. The sidecar is rewritten once the source changes.
+    `variant` names a derived table (e.g. parsed dates) kept beside the main one.
+    """
+    kind = _kind(sheet, variant)
+    df = _read(file_path, kind, columns)
+    if df is not None:
+        return df
+
+    df = parse(file_path)
+    _write(file_path, kind, df)
+    if columns is not None:
+        df = df[list(columns)]
+    return df
+
+
+def take(file_path, rows, columns=None, sheet=None):
+    """
+    Gather the given row positions from the Arrow sidecar without
+    materialising the rest of the table. None when there is no fresh sidecar.
+    """
+    return _read(file_path, _kind(sheet, None), columns, rows=rows)
@@ -0,0 +1,101 @@
+import numpy as np
+import pandas as pd
+from pandas.tseries.api import guess_datetime_format
+
+from apps.tools import sidecar
+from . import columnar
+from .frame_cache import frame_cache
+
+PROFILE_SAMPLE_ROWS = 1000
+# Share of a column's sampled values a format must parse to count as a date column
+MIN_PARSED_SHARE = 0.9
+# Format marker for columns the parser already returned as datetime64
+NATIVE = 'native'
+
+
+def infer_date_formats(sample):
+    """
+    Detect the date columns of a sample frame.
+    Returns [column, format] pairs; format is a strftime pattern, NATIVE,
+    or None for dates that parse but don't share a single format.
+    """
+    formats = []
+    for column in sample.columns:
+        series = sample[column]
+        if pd.api.types.is_datetime64_any_dtype(series):
+            formats.append([column, NATIVE])
+            continue
+        if series.dtype != object:
+            continue
+        values = series.dropna().astype(str)
+        if values.empty:
+            continue
+
+        best_format, best_share = None, 0.0
+        for candidate in dict.fromkeys(guess_datetime_format(v) for v in values.head(5)):
+            if candidate is None:
+                continue
+            share = pd.to_datetime(values, format=candidate, errors='coerce').notna().mean()
+            if share > best_share:
+                best_format, best_share = candidate, share
+        if best_share >= MIN_PARSED_SHARE:
+            formats.append([column, best_format])
+        elif pd.to_datetime(values, format='mixed', errors='coerce').notna().mean() >= MIN_PARSED_SHARE:
+            formats.append([column, None])
+    return formats
+
+
+def get_date_profile(file_path, load_sample):
+    """[column, format] pairs of file_path's date columns, cached as a JSON sidecar."""
+    formats = sidecar.load_json(file_path, 'dates.json')
+    if formats is None:
+        formats = infer_date_formats(load_sample(PROFILE_SAMPLE_ROWS))
+        sidecar.save_json(file_path, 'dates.json', formats)
+    return formats
+
+
+def parse_dates(series, date_format):
+    if date_format == NATIVE:
+        return series
+    if date_format is None:
+        return pd.to_datetime(series, format='mixed', errors='coerce')
+    return pd.to_datetime(series, format=date_format, errors='coerce')
+
+
+def parse_unprofiled(series):
+    """
+    Dates of a column outside the profile, parsed value by value: its sample
+    may fall short of MIN_PARSED_SHARE while other rows still hold dates.
+    Numbers are not dates, whether the column was read typed or as text.
+    """
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        # Each category is parsed once; code -1 (missing) picks the NaT at the end
+        parsed = parse_unprofiled(pd.Series(series.cat.categories))
+        values = np.append(parsed.to_numpy(dtype='datetime64[ns]'), np.datetime64('NaT', 'ns'))
+        return pd.Series(values[series.cat.codes.to_numpy()], index=series.index)
+    if pd.api.types.is_numeric_dtype(series) or pd.api.types.is_bool_dtype(series):
+        return pd.Series(pd.NaT, index=series.index, dtype='datetime64[ns]')
+    text = series.astype(object)
+    text = text.where(pd.to_numeric(text, errors='coerce').isna())
+    return pd.to_datetime(text, format='mixed', errors='coerce')
+
+
+def get_parsed_dates(file_path, df, formats, columns=None):
+    """
+    datetime64 frame of the profiled date columns of df (the full table of
+    file_path), cached in memory and as an Arrow sidecar so repeated date
+    removals and filters skip the string parsing.
+    """
+    def parse(_path):
+        return pd.DataFrame({c: parse_dates(df[c], f) for c, f in formats}, index=df.index)
+
+    dates = frame_cache.get_or_load(
+        file_path,
+        lambda: columnar.load(file_path, parse, variant='dates'),
+        variant='dates',
+    )
+    if columns is not None:
+        dates = dates[list(columns)]
+    return dates
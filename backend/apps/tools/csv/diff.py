@@ -0,0 +1,201 @@
+import numpy as np
+import pandas as pd
+
+# Row-level diff of two tables, streamed. A first pass over each side keeps
+# only 64-bit digests per row (of its key columns, and of all the columns the
+# two sides share), never the rows themselves. Matching the digests tells
+# which rows were added, removed or changed; only the rows to report are then
+# read back, a batch at a time, to list the changed cells.
+#
+# With key columns, rows pair up by key (which must be unique on each side).
+# Without, the tables compare as multisets of rows: a changed row shows up as
+# one removed and one added row. Cells compare as text; blanks equal blanks.
+
+BATCH_ROWS = 50_000
+
+
+class Table:
+    """
+    One side of a diff: `chunks()` gives its rows as text chunks, and
+    `take(positions)`, if given, reads rows by sorted position directly
+    (otherwise they are picked out of a pass over the chunks).
+    """
+
+    def __init__(self, chunks, header, take=None):
+        self.chunks = chunks
+        self.header = list(header)
+        self._take = take
+
+    def take(self, positions):
+        """Rows at the sorted, unique `positions`, indexed by position."""
+        positions = np.asarray(positions, dtype=np.int64)
+        if not len(positions):
+            return pd.DataFrame(columns=self.header)
+        if self._take is not None:
+            df = self._take(positions)
+        else:
+            df = self._scan(positions)
+        df.index = positions
+        return df
+
+    def _scan(self, positions):
+        parts, start = [], 0
+        chunks = self.chunks()
+        try:
+            for chunk in chunks:
+                end = start + len(chunk)
+                lo, hi = np.searchsorted(positions, [start, end])
+                if hi > lo:
+                    parts.append(chunk.iloc[positions[lo:hi] - start])
+                start = end
+                if hi == len(positions):
+                    break
+        finally:
+            close = getattr(chunks, 'close', None)
+            if close is not None:
+                close()
+        return pd.concat(parts)
+
+
+def _digest(df):
+    return pd.util.hash_pandas_object(df, index=False).to_numpy()
+
+
+def digests(table, columns, key=None):
+    """(row digests over `columns`, key digests or None) of every row of a table."""
+    rows, keys = [], []
+    for chunk in table.chunks():
+        rows.append(_digest(chunk[columns]))
+        if key:
+            keys.append(_digest(chunk[key]))
+    rows = np.concatenate(rows) if rows else np.empty(0, dtype=np.uint64)
+    keys = (np.concatenate(keys) if keys else np.empty(0, dtype=np.uint64)) if key else None
+    return rows, keys
+
+
+def match(old, new, key=None):
+    """
+    Pair the rows of two sides from their digests, each a (rows, keys) pair.
+    Returns (removed old positions, added new positions, changed (old, new)
+    position pairs, number of unchanged rows).
+    """
+    old_rows, old_keys = old
+    new_rows, new_keys = new
+    left = pd.DataFrame({'row': old_rows, 'old_row': np.arange(len(old_rows))})
+    right = pd.DataFrame({'row': new_rows, 'new_row': np.arange(len(new_rows))})
+    if key:
+        for name, side, keys in (('old', left, old_keys), ('new', right, new_keys)):
+            side['key'] = keys
+            duplicates = int(side['key'].duplicated().sum())
+            if duplicates:
+                raise ValueError(f"Key ({', '.join(key)}) is not unique in the {name} table: {duplicates} repeated value(s)")
+        on = ['key']
+    else:
+        # The n-th copy of a row on one side pairs with the n-th copy on the other
+        left['copy'] = left.groupby('row').cumcount()
+        right['copy'] = right.groupby('row').cumcount()
+        on = ['row', 'copy']
+
+    merged = left.merge(right, on=on, how='outer', indicator=True, suffixes=('_old', '_new'))
+    removed = np.sort(merged.loc[merged['_merge'] == 'left_only', 'old_row'].to_numpy(np.int64))
+    added = np.sort(merged.loc[merged['_merge'] == 'right_only', 'new_row'].to_numpy(np.int64))
+    both = merged[merged['_merge'] == 'both']
+    if key:
+        changed = both[both['row_old'] != both['row_new']].sort_values('old_row')
+        pairs = changed[['old_row', 'new_row']].to_numpy(np.int64)
+    else:
+        pairs = np.empty((0, 2), dtype=np.int64)
+    return removed, added, pairs, len(both) - len(pairs)
+
+
+class DiffWriter:
+    """The diff as CSV: one line per changed cell, and one per added or removed row."""
+
+    def __init__(self, out, key):
+        self.out = out
+        self.key = list(key or [])
+        self.columns = ['change', 'old_row', 'new_row'] + self.key + ['column', 'old_value', 'new_value']
+        self.header = True
+
+    def write(self, df):
+        df = df.reindex(columns=self.columns)
+        for name in ('old_row', 'new_row'):
+            df[name] = df[name].astype('Int64')
+        df.to_csv(self.out, index=False, header=self.header)
+        self.header = False
+
+    def rows(self, change, positions, side, rows=None):
+        """Added or removed rows, with their key values when there is a key."""
+        df = pd.DataFrame({'change': change, f"{side}_row": positions})
+        if self.key:
+            for name in self.key:
+                df[name] = rows[name].to_numpy()
+        self.write(df)
+
+    def cells(self, old, new, columns):
+        """Changed cells of row pairs (old and new rows aligned by position); returns their count."""
+        parts = []
+        pair = np.arange(len(old))
+        for ordinal, column in enumerate(columns):
+            a, b = old[column].to_numpy(object), new[column].to_numpy(object)
+            differs = ~(pd.isna(a) & pd.isna(b)) & (a != b)
+            if not differs.any():
+                continue
+            part = pd.DataFrame({
+                'pair': pair[differs],
+                'ordinal': ordinal,
+                'change': 'changed',
+                'old_row': old.index.to_numpy()[differs],
+                'new_row': new.index.to_numpy()[differs],
+                'column': column,
+                'old_value': a[differs],
+                'new_value': b[differs],
+            })
+            for name in self.key:
+                part[name] = old[name].to_numpy(object)[differs]
+            parts.append(part)
+        if not parts:
+            return 0
+        df = pd.concat(parts, ignore_index=True).sort_values(['pair', 'ordinal'], kind='stable')
+        self.write(df)
+        return len(df)
+
+    def finish(self):
+        if self.header:
+            self.write(pd.DataFrame(columns=self.columns))
+
+
+def run(old, new, out, key=None):
+    """Write the diff of Tables `old` and `new` to the text stream `out`; returns summary counts."""
+    key = list(key or [])
+    missing = [c for c in key if c not in old.header or c not in new.header]
+    if missing:
+        raise ValueError(f"Key column(s) missing from a table: {', '.join(missing)}")
+    columns = [c for c in old.header if c in new.header]
+
+    removed, added, pairs, unchanged = match(
+        digests(old, columns, key), digests(new, columns, key), key,
+    )
+
+    writer = DiffWriter(out, key)
+    changed_cells = 0
+    for start in range(0, len(pairs), BATCH_ROWS):
+        batch = pairs[start:start + BATCH_ROWS]
+        old_rows = old.take(batch[:, 0])
+        new_rows = new.take(np.sort(batch[:, 1])).loc[batch[:, 1]]
+        changed_cells += writer.cells(old_rows, new_rows, columns)
+    for change, positions, table, side in (('removed', removed, old, 'old'), ('added', added, new, 'new')):
+        for start in range(0, len(positions), BATCH_ROWS):
+            batch = positions[start:start + BATCH_ROWS]
+            writer.rows(change, batch, side, table.take(batch) if key else None)
+    writer.finish()
+
+    return {
+        'added': len(added),
+        'removed': len(removed),
+        'changed': len(pairs),
+        'unchanged': unchanged,
+        'changed_cells': changed_cells,
+        'added_columns': [c for c in new.header if c not in old.header],
+        'removed_columns': [c for c in old.header if c not in new.header],
+    }
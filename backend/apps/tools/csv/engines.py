@@ -0,0 +1,182 @@
+import codecs
+import csv
+import logging
+import os
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+from django.conf import settings
+from pandas._libs.parsers import STR_NA_VALUES
+
+from apps.tools import sidecar
+
+logger = logging.getLogger(__name__)
+
+# Parser engines for full-table CSV loads:
+#   pandas   pandas' C parser, one thread
+#   pyarrow  Arrow's multithreaded CSV reader, converted to the same frame
+#   chunked  the C parser over fixed-size chunks, for files too big to parse in one go
+# 'auto' picks by file size and core count; settings.CSV_PARSER_ENGINE or a
+# per-document override (engine.json sidecar) forces one. Every engine reads
+# the document's sniffed dialect (delimiter, quote character, encoding).
+
+ENGINES = ('pandas', 'pyarrow', 'chunked')
+AUTO = 'auto'
+# Below this size thread start-up outweighs what the Arrow reader saves
+PYARROW_MIN_BYTES = 8 * 1024 * 1024
+# Single-core hosts parse files above this size chunk by chunk
+CHUNKED_MIN_BYTES = 512 * 1024 * 1024
+CHUNK_ROWS = 100_000
+SNIFF_BYTES = 64 * 1024
+SNIFF_DELIMITERS = ',;\t|'
+# Encodings tried in order; all keep ASCII bytes as they are, which the raw
+# byte scans of row_index rely on.
+ENCODINGS = ('utf-8', 'cp1252', 'latin-1')
+
+
+def sniff(file_path):
+    """{'sep', 'quotechar', 'encoding'} of a CSV, guessed from its first bytes."""
+    with open(file_path, 'rb') as f:
+        raw = f.read(SNIFF_BYTES)
+
+    if raw.startswith(codecs.BOM_UTF8):
+        encoding = 'utf-8-sig'
+    else:
+        for encoding in ENCODINGS:
+            try:
+                # Incremental decoding tolerates a character cut at the end of the sample
+                codecs.getincrementaldecoder(encoding)().decode(raw, final=False)
+                break
+            except UnicodeDecodeError:
+                continue
+    text = raw.decode(encoding, errors='replace')
+    if len(raw) == SNIFF_BYTES and '\n' in text:
+        text = text[:text.rindex('\n')]
+
+    sep, quotechar = ',', '"'
+    try:
+        dialect = csv.Sniffer().sniff(text, delimiters=SNIFF_DELIMITERS)
+        header = text.split('\n', 1)[0]
+        # The sniffer happily picks a delimiter a single-column file never uses
+        if dialect.delimiter in header:
+            sep, quotechar = dialect.delimiter, dialect.quotechar or '"'
+    except csv.Error:
+        pass
+    return {'sep': sep, 'quotechar': quotechar, 'encoding': encoding}
+
+
+def dialect(file_path):
+    """pd.read_csv keyword arguments for file_path's dialect, sniffed once per document."""
+    options = sidecar.load_json(file_path, 'dialect.json')
+    if options is None:
+        options = sniff(file_path)
+        sidecar.save_json(file_path, 'dialect.json', options)
+    return options
+
+
+def get_override(file_path):
+    return sidecar.load_json(file_path, 'engine.json')
+
+
+def set_override(file_path, engine):
+    """Force an engine for one document; AUTO removes the override."""
+    if engine != AUTO and engine not in ENGINES:
+        raise ValueError(f"Unknown parser engine '{engine}', expected one of: {', '.join(ENGINES + (AUTO,))}")
+    sidecar.save_json(file_path, 'engine.json', None if engine == AUTO else engine)
+
+
+def choose_engine(file_path):
+    engine = get_override(file_path) or getattr(settings, 'CSV_PARSER_ENGINE', AUTO)
+    if engine in ENGINES:
+        return engine
+    size = os.path.getsize(file_path)
+    if size >= PYARROW_MIN_BYTES and (os.cpu_count() or 1) > 1:
+        return 'pyarrow'
+    if size >= CHUNKED_MIN_BYTES:
+        return 'chunked'
+    return 'pandas'
+
+
+def read_csv(file_path, dtype=None, engine=None):
+    """Parse the whole of file_path with the chosen (or given) engine."""
+    engine = engine or choose_engine(file_path)
+    options = dialect(file_path)
+    dtype = dtype or {}
+    if engine == 'pyarrow':
+        try:
+            return _read_pyarrow(file_path, dtype, options)
+        except (pa.ArrowException, ValueError, TypeError) as e:
+            # Types the Arrow reader settles on from its first block can't
+            # absorb every file; pandas' parser can.
+            logger.info("Arrow CSV reader failed on %s, using pandas: %s", file_path, e)
+    if engine == 'chunked':
+        return _read_chunked(file_path, dtype, options)
+    return pd.read_csv(file_path, dtype=dtype, **options)
+
+
+def _read_chunked(file_path, dtype, options):
+    chunks = list(pd.read_csv(file_path, dtype=dtype, chunksize=CHUNK_ROWS, **options))
+    if not chunks:
+        return pd.read_csv(file_path, dtype=dtype, **options)
+    for column, column_dtype in dtype.items():
+        if column_dtype == 'category' and column in chunks[0].columns:
+            # Each chunk has its own categories; give them all the union
+            union = pd.api.types.union_categoricals([c[column] for c in chunks], sort_categories=True)
+            for chunk in chunks:
+                chunk[column] = chunk[column].cat.set_categories(union.categories)
+    return pd.concat(chunks, ignore_index=True)
+
+
+# Arrow types requested for the schema's dtypes, converted to them after the read
+_ARROW_TYPES = {
+    'category': pa.string(),
+    'string[pyarrow]': pa.string(),
+    'boolean': pa.bool_(),
+    'Int64': pa.int64(),
+}
+
+
+def _read_pyarrow(file_path, dtype, options):
+    header = list(pd.read_csv(file_path, nrows=0, **options).columns)
+    column_types = {c: _ARROW_TYPES[d] for c, d in dtype.items() if d in _ARROW_TYPES}
+    read_options = pa_csv.ReadOptions(use_threads=True, encoding=options['encoding'].replace('-sig', ''))
+
+    def convert_options(column_types):
+        return pa_csv.ConvertOptions(
+            column_types=column_types,
+            # The NA spellings pandas recognises
+            null_values=sorted(STR_NA_VALUES),
+            strings_can_be_null=True,
+        )
+
+    def read(newlines_in_values):
+        parse_options = pa_csv.ParseOptions(
+            delimiter=options['sep'], quote_char=options['quotechar'], newlines_in_values=newlines_in_values,
+        )
+        # Arrow infers types from the first block alone. Columns it would
+        # take as dates or times stay text, as in pandas (which parses no
+        # dates unless asked); finding them costs one block, not a full parse.
+        with pa_csv.open_csv(file_path, read_options=read_options, parse_options=parse_options,
+                             convert_options=convert_options(column_types)) as reader:
+            temporal = {f.name: pa.string() for f in reader.schema if pa.types.is_temporal(f.type)}
+        return pa_csv.read_csv(file_path, read_options=read_options, parse_options=parse_options,
+                               convert_options=convert_options({**column_types, **temporal}))
+
+    try:
+        table = read(False)
+    except pa.ArrowInvalid:
+        # Quoted line breaks need the slower, serial chunker
+        table = read(True)
+
+    if table.column_names != header:
+        raise ValueError("Header differs from pandas' (duplicate or blank names)")
+
+    df = table.to_pandas()
+    for column in df.columns:
+        if table.schema.field(column).type == pa.null():
+            # All blank: pandas reads NaN floats
+            df[column] = df[column].astype('float64')
+        elif column in dtype:
+            df[column] = df[column].astype(dtype[column])
+    return df
@@ -0,0 +1,54 @@
+import numpy as np
+import pyarrow as pa
+
+# Encodings of a page of rows for the grid endpoints:
+#   records   [{column: value, ...}, ...]  (default, one object per row)
+#   columnar  [[values of column 0], [values of column 1], ...] aligned with 'columns'
+#   arrow     an Arrow IPC stream of the page (binary response body)
+# The last two are built column by column from the DataFrame slice, without
+# an intermediate dict per row.
+
+RESPONSE_FORMATS = ('records', 'columnar', 'arrow')
+ARROW_STREAM_TYPE = 'application/vnd.apache.arrow.stream'
+
+
+def _values(series):
+    if isinstance(series.dtype, np.dtype) and (series.dtype.kind in 'iub' or (series.dtype.kind == 'f' and not series.hasnans)):
+        return series.tolist()
+    return series.astype(object).where(series.notna(), None).tolist()
+
+
+def to_arrow(df):
+    """The rows of df as Arrow IPC stream bytes."""
+    try:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+    except (TypeError, ValueError, pa.ArrowException):
+        # Object columns mixing types have no Arrow type; send them as text
+        df = df.copy()
+        for column in df.columns[df.dtypes == object]:
+            df[column] = df[column].astype(str).where(df[column].notna(), None)
+        table = pa.Table.from_pandas(df, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def encode_page(df, response_format='records'):
+    if response_format not in RESPONSE_FORMATS:
+        raise ValueError(f"Unknown response format '{response_format}', expected one of: {', '.join(RESPONSE_FORMATS)}")
+    if response_format == 'arrow':
+        return to_arrow(df)
+    if response_format == 'columnar':
+        return [_values(df.iloc[:, k]) for k in range(df.shape[1])]
+    # Covers NaN as well as the pd.NA/NaT of nullable and datetime columns
+    return df.astype(object).where(df.notna(), None).to_dict(orient='records')
+
+
+def arrow_response_headers(result):
+    """Paging metadata of an Arrow page, which has no JSON envelope to carry it."""
+    return {
+        'X-Total-Rows': str(result['total_rows']),
+        'X-Page': str(result['page']),
+        'X-Page-Size': str(result['page_size']),
+    }
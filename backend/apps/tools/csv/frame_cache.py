@@ -0,0 +1,89 @@
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+from apps.tools import sidecar
+
+
+class FrameCache:
+    """Process-wide LRU of parsed DataFrames, bounded by their real memory size.
+
+    Entries are keyed by (file path, source signature, sheet, variant). The path
+    already contains the document id, and the signature changes whenever the
+    file is rewritten, so a stale frame is never served. Cached frames are
+    shared between requests and must be treated as read-only.
+    """
+
+    def __init__(self, max_bytes=None):
+        self._max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (df, nbytes)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def max_bytes(self):
+        if self._max_bytes is not None:
+            return self._max_bytes
+        return settings.DATAFRAME_CACHE_BYTES
+
+    def key(self, file_path, sheet=None, variant=None):
+        return (str(file_path), tuple(sidecar.source_signature(file_path)), sheet, variant)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, df):
+        nbytes = int(df.memory_usage(deep=True).sum())
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[1]
+            self._entries[key] = (df, nbytes)
+            self._bytes += nbytes
+            while self._bytes > self.max_bytes:
+                _, (_, evicted_bytes) = self._entries.popitem(last=False)
+                self._bytes -= evicted_bytes
+                self.evictions += 1
+
+    def get_columns(self, file_path, columns, sheet=None, variant=None):
+        """
+        `columns` cut from the cached frame of file_path, or None when it isn't
+        cached. A projection served this way counts as a hit.
+        """
+        df = self.get(self.key(file_path, sheet, variant))
+        return df[list(columns)] if df is not None else None
+
+    def get_or_load(self, file_path, load, sheet=None, variant=None):
+        key = self.key(file_path, sheet, variant)
+        df = self.get(key)
+        if df is None:
+            df = load()
+            self.put(key, df)
+        return df
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+frame_cache = FrameCache()
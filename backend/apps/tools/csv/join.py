@@ -0,0 +1,105 @@
+import pandas as pd
+
+from . import spill
+
+# Hash join of two tables given as streams of text chunks. The right table is
+# the build side: it is held in memory as long as it fits the spill budget and
+# the left table is streamed past it chunk by chunk, keeping the left order.
+# Past the budget both sides are hash-partitioned on their keys into scratch
+# files and joined one partition pair at a time (Grace hash join); the output
+# then comes partition by partition.
+#
+# Keys compare as text. A blank key matches nothing, as in SQL.
+
+HOWS = ('inner', 'left', 'anti')
+RIGHT_SUFFIX = '_right'
+
+
+class HashJoin:
+    def __init__(self, left_on, right_on, how='inner'):
+        self.left_on = list(left_on)
+        self.right_on = list(right_on)
+        self.how = how
+        if how not in HOWS:
+            raise ValueError(f"Unknown join type '{how}', expected one of: {', '.join(HOWS)}")
+        if not self.left_on or len(self.left_on) != len(self.right_on):
+            raise ValueError("left_on and right_on must name the same number of key columns")
+
+    def _build_rows(self, chunk):
+        return chunk.dropna(subset=self.right_on)
+
+    def probe(self, left, build):
+        """Join one chunk of the left table against (part of) the build side."""
+        if self.how == 'anti':
+            keys = pd.MultiIndex.from_frame(build[self.right_on])
+            return left[~pd.MultiIndex.from_frame(left[self.left_on]).isin(keys)]
+        return left.merge(
+            build, how=self.how, left_on=self.left_on, right_on=self.right_on,
+            suffixes=('', RIGHT_SUFFIX), sort=False,
+        )
+
+    def run(self, left_chunks, right_chunks, left_header, right_header, right_rows, out):
+        """
+        Write the join to the text stream `out` as CSV. `right_rows` (the row
+        count of the right table) sizes the partitions if it has to spill.
+        Returns the number of rows written.
+        """
+        writer = _Writer(out)
+        budget = spill.memory_budget()
+        build, used, seen = [], 0, 0
+        right_chunks = iter(right_chunks)
+        for chunk in right_chunks:
+            chunk = self._build_rows(chunk)
+            build.append(chunk)
+            used += spill.frame_bytes(chunk)
+            seen += len(chunk)
+            if used > budget:
+                break
+        else:
+            build = pd.concat(build, ignore_index=True) if build else _empty(right_header)
+            for chunk in left_chunks:
+                writer.write(self.probe(chunk, build))
+            return writer.finish(self.probe(_empty(left_header), _empty(right_header)))
+
+        count = spill.partition_count(used / max(seen, 1) * right_rows, budget)
+        with spill.scratch_dir('join') as directory:
+            right = spill.Partitions(directory, 'right', count)
+            for chunk in build:
+                right.write(chunk, self.right_on)
+            build = None
+            for chunk in right_chunks:
+                right.write(self._build_rows(chunk), self.right_on)
+
+            left = spill.Partitions(directory, 'left', count)
+            for chunk in left_chunks:
+                left.write(chunk, self.left_on)
+
+            for k in range(count):
+                if not left.rows[k]:
+                    continue
+                part = right.read(k, right_header)
+                for chunk in left.iter(k):
+                    writer.write(self.probe(chunk, part))
+        return writer.finish(self.probe(_empty(left_header), _empty(right_header)))
+
+
+def _empty(header):
+    return pd.DataFrame({c: pd.Series(dtype=object) for c in header})
+
+
+class _Writer:
+    """CSV output written a frame at a time, with the header once."""
+
+    def __init__(self, out):
+        self.out = out
+        self.rows = 0
+
+    def write(self, df):
+        if len(df):
+            df.to_csv(self.out, index=False, header=self.rows == 0)
+            self.rows += len(df)
+
+    def finish(self, empty):
+        if not self.rows:
+            empty.to_csv(self.out, index=False)
+        return self.rows
@@ -0,0 +1,254 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+from django.core.files.storage import default_storage
+
+from apps.tools import sidecar
+from . import dates, engines, row_index
+from .query import compile_query
+
+# An overlay document stores no table of its own. Its file is a small JSON
+# manifest naming a base CSV plus an ordered list of edits:
+#   {"type": "filter", "query": {...}}                keep rows matching a query
+#   {"type": "drop_rows", "rows": [3, 17]}            row positions in the view at that step
+#   {"type": "remove_dates", "column": null, "start": "2024-01-01", "end": "2024-01-31"}
+#   {"type": "drop_columns", "columns": ["notes"]}
+# Pages are produced by reading only the surviving base rows they need; the
+# full table is written out only on export/materialize.
+
+OVERLAY_SUFFIX = '.overlay.json'
+MANIFEST_NAME = f"edits{OVERLAY_SUFFIX}"
+# Rows per block of the survivor bitmap's rank directory
+SELECT_BLOCK_ROWS = 8192
+CHUNK_ROWS = 100_000
+
+
+def is_overlay(file_path):
+    return str(file_path).endswith(OVERLAY_SUFFIX)
+
+
+def load_manifest(file_path):
+    with open(file_path) as f:
+        manifest = json.load(f)
+    base_path = default_storage.path(manifest['base'])
+    if not os.path.exists(base_path):
+        raise FileNotFoundError("The base document of this edit no longer exists")
+    manifest['base_path'] = base_path
+    return manifest
+
+
+def base_name(file_path):
+    """Storage name of the base document an overlay reads, or None when unreadable."""
+    try:
+        with open(file_path) as f:
+            return json.load(f)['base']
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def extend_manifest(file_path, storage_name, operations):
+    """Manifest for `operations` applied on top of a CSV or overlay document."""
+    if is_overlay(file_path):
+        with open(file_path) as f:
+            manifest = json.load(f)
+        return {'base': manifest['base'], 'operations': manifest['operations'] + list(operations)}
+    return {'base': storage_name, 'operations': list(operations)}
+
+
+def visible_columns(manifest):
+    columns = row_index.read_header(manifest['base_path'])
+    for op in manifest['operations']:
+        if op['type'] == 'drop_columns':
+            columns = [c for c in columns if c not in op['columns']]
+    return columns
+
+
+def apply_operations(frames, manifest, service):
+    """
+    Apply the manifest's edits to consecutive frames of the base table.
+    Yields (frame, base row positions of its rows). Works the same on one
+    whole DataFrame and on a chunked reader.
+    """
+    operations = manifest['operations']
+    compiled = {}
+    profile = None
+    for k, op in enumerate(operations):
+        if op['type'] == 'filter':
+            compiled[k] = compile_query(op['query'])
+        elif op['type'] == 'remove_dates' and profile is None:
+            profile = dict((c, f) for c, f in service.date_profile(manifest['base_path']))
+
+    seen = [0] * len(operations)  # rows that have entered each step so far
+    base_position = 0
+    for frame in frames:
+        positions = np.arange(base_position, base_position + len(frame))
+        base_position += len(frame)
+
+        for k, op in enumerate(operations):
+            if op['type'] == 'drop_columns':
+                # Later steps must not see dropped columns (a date removal
+                # without a column looks at every date column left)
+                frame = frame.drop(columns=[c for c in op['columns'] if c in frame.columns])
+                continue
+            if op['type'] == 'filter':
+                keep = compiled[k].mask(frame).to_numpy()
+            elif op['type'] == 'drop_rows':
+                step_positions = np.arange(seen[k], seen[k] + len(frame))
+                keep = ~np.isin(step_positions, op['rows'])
+            else:
+                keep = ~_date_mask(frame, op, profile)
+            seen[k] += len(frame)
+            frame = frame[keep]
+            positions = positions[keep]
+
+        yield frame, positions
+
+
+def _date_mask(frame, op, profile):
+    start_dt, end_dt = pd.to_datetime(op['start']), pd.to_datetime(op['end'])
+    column = op.get('column')
+    if column and column in frame.columns:
+        targets = {column: profile.get(column, None)}
+    else:
+        # Every column left, as CSVService.date_mask searches them
+        targets = {c: profile.get(c) for c in frame.columns}
+
+    mask = np.zeros(len(frame), dtype=bool)
+    for c, date_format in targets.items():
+        if c in profile:
+            parsed = dates.parse_dates(frame[c], date_format)
+        elif column:
+            parsed = pd.to_datetime(frame[c], errors='coerce')
+        else:
+            parsed = dates.parse_unprofiled(frame[c])
+        mask |= ((parsed >= start_dt) & (parsed <= end_dt)).to_numpy()
+    return mask
+
+
+def iter_chunks(file_path, service, chunksize=CHUNK_ROWS):
+    """Text chunks of the edited table, for streaming exports and filters."""
+    manifest = load_manifest(file_path)
+    base_path = manifest['base_path']
+    reader = pd.read_csv(base_path, chunksize=chunksize, dtype=str, **engines.dialect(base_path))
+    for frame, _ in apply_operations(reader, manifest, service):
+        yield frame
+
+
+def build_dataframe(file_path, service):
+    """
+    The edited table as one DataFrame. Which rows survive is decided on the
+    raw text, as for pages, counts and exports (filters on the typed frame
+    would match '007' or '1.0' differently); their typed values are then
+    gathered from the (cached) base frame.
+    """
+    manifest = load_manifest(file_path)
+    survivors = get_survivors(file_path, manifest, service)
+    positions = survivors.select(0, survivors.total)
+    base = service.get_dataframe(manifest['base_path'])
+    return base.iloc[positions][visible_columns(manifest)].reset_index(drop=True)
+
+
+class Survivors:
+    """
+    Bitmap of the base rows that survive the edits, plus the running count
+    of survivors per SELECT_BLOCK_ROWS block, so the k-th survivor is found
+    without unpacking the whole bitmap.
+    """
+
+    def __init__(self, bits, nrows, block_counts):
+        self.bits = bits
+        self.nrows = nrows
+        self.block_counts = block_counts  # survivors before each block
+
+    @classmethod
+    def from_mask(cls, mask):
+        starts = np.arange(0, len(mask), SELECT_BLOCK_ROWS)
+        blocks = np.add.reduceat(mask.astype(np.int64), starts) if len(mask) else np.empty(0, dtype=np.int64)
+        block_counts = np.concatenate([[0], np.cumsum(blocks, dtype=np.int64)])
+        return cls(np.packbits(mask), len(mask), block_counts)
+
+    @property
+    def total(self):
+        return int(self.block_counts[-1])
+
+    def select(self, start, count):
+        """Base positions of surviving rows [start, start + count)."""
+        end = min(start + count, self.total)
+        if start >= end:
+            return np.empty(0, dtype=np.int64)
+        first = int(np.searchsorted(self.block_counts, start, side='right')) - 1
+        last = int(np.searchsorted(self.block_counts, end - 1, side='right')) - 1
+        row_lo = first * SELECT_BLOCK_ROWS
+        row_hi = min((last + 1) * SELECT_BLOCK_ROWS, self.nrows)
+        # Blocks are multiples of 8 rows, so they start on a byte boundary
+        mask = np.unpackbits(self.bits[row_lo // 8:(row_hi + 7) // 8], count=row_hi - row_lo).astype(bool)
+        positions = np.flatnonzero(mask) + row_lo
+        skip = start - int(self.block_counts[first])
+        return positions[skip:skip + (end - start)]
+
+
+def _compute_survivors(manifest, service):
+    base_path = manifest['base_path']
+    total = row_index.get_row_index(base_path)['total_rows']
+    row_ops = [op for op in manifest['operations'] if op['type'] != 'drop_columns']
+
+    if all(op['type'] == 'drop_rows' for op in row_ops):
+        # Tombstones only: no need to parse the base at all
+        alive = np.arange(total)
+        for op in row_ops:
+            rows = np.asarray([r for r in op['rows'] if 0 <= r < len(alive)], dtype=np.int64)
+            alive = np.delete(alive, rows)
+        mask = np.zeros(total, dtype=bool)
+        mask[alive] = True
+        return Survivors.from_mask(mask)
+
+    mask = np.zeros(total, dtype=bool)
+    reader = pd.read_csv(base_path, chunksize=CHUNK_ROWS, dtype=str, **engines.dialect(base_path))
+    for _, positions in apply_operations(reader, manifest, service):
+        mask[positions] = True
+    return Survivors.from_mask(mask)
+
+
+def get_survivors(file_path, manifest, service):
+    path = sidecar.sidecar_path(file_path, 'survivors.npz')
+    signature = sidecar.source_signature(file_path)
+    try:
+        with np.load(path) as stored:
+            if list(stored['signature']) == signature:
+                return Survivors(stored['bits'], int(stored['nrows']), stored['block_counts'])
+    except (OSError, KeyError, ValueError):
+        pass
+
+    survivors = _compute_survivors(manifest, service)
+
+    def write(tmp_path):
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, signature=np.array(signature, dtype=np.int64), bits=survivors.bits,
+                     nrows=survivors.nrows, block_counts=survivors.block_counts)
+
+    sidecar.write_atomic(path, write)
+    return survivors
+
+
+def read_page(file_path, service, start, count, columns=None):
+    """(columns, page DataFrame, total rows) of the edited table, optionally restricted to `columns`."""
+    manifest = load_manifest(file_path)
+    base_path = manifest['base_path']
+    survivors = get_survivors(file_path, manifest, service)
+    positions = survivors.select(start, count)
+
+    base_columns = row_index.read_header(base_path)
+    columns = list(columns) if columns is not None else visible_columns(manifest)
+    if not len(positions):
+        return columns, pd.DataFrame(columns=columns), survivors.total
+
+    index = row_index.get_row_index(base_path)
+    page = row_index.read_positions(base_path, index, positions, base_columns, usecols=columns)[columns]
+    return columns, page, survivors.total
+
+
+def row_count(file_path, service):
+    manifest = load_manifest(file_path)
+    return get_survivors(file_path, manifest, service).total
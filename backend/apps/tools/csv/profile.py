@@ -0,0 +1,153 @@
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+from apps.tools import sidecar
+from . import dates
+from .sketches import FrequentItems, HyperLogLog, QuantileSketch, hash_values
+
+# Column statistics from one pass over text chunks. Each column keeps a fixed
+# set of sketches, so memory is one chunk plus a few hundred KB per column
+# whatever the file size.
+
+QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+TOP_K = 10
+_INTEGER = r'[+-]?\d+'
+_BOOLEANS = {'true', 'false'}
+
+
+class ColumnProfile:
+    def __init__(self, name, date_format=None, is_date=False):
+        self.name = name
+        # Chunks are text, so natively parsed dates are read back as strings
+        self.date_format = None if date_format == dates.NATIVE else date_format
+        self.is_date = is_date
+        self.nulls = 0
+        self.values = 0
+        self.numbers = 0
+        self.integers = 0
+        self.booleans = 0
+        self.number_range = [None, None]
+        self.text_range = [None, None]
+        self.date_range = [None, None]
+        self.distinct = HyperLogLog()
+        self.frequent = FrequentItems()
+        self.quantiles = QuantileSketch()
+
+    def update(self, series):
+        present = series.dropna()
+        self.nulls += len(series) - len(present)
+        if present.empty:
+            return
+        present = present.astype(str)
+        self.values += len(present)
+        self.distinct.update(hash_values(present))
+        self.frequent.update(present)
+        _widen(self.text_range, present.min(), present.max())
+
+        if self.is_date:
+            parsed_dates = dates.parse_dates(present, self.date_format).dropna()
+            if not parsed_dates.empty:
+                _widen(self.date_range, parsed_dates.min(), parsed_dates.max())
+                self.quantiles.update(parsed_dates.to_numpy(dtype='datetime64[ns]').astype(np.int64))
+            return
+
+        # A column stops being checked for a type once a value rules it out
+        if self.booleans == self.values - len(present):
+            self.booleans += int(present.str.lower().isin(_BOOLEANS).sum())
+        if self.numbers == self.values - len(present):
+            numbers = pd.to_numeric(present, errors='coerce').to_numpy(dtype=np.float64)
+            parsed = np.isfinite(numbers)
+            self.numbers += int(parsed.sum())
+            if self.integers == self.values - len(present):
+                self.integers += int(present.str.fullmatch(_INTEGER).sum())
+            if parsed.any():
+                _widen(self.number_range, float(numbers[parsed].min()), float(numbers[parsed].max()))
+                self.quantiles.update(numbers[parsed])
+
+    @property
+    def dtype(self):
+        if not self.values:
+            return 'empty'
+        if self.is_date:
+            return 'datetime'
+        if self.numbers == self.values:
+            return 'integer' if self.integers == self.values else 'float'
+        if self.booleans == self.values:
+            return 'boolean'
+        return 'string'
+
+    def result(self):
+        dtype = self.dtype
+        low, high, quantiles = None, None, None
+        if dtype == 'datetime':
+            low, high = (_iso(v) for v in self.date_range)
+            quantiles = [_iso(pd.Timestamp(int(v))) if v is not None else None
+                         for v in self.quantiles.quantiles(QUANTILES)]
+        elif dtype in ('integer', 'float'):
+            low, high = self.number_range
+            quantiles = self.quantiles.quantiles(QUANTILES)
+            if dtype == 'integer':
+                # The sketches hold float64; an integer column reports integers
+                low, high = int(low), int(high)
+                quantiles = [int(q) if q is not None else None for q in quantiles]
+        elif dtype != 'empty':
+            low, high = self.text_range
+        return {
+            'name': self.name,
+            'dtype': dtype,
+            'null_count': self.nulls,
+            'non_null_count': self.values,
+            'min': low,
+            'max': high,
+            'distinct_count': min(self.distinct.count(), self.values),
+            'quantiles': dict(zip((str(q) for q in QUANTILES), quantiles)) if quantiles else None,
+            'top_values': [{'value': v, 'count': c} for v, c in self.frequent.top(TOP_K)],
+        }
+
+
+def _widen(bounds, low, high):
+    bounds[0] = low if bounds[0] is None else min(bounds[0], low)
+    bounds[1] = high if bounds[1] is None else max(bounds[1], high)
+
+
+def _iso(value):
+    return value.isoformat() if value is not None else None
+
+
+def profile_chunks(chunks, date_formats=None):
+    """
+    Profile a table given as an iterable of text DataFrames. `date_formats`
+    maps known date columns to their format; without it, date columns are
+    detected on the first chunk.
+    """
+    profiles = None
+    rows = 0
+    for chunk in chunks:
+        if profiles is None:
+            if date_formats is None:
+                date_formats = dict(dates.infer_date_formats(chunk.head(dates.PROFILE_SAMPLE_ROWS)))
+            profiles = [
+                ColumnProfile(c, date_formats.get(c), c in date_formats)
+                for c in chunk.columns
+            ]
+        for profile in profiles:
+            profile.update(chunk[profile.name])
+        rows += len(chunk)
+    return {
+        'rows': rows,
+        'columns': [p.result() for p in profiles or []],
+    }
+
+
+def get_profile(file_path, chunks, date_formats=None, sheet=None):
+    """Profile of file_path, computed from `chunks()` once and kept as a sidecar."""
+    kind = 'profile.json'
+    if sheet is not None:
+        kind = f"profile.{hashlib.sha1(str(sheet).encode('utf-8')).hexdigest()[:12]}.json"
+    stored = sidecar.load_json(file_path, kind)
+    if stored is None:
+        stored = profile_chunks(chunks(), date_formats)
+        sidecar.save_json(file_path, kind, stored)
+    return stored
@@ -0,0 +1,239 @@
+import math
+import operator
+import re
+
+import pandas as pd
+
+# A query is a tree of JSON nodes:
+#   {"and": [node, ...]}  /  {"or": [node, ...]}  /  {"not": node}
+#   {"column": "price", "op": "between", "value": [10, 20]}
+#
+# Comparisons take the value type from "type" ('string', 'number', 'date');
+# without one, values that all read as numbers ("9" included) compare as
+# numbers and anything else as text. 'equals' always matches the raw text.
+#
+# Leaves compile to functions that build one boolean mask per column with
+# vectorised pandas/numpy operations; numeric and date comparisons run on
+# converted columns instead of their string form.
+
+STRING_OPS = {'contains', 'startswith', 'equals', 'regex'}
+COMPARE_OPS = {
+    'eq': operator.eq,
+    'ne': operator.ne,
+    'gt': operator.gt,
+    'gte': operator.ge,
+    'lt': operator.lt,
+    'lte': operator.le,
+}
+LIST_OPS = {'in', 'not_in'}
+NULL_OPS = {'is_null', 'not_null'}
+VALUE_TYPES = {'string', 'number', 'date'}
+
+
+class Query:
+    """A compiled filter; mask(df) returns the boolean Series of matching rows."""
+
+    def __init__(self, evaluate, columns, date_columns, node=None):
+        self._evaluate = evaluate
+        self.node = node  # the JSON tree it was compiled from
+        self.columns = columns
+        self.date_columns = date_columns
+
+    def mask(self, df, dates=None):
+        """
+        `dates` optionally maps columns to already parsed datetime64 Series,
+        which date conditions then use instead of parsing the column again.
+        """
+        missing = [c for c in self.columns if c not in df.columns]
+        if missing:
+            raise ValueError(f"Unknown column(s): {', '.join(missing)}")
+        # Conversions (to number, date, lowercase) are shared by all leaves
+        # that look at the same column during one evaluation.
+        converted = {(column, 'date'): series for column, series in (dates or {}).items()}
+        mask = self._evaluate(df, converted)
+        if mask.dtype != bool:
+            # Nullable columns give masks of the nullable 'boolean' dtype
+            mask = mask.fillna(False).astype(bool)
+        return mask
+
+
+def compile_query(node):
+    columns = []
+    evaluate = _compile(node, columns)
+    date_columns = [column for column, value_type in columns if value_type == 'date']
+    return Query(
+        evaluate,
+        list(dict.fromkeys(column for column, _ in columns)),
+        list(dict.fromkeys(date_columns)),
+        node,
+    )
+
+
+def simple_query(column, value, op='contains'):
+    """The single-condition query sent by the legacy column/value/operator form."""
+    return {'column': column, 'op': op, 'value': value}
+
+
+def _compile(node, columns):
+    if not isinstance(node, dict):
+        raise ValueError("Query nodes must be objects")
+
+    for combinator, reduce in (('and', operator.and_), ('or', operator.or_)):
+        if combinator in node:
+            children = node[combinator]
+            if not isinstance(children, list) or not children:
+                raise ValueError(f"'{combinator}' needs a non-empty list of conditions")
+            compiled = [_compile(child, columns) for child in children]
+
+            def evaluate(df, converted, compiled=compiled, reduce=reduce):
+                mask = compiled[0](df, converted)
+                for child in compiled[1:]:
+                    mask = reduce(mask, child(df, converted))
+                return mask
+            return evaluate
+
+    if 'not' in node:
+        child = _compile(node['not'], columns)
+        return lambda df, converted: ~child(df, converted)
+
+    return _compile_leaf(node, columns)
+
+
+def _compile_leaf(node, columns):
+    column = node.get('column')
+    op = node.get('op', 'contains')
+    value = node.get('value')
+    value_type = node.get('type')
+    if not column:
+        raise ValueError("Each condition needs a 'column'")
+    if value_type is not None and value_type not in VALUE_TYPES:
+        raise ValueError(f"Unknown value type '{value_type}'")
+    if op in COMPARE_OPS or op in LIST_OPS or op == 'between':
+        value_type = value_type or _infer_type(value if isinstance(value, (list, tuple)) else [value])
+    columns.append((column, value_type))
+
+    if op in NULL_OPS:
+        negate = op == 'not_null'
+
+        def evaluate(df, converted):
+            mask = df[column].isna()
+            return ~mask if negate else mask
+        return evaluate
+
+    if op in STRING_OPS:
+        if value is None:
+            raise ValueError(f"'{op}' needs a value")
+        case = bool(node.get('case_sensitive', False))
+        text = str(value) if case else str(value).lower()
+        if op == 'regex':
+            try:
+                re.compile(str(value))
+            except re.error as e:
+                raise ValueError(f"Invalid regex '{value}': {e}")
+
+        def evaluate(df, converted):
+            series = _text(df, column, converted, lower=not case)
+            if op == 'contains':
+                mask = series.str.contains(text, regex=False, na=False)
+            elif op == 'startswith':
+                mask = series.str.startswith(text, na=False)
+            elif op == 'regex':
+                mask = _text(df, column, converted).str.contains(str(value), case=case, regex=True, na=False)
+            else:
+                mask = series == text
+            return mask.astype(bool)
+        return evaluate
+
+    if op in COMPARE_OPS:
+        target = _coerce(value, value_type)
+        compare = COMPARE_OPS[op]
+
+        def evaluate(df, converted):
+            series = _typed(df, column, value_type, converted)
+            # Nulls never match a comparison, 'ne' included.
+            return compare(series, target) & series.notna()
+        return evaluate
+
+    if op == 'between':
+        if not isinstance(value, (list, tuple)) or len(value) != 2:
+            raise ValueError("'between' needs a [low, high] pair")
+        low, high = (_coerce(v, value_type) if v is not None else None for v in value)
+
+        def evaluate(df, converted):
+            series = _typed(df, column, value_type, converted)
+            mask = series.notna()
+            if low is not None:
+                mask &= series >= low
+            if high is not None:
+                mask &= series <= high
+            return mask
+        return evaluate
+
+    if op in LIST_OPS:
+        if not isinstance(value, (list, tuple)):
+            raise ValueError(f"'{op}' needs a list of values")
+        targets = [_coerce(v, value_type) for v in value]
+        negate = op == 'not_in'
+
+        def evaluate(df, converted):
+            series = _typed(df, column, value_type, converted)
+            mask = series.isin(targets)
+            return (~mask & series.notna()) if negate else mask
+        return evaluate
+
+    raise ValueError(f"Unknown operator '{op}'")
+
+
+def _infer_type(values):
+    present = [v for v in values if v is not None]
+    if present and all(_is_number(v) for v in present):
+        return 'number'
+    return 'string'
+
+
+def _is_number(value):
+    """JSON numbers, and strings holding one: form and URL clients send "9" for 9."""
+    if isinstance(value, bool):
+        return False
+    if isinstance(value, (int, float)):
+        return True
+    if isinstance(value, str):
+        try:
+            return math.isfinite(float(value))
+        except ValueError:
+            return False
+    return False
+
+
+def _coerce(value, value_type):
+    try:
+        if value_type == 'number':
+            return float(value)
+        if value_type == 'date':
+            return pd.Timestamp(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"'{value}' is not a valid {value_type}")
+    return str(value)
+
+
+def _text(df, column, converted, lower=False):
+    key = (column, 'lower' if lower else 'string')
+    if key not in converted:
+        series = df[column]
+        if series.dtype != object:
+            series = series.astype(str).where(series.notna())
+        converted[key] = series.str.lower() if lower else series
+    return converted[key]
+
+
+def _typed(df, column, value_type, converted):
+    if value_type == 'string':
+        return _text(df, column, converted)
+    key = (column, value_type)
+    if key not in converted:
+        series = df[column]
+        if value_type == 'number':
+            converted[key] = pd.to_numeric(series, errors='coerce')
+        else:
+            converted[key] = pd.to_datetime(series, errors='coerce')
+    return converted[key]
@@ -0,0 +1,293 @@
+import mmap
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from apps.tools import sidecar
+from . import engines
+
+# One checkpoint every ROW_INDEX_STRIDE data rows: the index stays around 0.1%
+# of the row count, and a seek never parses more than a stride of extra rows.
+ROW_INDEX_STRIDE = 1000
+SCAN_BLOCK_SIZE = 16 * 1024 * 1024
+
+_QUOTE = ord('"')
+_COMMA = ord(',')
+_NEWLINE = ord('\n')
+_CR = ord('\r')
+
+# Quote states carried from one block of bytes to the next
+_OUTSIDE, _INSIDE, _CLOSED = 0, 1, 2  # _CLOSED: outside, right after a closing quote
+
+
+def _inside_quotes(arr, prev, state, quotechar, delimiter):
+    """
+    Mark the bytes of arr that sit inside a quoted field, following pandas'
+    parser: a quote opens a field only at its start (after a delimiter, a line
+    break or a closing quote, which makes "" an escaped quote); elsewhere
+    outside quotes it is a literal character, as in 12" ruler. `prev` is the
+    byte before arr. Returns the mask and the state after arr.
+    """
+    quotes = np.flatnonzero(arr == quotechar)
+    if not len(quotes):
+        return np.full(len(arr), state == _INSIDE), (_INSIDE if state == _INSIDE else _OUTSIDE)
+
+    before = arr[quotes - 1]
+    if quotes[0] == 0:
+        before[0] = prev
+    at_start = (before == delimiter) | (before == _NEWLINE) | (before == _CR)
+    after_quote = np.empty(len(quotes), dtype=bool)
+    after_quote[0] = quotes[0] == 0 and state == _CLOSED
+    after_quote[1:] = np.diff(quotes) == 1
+
+    # Well-formed files alternate opening and closing quotes; take every quote
+    # as a toggle unless one of the would-be openers is a literal.
+    openers = (np.arange(len(quotes)) + (state == _INSIDE)) % 2 == 0
+    if (at_start | after_quote)[openers].all():
+        toggles = quotes
+    else:
+        toggles = []
+        inside = state == _INSIDE
+        closed = -1 if state == _CLOSED else -2
+        for q, opens in zip(quotes.tolist(), at_start.tolist()):
+            if inside:
+                inside, closed = False, q
+                toggles.append(q)
+            elif opens or q == closed + 1:
+                inside = True
+                toggles.append(q)
+
+    flips = np.zeros(len(arr), dtype=np.uint8)
+    flips[toggles] = 1
+    # Only the parity matters, so the running sum may wrap around
+    mask = ((np.cumsum(flips, dtype=np.uint8) + (state == _INSIDE)) & 1).astype(bool)
+    if mask[-1]:
+        return mask, _INSIDE
+    return mask, (_CLOSED if len(toggles) and toggles[-1] == len(arr) - 1 else _OUTSIDE)
+
+
+def scan_record_starts(f, quotechar=_QUOTE, delimiter=_COMMA, block_size=SCAN_BLOCK_SIZE):
+    """Yield arrays of byte offsets at which non-blank CSV records start.
+
+    Works on raw bytes: a newline ends a record only when it sits outside a
+    quoted field (see _inside_quotes). Blank lines are dropped, as pandas does
+    by default.
+    """
+    base = 0
+    state = _OUTSIDE
+    record_start = 0
+    last_byte = _NEWLINE
+
+    while True:
+        block = f.read(block_size)
+        if not block:
+            break
+        arr = np.frombuffer(block, dtype=np.uint8)
+
+        quoted, state = _inside_quotes(arr, last_byte, state, quotechar, delimiter)
+        ends = np.flatnonzero((arr == _NEWLINE) & ~quoted)
+
+        if len(ends):
+            prev_bytes = np.empty_like(arr)
+            prev_bytes[0] = last_byte
+            prev_bytes[1:] = arr[:-1]
+
+            abs_ends = ends + base
+            starts = np.empty_like(abs_ends)
+            starts[0] = record_start
+            starts[1:] = abs_ends[:-1] + 1
+            lengths = abs_ends - starts
+            blank = (lengths == 0) | ((lengths == 1) & (prev_bytes[ends] == _CR))
+            yield starts[~blank]
+            record_start = int(abs_ends[-1]) + 1
+
+        last_byte = int(arr[-1])
+        base += len(block)
+
+    trailing = base - record_start
+    if trailing > 1 or (trailing == 1 and last_byte != _CR):
+        yield np.array([record_start], dtype=np.int64)
+
+
+def _count_segment(buf, start, end, state, quotechar=_QUOTE, delimiter=_COMMA, block_size=SCAN_BLOCK_SIZE):
+    """
+    Count record terminators in buf[start:end] for a segment that starts in
+    the given quote state. Returns (state after the segment, terminators).
+    """
+    count = 0
+    for lo in range(start, end, block_size):
+        hi = min(lo + block_size, end)
+        # Two bytes of look-behind tell blank lines ('\n\n', '\n\r\n') apart;
+        # the start of the file counts as a line start.
+        behind = bytes(buf[max(lo - 2, 0):lo]).rjust(2, b'\n')
+        ext = np.frombuffer(behind + buf[lo:hi], dtype=np.uint8)
+        arr = ext[2:]
+
+        blank = (ext[1:-1] == _NEWLINE) | ((ext[1:-1] == _CR) & (ext[:-2] == _NEWLINE))
+        quoted, state = _inside_quotes(arr, ext[1], state, quotechar, delimiter)
+        count += int(np.count_nonzero((arr == _NEWLINE) & ~blank & ~quoted))
+    return state, count
+
+
+def _segment_bounds(buf, size, segment_size):
+    """Split [0, size) into segments that each start right after a newline."""
+    bounds = []
+    lo = 0
+    while lo < size:
+        cut = buf.find(b'\n', min(lo + segment_size, size) - 1)
+        hi = size if cut < 0 else cut + 1
+        bounds.append((lo, hi))
+        lo = hi
+    return bounds
+
+
+def count_records(file_path, workers=None, quotechar=_QUOTE, delimiter=_COMMA):
+    """
+    Exact number of non-blank CSV records (header included) from a raw scan of
+    the memory-mapped file, split at newlines into segments counted in
+    parallel as if each started outside quotes. The states are chained
+    afterwards; the rare segment that starts inside a quoted field (a newline
+    within quotes at the cut) is counted again from that state.
+    """
+    size = os.path.getsize(file_path)
+    if size == 0:
+        return 0
+    workers = workers or os.cpu_count() or 1
+    segment_size = max(SCAN_BLOCK_SIZE, -(-size // workers))
+
+    def count(bounds, state):
+        return _count_segment(buf, *bounds, state, quotechar=quotechar, delimiter=delimiter)
+
+    with open(file_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        bounds = _segment_bounds(buf, size, segment_size)
+        # numpy releases the GIL for the heavy lifting, so threads scale here
+        with ThreadPoolExecutor(max_workers=min(workers, len(bounds))) as pool:
+            segments = list(pool.map(lambda b: count(b, _OUTSIDE), bounds))
+
+        records = 0
+        state = _OUTSIDE
+        for segment, (state_after, terminators) in zip(bounds, segments):
+            if state == _INSIDE:
+                state_after, terminators = count(segment, _INSIDE)
+            records += terminators
+            state = state_after
+        tail = bytes(buf[max(size - 2, 0):size]).rjust(2, b'\n')
+
+    # A last record without a trailing newline
+    if tail[1] != _NEWLINE and not (tail[1] == _CR and tail[0] == _NEWLINE):
+        records += 1
+    return records
+
+
+def get_row_count(file_path):
+    """Number of data rows of file_path, persisted beside it after the first scan."""
+    index = _load(file_path)
+    if index is not None:
+        return index['total_rows']
+    stored = sidecar.load_json(file_path, 'rowcount.json')
+    if stored is not None:
+        return stored['rows']
+    rows = max(count_records(file_path, **_quoting(file_path)) - 1, 0)
+    sidecar.save_json(file_path, 'rowcount.json', {'rows': rows})
+    return rows
+
+
+def _quoting(file_path):
+    options = engines.dialect(file_path)
+    return {'quotechar': ord(options['quotechar']), 'delimiter': ord(options['sep'])}
+
+
+def build_row_index(file_path, stride=ROW_INDEX_STRIDE):
+    """Scan file_path once and keep the offset of every `stride`-th data row."""
+    checkpoints = []
+    record_no = 0  # record 0 is the header
+    with open(file_path, 'rb') as f:
+        for starts in scan_record_starts(f, **_quoting(file_path)):
+            data_rows = np.arange(record_no, record_no + len(starts)) - 1
+            checkpoints.append(starts[(data_rows >= 0) & (data_rows % stride == 0)])
+            record_no += len(starts)
+
+    offsets = np.concatenate(checkpoints) if checkpoints else np.empty(0, dtype=np.int64)
+    return {
+        'offsets': offsets.astype(np.int64),
+        'total_rows': max(record_no - 1, 0),
+        'stride': stride,
+    }
+
+
+def _load(file_path):
+    path = sidecar.sidecar_path(file_path, 'rowindex.npz')
+    try:
+        with np.load(path) as stored:
+            if list(stored['signature']) != sidecar.source_signature(file_path):
+                return None
+            return {
+                'offsets': stored['offsets'],
+                'total_rows': int(stored['total_rows']),
+                'stride': int(stored['stride']),
+            }
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def _save(file_path, index):
+    signature = np.array(sidecar.source_signature(file_path), dtype=np.int64)
+
+    def write(tmp_path):
+        # np.savez appends '.npz' to bare paths, so hand it a file object
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, signature=signature, offsets=index['offsets'],
+                     total_rows=index['total_rows'], stride=index['stride'])
+
+    sidecar.write_atomic(sidecar.sidecar_path(file_path, 'rowindex.npz'), write)
+
+
+def get_row_index(file_path):
+    """Return the row index of file_path, building and persisting it on first use."""
+    index = _load(file_path)
+    if index is None:
+        index = build_row_index(file_path)
+        _save(file_path, index)
+    return index
+
+
+def read_header(file_path):
+    return list(pd.read_csv(file_path, nrows=0, **engines.dialect(file_path)).columns)
+
+
+def read_rows(file_path, index, start, count, columns, dtype=None, usecols=None):
+    """
+    Parse only data rows [start, start + count) by seeking to the nearest
+    checkpoint. `columns` names every field of the file; `usecols` limits
+    the parse to some of them.
+    """
+    if start >= index['total_rows'] or count <= 0:
+        return pd.DataFrame(columns=usecols if usecols is not None else columns)
+
+    checkpoint = start // index['stride']
+    skip = start - checkpoint * index['stride']
+    with open(file_path, 'rb') as f:
+        f.seek(int(index['offsets'][checkpoint]))
+        df = pd.read_csv(f, header=None, names=columns, nrows=skip + count, dtype=dtype, usecols=usecols,
+                         **engines.dialect(file_path))
+    return df.iloc[skip:]
+
+
+def read_positions(file_path, index, positions, columns, dtype=None, usecols=None):
+    """
+    Parse the data rows at the given sorted positions. Each stride block that
+    holds some of them is read on its own, so scattered rows never make the
+    read cover the whole span between them.
+    """
+    positions = np.asarray(positions, dtype=np.int64)
+    if not len(positions):
+        return pd.DataFrame(columns=usecols if usecols is not None else columns)
+    blocks = positions // index['stride']
+    parts = []
+    for wanted in np.split(positions, np.flatnonzero(np.diff(blocks)) + 1):
+        span = read_rows(file_path, index, int(wanted[0]), int(wanted[-1] - wanted[0]) + 1, columns,
+                         dtype=dtype, usecols=usecols)
+        parts.append(span.iloc[wanted - wanted[0]])
+    return pd.concat(parts)
@@ -0,0 +1,97 @@
+import numpy as np
+import pandas as pd
+
+from apps.tools import sidecar
+from . import engines
+
+# Compact dtypes for full-table loads. pandas' defaults keep every string as a
+# Python object and turn integer columns with a blank into float64; a schema
+# inferred from a sample of the file is passed to the parser instead:
+#   low-cardinality text   -> category
+#   other text             -> Arrow-backed strings
+#   true/false text        -> nullable boolean
+#   integers with blanks   -> nullable Int64
+# Numeric widths are narrowed after the parse from the actual values, so a
+# value outside the sample can never overflow a guessed width.
+
+SAMPLE_ROWS = 10_000
+# Text with at most this share of distinct values (in the sample) becomes a category
+CATEGORY_MAX_SHARE = 0.5
+STRING_DTYPE = 'string[pyarrow]'
+TEXT_DTYPES = {'category', STRING_DTYPE}
+_INTEGER = r'[+-]?\d+'
+_BOOLEANS = {'true', 'false'}
+
+
+def infer_schema(file_path, nrows=SAMPLE_ROWS):
+    """{column: dtype} for the columns of a CSV whose default dtype wastes memory."""
+    options = engines.dialect(file_path)
+    typed = pd.read_csv(file_path, nrows=nrows, **options)
+    text = pd.read_csv(file_path, nrows=nrows, dtype=str, **options)
+    schema = {}
+    for column in typed.columns:
+        values = text[column].dropna()
+        if values.empty:
+            continue
+        if pd.api.types.is_float_dtype(typed[column]) and values.str.fullmatch(_INTEGER).all():
+            schema[column] = 'Int64'
+        elif typed[column].dtype == object:
+            if values.str.lower().isin(_BOOLEANS).all():
+                schema[column] = 'boolean'
+            elif values.nunique() <= CATEGORY_MAX_SHARE * len(values):
+                schema[column] = 'category'
+            else:
+                schema[column] = STRING_DTYPE
+    return schema
+
+
+def get_schema(file_path):
+    """The inferred schema of file_path, kept as a sidecar per document."""
+    schema = sidecar.load_json(file_path, 'schema.json')
+    if schema is None:
+        schema = infer_schema(file_path)
+        sidecar.save_json(file_path, 'schema.json', schema)
+    return schema
+
+
+def narrow(df):
+    """Downcast numeric columns in place to the smallest width that holds every value exactly."""
+    for column in df.columns:
+        series = df[column]
+        if pd.api.types.is_bool_dtype(series):
+            continue
+        if pd.api.types.is_integer_dtype(series):
+            df[column] = pd.to_numeric(series, downcast='integer')
+        elif pd.api.types.is_float_dtype(series) and series.dtype.itemsize > 4:
+            small = series.astype(np.float32)
+            if _exact_float32(series, small):
+                df[column] = small
+    return df
+
+
+def _exact_float32(series, small):
+    """
+    Whether every value of a float64 column survives float32 unchanged, as a
+    number and as the text pages and exports show: a float64 that is exactly
+    a float32 can still print differently (0.10000000149011612 as 0.1).
+    """
+    present = series.notna().to_numpy()
+    values = series.to_numpy()[present]
+    narrowed = small.to_numpy()[present]
+    if not (narrowed.astype(np.float64) == values).all():
+        return False
+    return bool((narrowed.astype(str).astype(np.float64) == values).all())
+
+
+def read_csv(file_path):
+    """The table of file_path with the document's compact schema, parsed by its engine (see engines.py)."""
+    schema = get_schema(file_path)
+    try:
+        df = engines.read_csv(file_path, dtype=schema)
+    except (TypeError, ValueError, OverflowError):
+        # A value past the sample broke a numeric or boolean guess. Text dtypes
+        # can't fail, so keep those and remember the smaller schema.
+        schema = {c: d for c, d in schema.items() if d in TEXT_DTYPES}
+        sidecar.save_json(file_path, 'schema.json', schema)
+        df = engines.read_csv(file_path, dtype=schema)
+    return narrow(df)
@@ -1,29 +1,200 @@
+import io
+import os
+import numpy as np
 import pandas as pd
 from apps.tools.base import BaseFileService
+from . import aggregate, columnar, dates, diff, engines, formats, join, overlay, row_index, schema, sorting, trigram
+from .frame_cache import frame_cache
+from .profile import get_profile
+
+# Rows per chunk for the streaming paths: large enough to keep pandas'
+# per-call overhead negligible, small enough to stay well inside a worker.
+STREAM_CHUNK_ROWS = 100_000
 
 class CSVService(BaseFileService):
-    def get_dataframe(self, file_path):
-        if str(file_path).endswith('.xlsx') or str(file_path).endswith('.xls'):
-            return pd.read_excel(file_path)
-        return pd.read_csv(file_path)
+    def is_excel(self, file_path):
+        return str(file_path).endswith('.xlsx') or str(file_path).endswith('.xls')
+
+    def get_dataframe(self, file_path, columns=None):
+        """Parsed table of file_path. The result may be shared; don't mutate it."""
+        if overlay.is_overlay(file_path):
+            df = frame_cache.get_or_load(file_path, lambda: overlay.build_dataframe(file_path, self))
+            return df[list(columns)] if columns is not None else df
+        parse = pd.read_excel if self.is_excel(file_path) else schema.read_csv
+        if columns is not None:
+            # Projections aren't cached on their own, but can be cut from a cached frame
+            df = frame_cache.get_columns(file_path, columns)
+            if df is not None:
+                return df
+            return columnar.load(file_path, parse, columns=columns)
+        return frame_cache.get_or_load(file_path, lambda: columnar.load(file_path, parse))
 
     def process(self, *args, **kwargs):
         pass
 
-    def read_csv(self, file_path, page=1, page_size=50):
-        # Read only necessary rows if possible, but for simplicity read all then slice
-        # Ideally use skiprows and nrows for efficiency on large files
+    def read_header(self, file_path):
+        if overlay.is_overlay(file_path):
+            return overlay.visible_columns(overlay.load_manifest(file_path))
+        if self.is_excel(file_path):
+            return list(pd.read_excel(file_path, nrows=0).columns)
+        return row_index.read_header(file_path)
+
+    def iter_text_chunks(self, file_path, chunksize=STREAM_CHUNK_ROWS):
+        """The CSV (or overlay) table of file_path as chunks of raw text cells."""
+        if overlay.is_overlay(file_path):
+            return overlay.iter_chunks(file_path, self, chunksize)
+        return pd.read_csv(file_path, chunksize=chunksize, dtype=str, **engines.dialect(file_path))
+
+    def iter_csv_text(self, file_path):
+        """CSV text of file_path's table, one chunk at a time (for streamed downloads)."""
+        header = True
+        for chunk in self.iter_text_chunks(file_path):
+            buffer = io.StringIO()
+            chunk.to_csv(buffer, index=False, header=header)
+            header = False
+            yield buffer.getvalue()
+        if header:
+            yield pd.DataFrame(columns=self.read_header(file_path)).to_csv(index=False)
+
+    def count_rows(self, file_path):
+        if overlay.is_overlay(file_path):
+            return overlay.row_count(file_path, self)
+        if self.is_excel(file_path):
+            return len(self.get_dataframe(file_path))
+        return row_index.get_row_count(file_path)
+
+    def load_sample(self, file_path, nrows):
+        if overlay.is_overlay(file_path):
+            return next(iter(self.iter_text_chunks(file_path, nrows)), pd.DataFrame())
+        if self.is_excel(file_path):
+            return pd.read_excel(file_path, nrows=nrows)
+        return pd.read_csv(file_path, nrows=nrows, **engines.dialect(file_path))
+
+    def date_profile(self, file_path):
+        """[column, format] pairs of the date columns of file_path (see dates.py)."""
+        return dates.get_date_profile(file_path, lambda nrows: self.load_sample(file_path, nrows))
+
+    def date_columns(self, file_path, df, column=None):
+        """
+        Parsed datetime64 frame of `column`, or of every date column when no
+        column is given. Profiled columns come from the per-document cache.
+        """
+        formats = self.date_profile(file_path)
+        profiled = [c for c, _ in formats]
+        if column:
+            if column in profiled:
+                return dates.get_parsed_dates(file_path, df, formats, [column])
+            return pd.DataFrame({column: pd.to_datetime(df[column], errors='coerce')})
+        return dates.get_parsed_dates(file_path, df, formats)
+
+    def date_mask(self, file_path, df, column, start_dt, end_dt):
+        """
+        Boolean array of the rows of df holding a date in [start_dt, end_dt],
+        in `column` or, when it is empty or unknown, in any column: profiled
+        date columns from the cache, the others parsed value by value.
+        """
+        if column in df.columns:
+            parsed = self.date_columns(file_path, df, column)
+        else:
+            parsed = self.date_columns(file_path, df)
+            others = [c for c in df.columns if c not in parsed.columns]
+            parsed = pd.concat(
+                [parsed, pd.DataFrame({c: dates.parse_unprofiled(df[c]) for c in others}, index=df.index)], axis=1
+            )
+        if not len(parsed.columns):
+            return np.zeros(len(df), dtype=bool)
+        return ((parsed >= start_dt) & (parsed <= end_dt)).any(axis=1).to_numpy()
+
+    def profile(self, file_path, sheet_name=None):
+        """Per-column statistics of the table (see profile.py), from one streamed pass."""
+        if self.is_excel(file_path):
+            from apps.tools.xlsx.services import XLSXService
+            return get_profile(
+                file_path,
+                lambda: XLSXService().iter_text_chunks(file_path, sheet_name, STREAM_CHUNK_ROWS),
+                sheet=sheet_name,
+            )
+        return get_profile(
+            file_path,
+            lambda: self.iter_text_chunks(file_path),
+            dict(self.date_profile(file_path)),
+        )
+
+    def take_rows(self, file_path, positions, columns=None):
+        """Rows at the given positions, gathered from the Arrow sidecar when there is one."""
+        if not overlay.is_overlay(file_path):
+            df = columnar.take(file_path, positions, columns)
+            if df is not None:
+                return df
+        return self.get_dataframe(file_path, columns).iloc[positions]
+
+    def select_columns(self, all_columns, columns=None, col_offset=0, col_limit=None):
+        """The named `columns` (default: all), then the [col_offset, col_offset + col_limit) window of them."""
+        if columns:
+            missing = [c for c in columns if c not in all_columns]
+            if missing:
+                raise ValueError(f"Unknown column(s): {', '.join(map(str, missing))}")
+            selected = list(dict.fromkeys(columns))
+        else:
+            selected = list(all_columns)
+        if col_offset < 0 or (col_limit is not None and col_limit < 0):
+            raise ValueError("col_offset and col_limit must not be negative")
+        return selected[col_offset:None if col_limit is None else col_offset + col_limit]
+
+    def read_csv(self, file_path, page=1, page_size=50, sort=None, response_format='records',
+                 columns=None, col_offset=0, col_limit=None):
+        """
+        One page of rows. `columns` and the col_offset/col_limit window restrict
+        the columns returned; only those are parsed where the path allows it.
+        """
         try:
-            df = self.get_dataframe(file_path)
-            total_rows = len(df)
+            if page < 1 or page_size < 1:
+                raise ValueError("page and page_size must be at least 1")
             start = (page - 1) * page_size
-            end = start + page_size
-            
-            data = df.iloc[start:end].replace({float('nan'): None}).to_dict(orient='records')
-            columns = list(df.columns)
+            if self.is_excel(file_path):
+                # The sheet is parsed (and cached) anyway; reading its header apart would reopen the workbook
+                all_columns = list(self.get_dataframe(file_path).columns)
+            else:
+                all_columns = self.read_header(file_path)
+            selected = self.select_columns(all_columns, columns, col_offset, col_limit)
+            # Narrowed reads pass usecols; a full-width read stays as before
+            usecols = selected if selected != list(all_columns) else None
+            if sort:
+                # The full sort runs once per (document, sort key); a page is a
+                # slice of the stored permutation plus a gather of its rows.
+                keys = sorting.parse_sort(sort)
+                missing = [c for c, _ in keys if c not in all_columns]
+                if missing:
+                    raise ValueError(f"Unknown sort column(s): {', '.join(missing)}")
+                permutation = sorting.get_permutation(
+                    file_path, keys, lambda cols: self.get_dataframe(file_path, columns=cols)
+                )
+                total_rows = len(permutation)
+                page_df = self.take_rows(file_path, permutation[start:start + page_size], usecols)
+            elif self.is_excel(file_path):
+                df = self.get_dataframe(file_path)
+                total_rows = len(df)
+                page_df = df.iloc[start:start + page_size]
+            elif overlay.is_overlay(file_path):
+                # Only the surviving base rows of this page are read
+                _, page_df, total_rows = overlay.read_page(file_path, self, start, page_size, usecols)
+            elif start == 0:
+                # The first page is the head of the file; the total comes from
+                # a raw byte count, so opening a grid never needs the index.
+                page_df = pd.read_csv(file_path, nrows=page_size, usecols=usecols, **engines.dialect(file_path))
+                total_rows = row_index.get_row_count(file_path)
+            else:
+                # Seek straight to the page through the row-offset index, so
+                # only page_size rows (plus at most one stride) get parsed.
+                index = row_index.get_row_index(file_path)
+                total_rows = index['total_rows']
+                page_df = row_index.read_rows(file_path, index, start, page_size, all_columns, usecols=usecols)
+
+            data = formats.encode_page(page_df[selected], response_format)
             
             return {
-                'columns': columns,
+                'columns': selected,
+                'total_columns': len(all_columns),
                 'data': data,
                 'total_rows': total_rows,
                 'page': page,
@@ -32,16 +203,138 @@ class CSVService(BaseFileService):
         except Exception as e:
             raise e
 
-    def filter_csv(self, file_path, column, value):
+    def filter_csv(self, file_path, query):
+        """Rows of file_path matching a compiled query (see query.compile_query)."""
         try:
             df = self.get_dataframe(file_path)
-            if column in df.columns:
-                # Simple string contains filter match
-                df = df[df[column].astype(str).str.contains(value, case=False, na=False)]
-            return df
+            parsed = {}
+            if query.date_columns:
+                profiled = [c for c, _ in self.date_profile(file_path)]
+                cached = [c for c in query.date_columns if c in profiled]
+                if cached:
+                    parsed = dict(dates.get_parsed_dates(file_path, df, self.date_profile(file_path), cached).items())
+            return df[query.mask(df, dates=parsed)]
         except Exception as e:
             raise e
 
+    def filter_csv_to(self, file_path, query, out):
+        """
+        Streaming variant of filter_csv for CSV sources: reads file_path in
+        chunks and writes the matching rows to the text stream `out`, so memory
+        stays at one chunk whatever the file size. Cells are read as text and
+        written back unchanged; typed conditions convert their columns per
+        chunk. Returns the number of matching rows.
+
+        When the query has a case-insensitive 'contains' condition on a column
+        with a trigram index, only the index's candidate rows are parsed.
+        """
+        columns = self.read_header(file_path)
+        query.mask(pd.DataFrame(columns=columns))  # unknown columns fail before any work
+        formats = {}
+        if query.date_columns:
+            formats = {c: f for c, f in self.date_profile(file_path) if c in query.date_columns}
+
+        # Overlays have no index of their own (their file is a manifest)
+        rows = None if overlay.is_overlay(file_path) else trigram.candidates(file_path, query)
+        if rows is not None:
+            chunks = [trigram.read_candidates(file_path, rows, columns)]
+        else:
+            chunks = self.iter_text_chunks(file_path)
+
+        match_count = 0
+        header = True
+        for chunk in chunks:
+            # Profiled date columns parse with their known format, not per element
+            parsed = {c: dates.parse_dates(chunk[c], f) for c, f in formats.items()}
+            chunk = chunk[query.mask(chunk, dates=parsed)]
+            chunk.to_csv(out, index=False, header=header)
+            header = False
+            match_count += len(chunk)
+        if header:
+            pd.DataFrame(columns=columns).to_csv(out, index=False)
+        return match_count
+
+    def aggregate_to(self, file_path, group_by, aggregations, out):
+        """
+        Group file_path's rows by `group_by` and write one row per group with
+        the requested aggregations (see aggregate.py) to the text stream `out`.
+        Returns the number of groups.
+        """
+        header = self.read_header(file_path)
+        wanted = list(group_by) + [a['column'] for a in aggregations if a.get('column') is not None]
+        missing = [c for c in dict.fromkeys(wanted) if c not in header]
+        if missing:
+            raise ValueError(f"Unknown column(s): {', '.join(missing)}")
+
+        # Value columns whose sampled values all parse as numbers are summed and compared numerically
+        sample = next(iter(self.iter_text_chunks(file_path, dates.PROFILE_SAMPLE_ROWS)), pd.DataFrame(columns=header))
+        numeric = [
+            c for c in header
+            if sample[c].notna().any() and pd.to_numeric(sample[c].dropna(), errors='coerce').notna().all()
+        ]
+        aggregation = aggregate.Aggregation(group_by, aggregations, numeric)
+
+        pool = aggregate.process_pool()
+        if (
+            pool is not None
+            and not overlay.is_overlay(file_path)
+            and row_index.get_row_count(file_path) >= aggregate.PARALLEL_MIN_ROWS
+        ):
+            result = aggregate.run_parallel(file_path, aggregation, header, pool)
+        else:
+            result = aggregate.run_chunks(self.iter_text_chunks(file_path), aggregation, header)
+        result.to_csv(out, index=False)
+        return len(result)
+
+    def join_to(self, left_path, right_path, left_on, right_on, how, out):
+        """
+        Join the table of left_path with that of right_path on the key columns
+        and write the result to the text stream `out` (see join.py). Returns
+        the number of rows written.
+        """
+        left_header = self.read_header(left_path)
+        right_header = self.read_header(right_path)
+        missing = [c for c in left_on if c not in left_header] + [c for c in right_on if c not in right_header]
+        missing = list(dict.fromkeys(missing))
+        if missing:
+            raise ValueError(f"Unknown column(s): {', '.join(missing)}")
+
+        return join.HashJoin(left_on, right_on, how).run(
+            self.iter_text_chunks(left_path),
+            self.iter_text_chunks(right_path),
+            left_header,
+            right_header,
+            self.count_rows(right_path),
+            out,
+        )
+
+    def diff_table(self, file_path, sheet_name=None):
+        """file_path's table as one side of a diff (see diff.py)."""
+        if self.is_excel(file_path):
+            from apps.tools.xlsx.services import XLSXService
+            # A sheet has no random access; it is parsed once, and the digest
+            # pass and the row lookups of each batch slice the cached frame
+            df = XLSXService().read_text_sheet(file_path, sheet_name)
+
+            def chunks():
+                for start in range(0, max(len(df), 1), STREAM_CHUNK_ROWS):
+                    yield df.iloc[start:start + STREAM_CHUNK_ROWS]
+            return diff.Table(chunks, list(df.columns), lambda positions: df.iloc[positions])
+        header = self.read_header(file_path)
+        take = None
+        if not overlay.is_overlay(file_path):
+            def take(positions):
+                index = row_index.get_row_index(file_path)
+                return row_index.read_positions(file_path, index, positions, header, dtype=str)
+        return diff.Table(lambda: self.iter_text_chunks(file_path), header, take)
+
+    def diff_to(self, old_path, new_path, out, key=None, old_sheet=None, new_sheet=None):
+        """
+        Compare the table of old_path with that of new_path row by row and
+        write the changes to the text stream `out`. Returns summary counts.
+        """
+        return diff.run(self.diff_table(old_path, old_sheet), self.diff_table(new_path, new_sheet), out, key)
+
     def remove_data(self, file_path, remove_type, target_data):
         try:
             df = self.get_dataframe(file_path)
@@ -59,35 +352,39 @@ class CSVService(BaseFileService):
             elif remove_type == 'date':
                 col = target_data.get('column')
                 target_dt = pd.to_datetime(target_data.get('date'))
-                
-                if col and col in df.columns:
-                    temp_dates = pd.to_datetime(df[col], errors='coerce')
-                    df = df[~(temp_dates == target_dt)]
-                else:
-                    # Search across all columns
-                    mask = pd.Series(False, index=df.index)
-                    for c in df.columns:
-                        temp_dates = pd.to_datetime(df[c], errors='coerce')
-                        mask = mask | (temp_dates == target_dt)
-                    df = df[~mask]
+                df = df[~self.date_mask(file_path, df, col, target_dt, target_dt)]
                     
             elif remove_type == 'date_range':
                 col = target_data.get('column')
-                if col and col in df.columns:
-                    temp_dates = pd.to_datetime(df[col], errors='coerce')
-                    start_dt = pd.to_datetime(target_data.get('start_date'))
-                    end_dt = pd.to_datetime(target_data.get('end_date'))
-                    df = df[~((temp_dates >= start_dt) & (temp_dates <= end_dt))]
-                else:
-                    # Search across all columns
-                    start_dt = pd.to_datetime(target_data.get('start_date'))
-                    end_dt = pd.to_datetime(target_data.get('end_date'))
-                    mask = pd.Series(False, index=df.index)
-                    for c in df.columns:
-                        temp_dates = pd.to_datetime(df[c], errors='coerce')
-                        mask = mask | ((temp_dates >= start_dt) & (temp_dates <= end_dt))
-                    df = df[~mask]
+                start_dt = pd.to_datetime(target_data.get('start_date'))
+                end_dt = pd.to_datetime(target_data.get('end_date'))
+                df = df[~self.date_mask(file_path, df, col, start_dt, end_dt)]
                         
             return df
         except Exception as e:
             raise e
+
+    def remove_batch(self, file_path, row_indices=(), columns=(), dates=(), date_ranges=()):
+        """
+        Apply many removals in one pass: every row index and date predicate
+        refers to the rows of file_path as they are now, is OR-ed into a single
+        mask, and the columns are dropped afterwards.
+        dates: [{'column', 'date'}], date_ranges: [{'column', 'start_date', 'end_date'}]
+        Returns (df, number of removed rows).
+        """
+        df = self.get_dataframe(file_path)
+        drop = np.zeros(len(df), dtype=bool)
+
+        rows = np.asarray([i for i in row_indices if 0 <= i < len(df)], dtype=np.int64)
+        drop[rows] = True
+        for item in dates:
+            target_dt = pd.to_datetime(item.get('date'))
+            drop |= self.date_mask(file_path, df, item.get('column'), target_dt, target_dt)
+        for item in date_ranges:
+            start_dt = pd.to_datetime(item.get('start_date'))
+            end_dt = pd.to_datetime(item.get('end_date'))
+            drop |= self.date_mask(file_path, df, item.get('column'), start_dt, end_dt)
+
+        df = df[~drop]
+        df = df.drop(columns=[c for c in dict.fromkeys(columns) if c in df.columns])
+        return df, int(drop.sum())
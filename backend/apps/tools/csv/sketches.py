@@ -0,0 +1,148 @@
+import numpy as np
+import pandas as pd
+
+# Fixed-size summaries of a column that are fed one chunk at a time and can
+# be merged, so statistics over any file size cost the same memory.
+
+
+def hash_values(values):
+    """Stable 64-bit hashes of a Series' values (the same in every process)."""
+    return pd.util.hash_pandas_object(values, index=False).to_numpy()
+
+
+def _bit_length(x):
+    n = np.zeros(len(x), dtype=np.uint8)
+    for shift in (32, 16, 8, 4, 2, 1):
+        big = x >= np.uint64(1 << shift)
+        n += big.astype(np.uint8) * shift
+        x = np.where(big, x >> np.uint64(shift), x)
+    return n + (x > 0)
+
+
+def hll_positions(hashes, p):
+    """(register, rank) of each 64-bit hash in a HyperLogLog of 2**p registers."""
+    hashes = np.asarray(hashes, dtype=np.uint64)
+    buckets = (hashes >> np.uint64(64 - p)).astype(np.int64)
+    rest = hashes & np.uint64((1 << (64 - p)) - 1)
+    # Position of the first set bit of the remaining 64 - p bits
+    rank = (64 - p + 1 - _bit_length(rest)).astype(np.uint8)
+    return buckets, rank
+
+
+def hll_estimates(registers):
+    """Distinct count estimate of each row of a 2-D array of HyperLogLog registers."""
+    registers = np.atleast_2d(registers)
+    m = registers.shape[1]
+    alpha = 0.7213 / (1 + 1.079 / m)
+    estimates = alpha * m * m / np.sum(np.exp2(-registers.astype(np.float64)), axis=1)
+    zeros = np.count_nonzero(registers == 0, axis=1)
+    # Small cardinalities: linear counting is more accurate
+    small = (estimates <= 2.5 * m) & (zeros > 0)
+    estimates[small] = m * np.log(m / zeros[small])
+    return np.round(estimates).astype(np.int64)
+
+
+class HyperLogLog:
+    """Approximate distinct count; 2**p one-byte registers, ~1.04 / sqrt(2**p) error."""
+
+    def __init__(self, p=14):
+        self.p = p
+        self.registers = np.zeros(1 << p, dtype=np.uint8)
+
+    def update(self, hashes):
+        if not len(hashes):
+            return
+        buckets, rank = hll_positions(hashes, self.p)
+        np.maximum.at(self.registers, buckets, rank)
+
+    def merge(self, other):
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def count(self):
+        return int(hll_estimates(self.registers)[0])
+
+
+class QuantileSketch:
+    """
+    KLL-style quantile sketch: a stack of compactors, each holding at most k
+    values of weight 2**level. A full compactor sorts itself and promotes
+    every other value (random offset) to the next level. Rank error grows with
+    the number of levels over k, i.e. slowly with n.
+    """
+
+    def __init__(self, k=1024, seed=0):
+        self.k = k
+        self.levels = [np.empty(0, dtype=np.float64)]
+        self.count = 0
+        self._rng = np.random.default_rng(seed)
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self.count += len(values)
+        self._compact()
+
+    def merge(self, other):
+        for level, values in enumerate(other.levels):
+            if level == len(self.levels):
+                self.levels.append(np.empty(0, dtype=np.float64))
+            self.levels[level] = np.concatenate([self.levels[level], values])
+        self.count += other.count
+        self._compact()
+
+    def _compact(self):
+        level = 0
+        while level < len(self.levels):
+            values = self.levels[level]
+            if len(values) > self.k:
+                values = np.sort(values)
+                # An odd value out stays behind at this level
+                keep, values = values[len(values) - len(values) % 2:], values[:len(values) - len(values) % 2]
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0, dtype=np.float64))
+                promoted = values[self._rng.integers(2)::2]
+                self.levels[level] = keep
+                self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+            level += 1
+
+    def quantiles(self, qs):
+        if not self.count:
+            return [None] * len(qs)
+        values = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(v), 2.0 ** level) for level, v in enumerate(self.levels)])
+        order = np.argsort(values, kind='stable')
+        values, cumulative = values[order], np.cumsum(weights[order])
+        positions = np.searchsorted(cumulative, np.asarray(qs) * cumulative[-1], side='left')
+        return [float(values[min(i, len(values) - 1)]) for i in positions]
+
+
+class FrequentItems:
+    """
+    Misra-Gries heavy hitters over at most `capacity` counters. Counts are
+    exact while a column has fewer distinct values than that; otherwise
+    each is an underestimate by at most n / (capacity + 1).
+    """
+
+    def __init__(self, capacity=1000):
+        self.capacity = capacity
+        self.counters = pd.Series(dtype=np.int64)
+
+    def update(self, values):
+        self.merge_counts(pd.Series(values).value_counts())
+
+    def merge(self, other):
+        self.merge_counts(other.counters)
+
+    def merge_counts(self, counts):
+        counters = self.counters.add(counts, fill_value=0).astype(np.int64)
+        if len(counters) > self.capacity:
+            threshold = counters.nlargest(self.capacity + 1).iloc[-1]
+            counters = counters - threshold
+            counters = counters[counters > 0]
+        self.counters = counters
+
+    def top(self, k):
+        return [(value, int(count)) for value, count in self.counters.nlargest(k).items()]
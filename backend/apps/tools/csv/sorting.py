@@ -0,0 +1,64 @@
+import hashlib
+import json
+
+import numpy as np
+
+from apps.tools import sidecar
+
+
+def parse_sort(spec):
+    """'name,-price' -> [('name', True), ('price', False)]; a leading '-' sorts descending."""
+    keys = []
+    for part in str(spec).split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if part.startswith('-'):
+            keys.append((part[1:], False))
+        else:
+            keys.append((part, True))
+    if not keys:
+        raise ValueError("Empty sort specification")
+    return keys
+
+
+def _kind(keys):
+    digest = hashlib.sha1(json.dumps(keys).encode('utf-8')).hexdigest()[:12]
+    return f"sort.{digest}.npz"
+
+
+def compute_permutation(df, keys):
+    """Row positions of df in sorted order (stable, nulls last)."""
+    ordered = df.reset_index(drop=True).sort_values(
+        by=[column for column, _ in keys],
+        ascending=[ascending for _, ascending in keys],
+        kind='stable',
+        na_position='last',
+    )
+    return ordered.index.to_numpy(dtype=np.int64)
+
+
+def get_permutation(file_path, keys, load_columns):
+    """
+    Sorted row order of file_path for `keys`, persisted as a sidecar per sort
+    key so every page of the same sort (in any worker) reuses it.
+    load_columns(columns) returns the table restricted to the sort columns.
+    """
+    path = sidecar.sidecar_path(file_path, _kind(keys))
+    signature = sidecar.source_signature(file_path)
+    try:
+        with np.load(path) as stored:
+            if list(stored['signature']) == signature:
+                return stored['permutation']
+    except (OSError, KeyError, ValueError):
+        pass
+
+    columns = list(dict.fromkeys(column for column, _ in keys))
+    permutation = compute_permutation(load_columns(columns), keys)
+
+    def write(tmp_path):
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, signature=np.array(signature, dtype=np.int64), permutation=permutation)
+
+    sidecar.write_atomic(path, write)
+    return permutation
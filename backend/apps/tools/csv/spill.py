@@ -0,0 +1,88 @@
+import math
+import os
+import pickle
+import shutil
+import uuid
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+
+# Scratch space for the out-of-core paths (joins, dedup, ...). Data that
+# doesn't fit the memory budget is hash-partitioned into files under
+# MEDIA_ROOT/temp, so that each partition can then be processed on its own.
+# A partition file is a sequence of pickled frames appended one after the
+# other; it is read back frame by frame.
+
+# Never split into more files than this, however large the input
+MAX_PARTITIONS = 256
+
+
+def memory_budget():
+    return settings.SPILL_MEMORY_BYTES
+
+
+def frame_bytes(df):
+    return int(df.memory_usage(deep=True, index=False).sum())
+
+
+def partition_count(estimated_bytes, budget=None):
+    """Partitions needed for each to fit in half the budget (hash skew takes the rest)."""
+    budget = budget or memory_budget()
+    return min(MAX_PARTITIONS, max(2, math.ceil(2 * estimated_bytes / budget)))
+
+
+@contextmanager
+def scratch_dir(prefix):
+    """A fresh directory under MEDIA_ROOT/temp, removed with everything in it on exit."""
+    path = os.path.join(settings.MEDIA_ROOT, 'temp', f"{prefix}_{uuid.uuid4().hex}")
+    os.makedirs(path)
+    try:
+        yield path
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def partition_of(df, columns, count):
+    """Partition number of each row, from a hash of its values in `columns`."""
+    hashes = pd.util.hash_pandas_object(df[list(columns)], index=False).to_numpy()
+    return (hashes % np.uint64(count)).astype(np.int64)
+
+
+class Partitions:
+    """`count` append-only partition files named `name` in a scratch directory."""
+
+    def __init__(self, directory, name, count):
+        self.count = count
+        self.paths = [os.path.join(directory, f"{name}.{k}.pkl") for k in range(count)]
+        self.rows = [0] * count
+
+    def append(self, k, df):
+        if len(df):
+            with open(self.paths[k], 'ab') as f:
+                pickle.dump(df, f, protocol=pickle.HIGHEST_PROTOCOL)
+            self.rows[k] += len(df)
+
+    def write(self, df, columns):
+        """Append each row of df to the partition its `columns` hash to."""
+        parts = partition_of(df, columns, self.count)
+        for k, part in df.groupby(parts, sort=False):
+            self.append(k, part)
+
+    def iter(self, k):
+        """The frames of partition k, in the order they were appended."""
+        if not os.path.exists(self.paths[k]):
+            return
+        with open(self.paths[k], 'rb') as f:
+            while True:
+                try:
+                    yield pickle.load(f)
+                except EOFError:
+                    return
+
+    def read(self, k, columns):
+        frames = list(self.iter(k))
+        if not frames:
+            return pd.DataFrame({c: pd.Series(dtype=object) for c in columns})
+        return pd.concat(frames, ignore_index=True)
@@ -0,0 +1,658 @@
+import csv
+import io
+import os
+import random
+import shutil
+import tempfile
+from unittest import mock
+
+import numpy as np
+import openpyxl
+import pandas as pd
+import pyarrow as pa
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework.test import APIClient
+
+from . import aggregate, dates, engines, join, row_index, schema, services, spill, trigram
+from .frame_cache import FrameCache
+from .profile import profile_chunks
+from .query import compile_query
+from .services import CSVService
+from .sketches import FrequentItems, HyperLogLog, QuantileSketch, hash_values
+# Patched under the names the views import them by, whichever label loaded the tests
+from apps.tools.csv import diff, sorting
+
+
+class CSVAPITestCase(TestCase):
+    """Runs against a throwaway MEDIA_ROOT, through the public endpoints."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.media_root = tempfile.mkdtemp()
+        cls.settings_override = override_settings(MEDIA_ROOT=cls.media_root, TRIGRAM_INDEX_ON_UPLOAD=False)
+        cls.settings_override.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.settings_override.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def upload(self, name, text):
+        response = self.client.post(
+            '/api/v1/documents/upload/',
+            {'file': SimpleUploadedFile(name, text.encode('utf-8'))},
+            format='multipart',
+        )
+        self.assertEqual(response.status_code, 201, response.content)
+        return response.json()['id']
+
+    def post(self, url, body, expected=201):
+        response = self.client.post(url, body, format='json')
+        self.assertEqual(response.status_code, expected, response.content)
+        return response.json()
+
+    def read(self, file_id, **params):
+        response = self.client.get(f'/api/v1/tools/csv/{file_id}/read/', {'page_size': 1000, **params})
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def export(self, file_id):
+        response = self.client.get(f'/api/v1/tools/csv/{file_id}/export/')
+        self.assertEqual(response.status_code, 200)
+        text = b''.join(response.streaming_content).decode('utf-8')
+        return list(csv.DictReader(io.StringIO(text)))
+
+
+class OverlayTests(CSVAPITestCase):
+    """Pages, counts, sorted reads and exports of an overlay show the same rows."""
+
+    def assertConsistent(self, file_id, key, expected):
+        page = self.read(file_id)
+        self.assertEqual(page['total_rows'], len(expected))
+        self.assertEqual([str(row[key]) for row in page['data']], expected)
+
+        exported = self.export(file_id)
+        self.assertEqual([row[key] for row in exported], expected)
+        self.assertEqual(list(exported[0].keys()) if exported else [], page['columns'] if exported else [])
+
+        # Sorted reads go through the whole-table DataFrame of the overlay
+        sorted_page = self.read(file_id, sort=key)
+        self.assertEqual(sorted_page['total_rows'], len(expected))
+        self.assertEqual(sorted(str(row[key]) for row in sorted_page['data']), sorted(expected))
+
+    def test_date_removal_ignores_dropped_columns(self):
+        base = self.upload('dates.csv', (
+            "id,start,end\n"
+            "a,2024-01-05,2024-03-01\n"
+            "b,2024-02-01,2024-01-10\n"
+            "c,2024-03-01,2024-03-02\n"
+            "d,2024-01-20,2024-01-25\n"
+        ))
+        dropped = self.post('/api/v1/tools/csv/remove/', {
+            'file_id': base, 'remove_type': 'column', 'column': 'start', 'lazy': True,
+        })['id']
+        # No column given: every date column still in the table, so 'end' only
+        removed = self.post('/api/v1/tools/csv/remove/', {
+            'file_id': dropped, 'remove_type': 'date_range', 'column': '',
+            'start_date': '2024-01-01', 'end_date': '2024-01-31', 'lazy': True,
+        })
+        self.assertEqual(removed['match_count'], 2)
+        self.assertConsistent(removed['id'], 'id', ['a', 'c'])
+
+    def test_filters_match_raw_text(self):
+        base = self.upload('codes.csv', "code,name\n007,x\n7,y\n7.0,z\n0070,w\n")
+        filtered = self.post('/api/v1/tools/csv/filter/', {
+            'file_id': base, 'query': {'column': 'code', 'op': 'equals', 'value': '007'}, 'lazy': True,
+        })
+        self.assertEqual(filtered['match_count'], 1)
+        self.assertConsistent(filtered['id'], 'name', ['x'])
+
+        contains = self.post('/api/v1/tools/csv/filter/', {
+            'file_id': base, 'query': {'column': 'code', 'op': 'contains', 'value': '.0'}, 'lazy': True,
+        })
+        self.assertEqual(contains['match_count'], 1)
+        self.assertConsistent(contains['id'], 'name', ['z'])
+
+    def test_base_with_overlays_cannot_be_deleted(self):
+        base = self.upload('base.csv', "a,b\n1,2\n3,4\n")
+        edited = self.post('/api/v1/tools/csv/remove/', {
+            'file_id': base, 'remove_type': 'row', 'row_index': 0, 'lazy': True,
+        })['id']
+
+        response = self.client.delete(f'/api/v1/documents/{base}/')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['dependents'], [edited])
+        self.assertConsistent(edited, 'a', ['3'])
+
+        self.assertEqual(self.client.post(f'/api/v1/tools/csv/{edited}/materialize/').status_code, 200)
+        self.assertEqual(self.client.delete(f'/api/v1/documents/{base}/').status_code, 204)
+        self.assertEqual([row['a'] for row in self.export(edited)], ['3'])
+
+
+class DateRemovalTests(CSVAPITestCase):
+    def test_mixed_columns_are_searched(self):
+        # 'other' is a quarter junk, too little date for the profile
+        rows = [f"r{k},2023-06-{k % 28 + 1:02d},{'2024-01-02' if k == 5 else 'unknown' if k % 4 == 0 else '2023-05-01'},{k}"
+                for k in range(40)]
+        base = self.upload('mixed.csv', "id,day,other,n\n" + "\n".join(rows) + "\n")
+        expected = [f"r{k}" for k in range(40) if k != 5]
+        for lazy in (False, True):
+            with self.subTest(lazy=lazy):
+                removed = self.post('/api/v1/tools/csv/remove/', {
+                    'file_id': base, 'remove_type': 'date', 'column': '', 'date_val': '2024-01-02', 'lazy': lazy,
+                })
+                self.assertEqual([row['id'] for row in self.read(removed['id'])['data']], expected)
+
+
+class QueryTests(SimpleTestCase):
+    def frame(self):
+        return pd.DataFrame({
+            'n': ['1', '9', '10', '20', None, 'x'],
+            's': ['a', 'b', None, 'd', 'e', 'f'],
+        }, dtype=object)
+
+    def matches(self, node, df=None):
+        df = self.frame() if df is None else df
+        return df.index[compile_query(node).mask(df)].tolist()
+
+    def test_numbers_sent_as_strings(self):
+        for value in (9, '9', ' 9 ', '9.0'):
+            with self.subTest(value=value):
+                self.assertEqual(self.matches({'column': 'n', 'op': 'gt', 'value': value}), [2, 3])
+        self.assertEqual(self.matches({'column': 'n', 'op': 'between', 'value': ['2', '15']}), [1, 2])
+        self.assertEqual(self.matches({'column': 'n', 'op': 'in', 'value': ['1', 20]}), [0, 3])
+        # An explicit type still wins
+        self.assertEqual(self.matches({'column': 'n', 'op': 'gt', 'value': '9', 'type': 'string'}), [5])
+
+    def test_combinators(self):
+        big = {'column': 'n', 'op': 'gte', 'value': 9}
+        some = {'column': 's', 'op': 'in', 'value': ['b', 'd', 'f']}
+        self.assertEqual(self.matches({'and': [big, some]}), [1, 3])
+        self.assertEqual(self.matches({'or': [big, some]}), [1, 2, 3, 5])
+        self.assertEqual(self.matches({'not': {'or': [big, some]}}), [0, 4])
+        self.assertEqual(self.matches({'and': [{'not': big}, {'or': [some, {'column': 's', 'op': 'eq', 'value': 'a'}]}]}), [0, 5])
+
+    def test_nulls(self):
+        # 'not' negates the whole mask, so the null row comes back; not_in and ne never match nulls
+        self.assertEqual(self.matches({'not': {'column': 's', 'op': 'in', 'value': ['a', 'b']}}), [2, 3, 4, 5])
+        self.assertEqual(self.matches({'column': 's', 'op': 'not_in', 'value': ['a', 'b']}), [3, 4, 5])
+        self.assertEqual(self.matches({'column': 's', 'op': 'ne', 'value': 'a'}), [1, 3, 4, 5])
+        self.assertEqual(self.matches({'column': 's', 'op': 'is_null'}), [2])
+        self.assertEqual(self.matches({'not': {'column': 'n', 'op': 'lt', 'value': 10}}), [2, 3, 4, 5])
+
+    def test_invalid_queries(self):
+        for node in ({'and': []}, {'column': 'n', 'op': 'gt', 'value': 'abc', 'type': 'number'},
+                     {'column': 'n', 'op': 'regex', 'value': '('}, {'column': 'n', 'op': 'nope', 'value': 1}, []):
+            with self.subTest(node=node), self.assertRaises(ValueError):
+                compile_query(node)
+
+
+class StreamedFilterTests(CSVAPITestCase):
+    def test_chunks_match_the_whole_table(self):
+        rng = random.Random(5)
+        path = os.path.join(self.media_root, 'filter.csv')
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['id', 'n', 's', 'day'])
+            for k in range(200):
+                writer.writerow([k, rng.choice(['', rng.randint(0, 50)]), rng.choice(['', 'alpha', 'Beta', 'gamma']),
+                                 rng.choice(['', f'2024-01-{rng.randint(1, 28):02d}'])])
+        service = CSVService()
+        queries = [
+            {'and': [{'column': 'n', 'op': 'gt', 'value': '20'}, {'not': {'column': 's', 'op': 'eq', 'value': 'alpha'}}]},
+            {'or': [{'column': 's', 'op': 'contains', 'value': 'ET'}, {'column': 'n', 'op': 'is_null'}]},
+            {'column': 's', 'op': 'not_in', 'value': ['gamma']},
+            {'column': 'day', 'op': 'between', 'value': ['2024-01-05', '2024-01-10'], 'type': 'date'},
+        ]
+        chunked = lambda file_path, chunksize=None: pd.read_csv(file_path, chunksize=7, dtype=str)
+        for node in queries:
+            with self.subTest(node=node):
+                query = compile_query(node)
+                whole = service.filter_csv(path, query)['id'].astype(str).tolist()
+                out = io.StringIO()
+                with mock.patch.object(service, 'iter_text_chunks', chunked):
+                    count = service.filter_csv_to(path, query, out)
+                streamed = pd.read_csv(io.StringIO(out.getvalue()), dtype=str)['id'].tolist()
+                self.assertEqual(streamed, whole)
+                self.assertEqual(count, len(whole))
+                self.assertTrue(whole)
+
+
+class RowIndexTests(CSVAPITestCase):
+    def test_inch_marks_in_unquoted_fields(self):
+        lines = [f'{k},{k % 30}" ruler' if k % 3 else f'{k},"{k} ""quoted"",\nsplit"' for k in range(2500)]
+        file_id = self.upload('inches.csv', "id,item\n" + "\n".join(lines) + "\n")
+        expected = pd.read_csv(io.StringIO("id,item\n" + "\n".join(lines) + "\n"))
+
+        first = self.read(file_id, page=1, page_size=10)
+        self.assertEqual(first['total_rows'], len(expected))
+        # Later pages seek through the row index
+        page = self.read(file_id, page=3, page_size=1000)
+        self.assertEqual(page['total_rows'], len(expected))
+        self.assertEqual([row['id'] for row in page['data']], list(range(2000, 2500)))
+        self.assertEqual([row['item'] for row in page['data']], expected['item'][2000:].tolist())
+
+    def test_pages_start_at_one(self):
+        file_id = self.upload('pages.csv', "a\n" + "\n".join(map(str, range(3000))) + "\n")
+        for params in ({'page': 0}, {'page': -1}, {'page_size': 0}):
+            with self.subTest(**params):
+                response = self.client.get(f'/api/v1/tools/csv/{file_id}/read/', {'page_size': 10, **params})
+                self.assertEqual(response.status_code, 400)
+
+
+class RowCountTests(SimpleTestCase):
+    CASES = {
+        'quoted newlines': 'id,text\n1,"a\nb"\n2,"\n\n"\n3,"x,\ny\nz"\n',
+        'crlf': 'id,text\r\n1,a\r\n2,"b\r\nc"\r\n3,d',
+        'blank lines': '\n\nid,text\n\n1,a\n\r\n\n2,b\n\n',
+        'escaped quotes': 'id,text\n1,"a""b"\n2,""""\n3,"""\n"""\n4,""\n',
+        'stray quotes': 'id,text\n1,12" ruler\n2,"a\nb"\n3,x"y"z\n4,"q"r\n5,""\n',
+        'no final newline': 'id,text\n1,a\n2,"b\nc"',
+    }
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def test_counts_match_pandas(self):
+        for name, text in self.CASES.items():
+            path = os.path.join(self.directory, 'data.csv')
+            with open(path, 'w', newline='') as f:
+                f.write(text)
+            expected = len(pd.read_csv(path))
+            # Every cut position: segments (and the blocks of the record scan)
+            # start inside quoted fields, between \r and \n, and between "" pairs
+            for size in range(1, len(text) + 1):
+                with self.subTest(name, size=size), mock.patch.object(row_index, 'SCAN_BLOCK_SIZE', size):
+                    self.assertEqual(row_index.count_records(path, workers=len(text)) - 1, expected)
+                    with open(path, 'rb') as f:
+                        starts = sum(len(s) for s in row_index.scan_record_starts(f, block_size=size))
+                    self.assertEqual(starts - 1, expected)
+
+
+class TrigramIndexTests(CSVAPITestCase):
+    def write_csv(self, name, rows):
+        path = os.path.join(self.media_root, name)
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(['text'])
+            writer.writerows([value] for value in rows)
+        return path
+
+    def build(self, path):
+        with spill.scratch_dir('test') as directory:
+            keys, offsets, postings = trigram.build_index(path, 'text', directory, chunksize=500)
+            return keys, offsets, np.array(postings)
+
+    def test_merged_runs_match_a_single_run(self):
+        rng = random.Random(7)
+        words = ['alpha', 'Beta', 'gamma', 'delta', 'Ωmega', 'zeta', 'eta']
+        values = [' '.join(rng.choice(words) for _ in range(rng.randint(0, 6))) or '' for _ in range(3000)]
+        path = self.write_csv('words.csv', values)
+
+        with override_settings(SPILL_MEMORY_BYTES=1 << 30):
+            whole = self.build(path)
+        # The smallest budget cuts many runs and merges them in many windows
+        with override_settings(SPILL_MEMORY_BYTES=1):
+            merged = self.build(path)
+        for a, b in zip(whole, merged):
+            np.testing.assert_array_equal(a, b)
+
+        for needle in ('amm', 'eta', 'a g', 'ωme', 'lph'):
+            expected = [k for k, value in enumerate(values) if needle in value.lower()]
+            found = trigram.lookup(merged, needle)
+            self.assertTrue(set(expected) <= set(found.tolist()), needle)
+
+    def test_empty_column(self):
+        path = self.write_csv('empty.csv', ['', 'ab', ''])
+        keys, offsets, postings = self.build(path)
+        self.assertEqual((len(keys), list(offsets), len(postings)), (0, [0], 0))
+
+
+class FrameCacheTests(CSVAPITestCase):
+    def write(self, name, rows):
+        path = os.path.join(self.media_root, name)
+        pd.DataFrame({'a': range(rows), 'b': [f'v{k}' for k in range(rows)]}).to_csv(path, index=False)
+        return path
+
+    def test_least_recently_used_goes_first(self):
+        paths = [self.write(f'lru{k}.csv', 100) for k in range(3)]
+        frame = pd.read_csv(paths[0])
+        nbytes = int(frame.memory_usage(deep=True).sum())
+        cache = FrameCache(max_bytes=2 * nbytes)
+        loads = []
+
+        def get(path):
+            return cache.get_or_load(path, lambda: loads.append(path) or pd.read_csv(path))
+
+        get(paths[0])
+        get(paths[1])
+        get(paths[0])  # now paths[1] is the oldest
+        get(paths[2])
+        self.assertEqual(cache.stats()['evictions'], 1)
+        get(paths[0])
+        get(paths[2])
+        get(paths[1])
+        self.assertEqual(loads, [paths[0], paths[1], paths[2], paths[1]])
+        self.assertEqual(cache.stats()['bytes'], 2 * nbytes)
+
+    def test_rewritten_file_is_loaded_again(self):
+        path = self.write('rewrite.csv', 10)
+        cache = FrameCache(max_bytes=1 << 20)
+        self.assertEqual(len(cache.get_or_load(path, lambda: pd.read_csv(path))), 10)
+
+        stat = os.stat(path)
+        self.write('rewrite.csv', 12)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+        self.assertEqual(len(cache.get_or_load(path, lambda: pd.read_csv(path))), 12)
+        # Same size, other contents: the modification time tells them apart
+        with open(path, 'r+') as f:
+            f.write('A')
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 2))
+        self.assertEqual(list(cache.get_or_load(path, lambda: pd.read_csv(path)).columns), ['A', 'b'])
+        self.assertEqual(cache.stats()['misses'], 3)
+
+    def test_projections_of_a_cached_frame_are_hits(self):
+        path = self.write('project.csv', 10)
+        cache = FrameCache(max_bytes=1 << 20)
+        with mock.patch.object(services, 'frame_cache', cache):
+            service = CSVService()
+            service.get_dataframe(path)
+            self.assertEqual(list(service.get_dataframe(path, columns=['b']).columns), ['b'])
+        self.assertEqual((cache.stats()['hits'], cache.stats()['misses']), (1, 1))
+
+
+class SketchTests(SimpleTestCase):
+    def test_distinct_count_error(self):
+        rng = np.random.default_rng(1)
+        values = pd.Series(rng.integers(0, 1 << 40, 200_000)).astype(str)
+        sketch, left, right = HyperLogLog(), HyperLogLog(), HyperLogLog()
+        sketch.update(hash_values(values))
+        left.update(hash_values(values[:120_000]))
+        right.update(hash_values(values[80_000:]))
+        left.merge(right)
+        exact = values.nunique()
+        # Three standard errors of 1.04 / sqrt(2**14)
+        for estimate in (sketch.count(), left.count()):
+            self.assertLess(abs(estimate - exact) / exact, 3 * 1.04 / 128)
+        self.assertEqual(left.count(), sketch.count())
+        small = HyperLogLog()
+        small.update(hash_values(pd.Series([str(k % 50) for k in range(1000)])))
+        self.assertEqual(small.count(), 50)
+
+    def test_quantile_rank_error(self):
+        rng = np.random.default_rng(2)
+        values = rng.normal(size=500_000)
+        sketch = QuantileSketch()
+        for chunk in np.array_split(values, 37):
+            part = QuantileSketch(seed=len(chunk))
+            part.update(chunk)
+            sketch.merge(part)
+        self.assertEqual(sketch.count, len(values))
+        qs = (0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99)
+        ranks = np.searchsorted(np.sort(values), sketch.quantiles(qs)) / len(values)
+        np.testing.assert_allclose(ranks, qs, atol=0.01)
+        self.assertLess(sum(len(level) for level in sketch.levels), 20 * sketch.k)
+
+    def test_frequent_items_error(self):
+        rng = np.random.default_rng(3)
+        values = pd.Series(rng.zipf(1.3, 100_000) % 50_000).astype(str)
+        sketch = FrequentItems(capacity=100)
+        for chunk in np.array_split(values, 10):
+            sketch.update(chunk)
+        exact = values.value_counts()
+        bound = len(values) / (sketch.capacity + 1)
+        for value, count in sketch.top(10):
+            self.assertLessEqual(count, exact[value])
+            self.assertLessEqual(exact[value] - count, bound)
+        self.assertEqual([v for v, _ in sketch.top(3)], exact.index[:3].tolist())
+        # Below capacity the counts are exact
+        few = FrequentItems(capacity=100)
+        few.update(values[values.map(len) == 1])
+        self.assertEqual(dict(few.top(100)), values[values.map(len) == 1].value_counts().to_dict())
+
+    def test_integer_columns_report_integers(self):
+        chunk = pd.DataFrame({'i': ['3', '-7', None, '12'], 'f': ['3', '1.5', '2', '0']}, dtype=object)
+        columns = {c['name']: c for c in profile_chunks([chunk], date_formats={})['columns']}
+        self.assertEqual(columns['i']['dtype'], 'integer')
+        self.assertEqual((columns['i']['min'], columns['i']['max']), (-7, 12))
+        self.assertIsInstance(columns['i']['min'], int)
+        self.assertTrue(all(isinstance(q, int) for q in columns['i']['quantiles'].values()))
+        self.assertEqual((columns['f']['min'], columns['f']['max']), (0.0, 3.0))
+        self.assertIsInstance(columns['f']['max'], float)
+
+
+class SchemaTests(TestCase):
+    def test_float_columns_narrow_only_when_text_survives(self):
+        exact = float(np.float32(0.1))  # a float32 value, printed with float64 digits
+        df = schema.narrow(pd.DataFrame({
+            'halves': [0.5, 1.25, np.nan, -3.0],
+            'tenths': [0.1, 0.2, 0.3, 0.4],
+            'widened': [exact, 0.5, 1.0, 2.0],
+            'big': [16777217.0, 1.0, 2.0, 3.0],
+        }))
+        self.assertEqual(df['halves'].dtype, np.float32)
+        for column in ('tenths', 'widened', 'big'):
+            self.assertEqual(df[column].dtype, np.float64, column)
+        self.assertEqual(df['widened'].to_csv(index=False).split()[1], repr(exact))
+
+
+class ConditionalGetTests(CSVAPITestCase):
+    def test_unchanged_document_revalidates_with_304(self):
+        file_id = self.upload('etag.csv', "a,b\n1,2\n")
+        url = f'/api/v1/tools/csv/{file_id}/read/'
+        etag = self.client.get(url, {'page': 1})['ETag']
+
+        self.assertEqual(self.client.get(url, {'page': 1}, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # Other parameters are another representation
+        response = self.client.get(url, {'page': 2}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class ReadTests(CSVAPITestCase):
+    """Sorted, projected and encoded pages of the read endpoint against pandas."""
+
+    def setUp(self):
+        rng = np.random.default_rng(7)
+        self.df = pd.DataFrame({
+            'id': np.arange(60),
+            'group': rng.choice(list('abc'), 60),
+            'n': rng.integers(5, size=60),
+            'x': rng.integers(100, size=60) / 4,
+        })
+        self.file_id = self.upload('read.csv', self.df.to_csv(index=False))
+
+    def test_multi_key_sort_with_a_descending_key(self):
+        expected = self.df.sort_values(['group', 'n'], ascending=[True, False], kind='stable')
+        with mock.patch.object(sorting, 'compute_permutation', wraps=sorting.compute_permutation) as computed:
+            pages = [self.read(self.file_id, sort='group,-n', page=page, page_size=7) for page in range(1, 10)]
+        # Later pages slice the stored permutation instead of sorting again
+        self.assertEqual(computed.call_count, 1)
+        self.assertEqual({page['total_rows'] for page in pages}, {60})
+        self.assertEqual([row['id'] for page in pages for row in page['data']], expected['id'].tolist())
+
+
+    def test_columnar_and_arrow_pages(self):
+        records = self.read(self.file_id, page=2, page_size=25)
+        columnar = self.read(self.file_id, page=2, page_size=25, response_format='columnar')
+        self.assertEqual(columnar['columns'], records['columns'])
+        self.assertEqual(columnar['data'], [[row[c] for row in records['data']] for c in records['columns']])
+
+        response = self.client.get(f'/api/v1/tools/csv/{self.file_id}/read/', {'page': 2, 'page_size': 25, 'response_format': 'arrow'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/vnd.apache.arrow.stream')
+        self.assertEqual((response['X-Total-Rows'], response['X-Page'], response['X-Page-Size']), ('60', '2', '25'))
+        table = pa.ipc.open_stream(response.content).read_all()
+        self.assertEqual(table.schema, pa.schema([('id', pa.int64()), ('group', pa.string()), ('n', pa.int64()), ('x', pa.float64())]))
+        self.assertEqual(table.to_pylist(), records['data'])
+
+    def test_projected_and_windowed_columns(self):
+        url = f'/api/v1/tools/csv/{self.file_id}/read/'
+        # The head of the file, a page found through the row index, and a sorted page
+        for params in ({'page': 1}, {'page': 3}, {'page': 2, 'sort': '-x'}):
+            full = self.read(self.file_id, page_size=20, **params)
+            with self.subTest(**params):
+                projected = self.read(self.file_id, page_size=20, columns='x,id', **params)
+                self.assertEqual(projected['columns'], ['x', 'id'])
+                self.assertEqual(projected['total_columns'], 4)
+                self.assertEqual(projected['data'], [{'x': row['x'], 'id': row['id']} for row in full['data']])
+                repeated = self.client.get(url, {'page_size': 20, 'columns': ['n', 'group'], **params}).json()
+                self.assertEqual(repeated['columns'], ['n', 'group'])
+
+                window = self.read(self.file_id, page_size=20, col_offset=1, col_limit=2, **params)
+                self.assertEqual(window['columns'], ['group', 'n'])
+                self.assertEqual(window['data'], [{'group': row['group'], 'n': row['n']} for row in full['data']])
+                # The window is taken within the named columns
+                inner = self.read(self.file_id, page_size=20, columns='x,n,id', col_offset=1, **params)
+                self.assertEqual(inner['columns'], ['n', 'id'])
+
+        self.assertEqual(self.client.get(url, {'columns': 'id,missing'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'col_offset': -1}).status_code, 400)
+
+class EngineTests(CSVAPITestCase):
+    def test_pyarrow_reads_date_columns_as_text_in_one_pass(self):
+        path = os.path.join(self.media_root, 'dated.csv')
+        with open(path, 'w') as f:
+            f.write("day,at,time,n,x\n")
+            for k in range(2000):
+                f.write(f"2024-01-{k % 28 + 1:02d},2024-01-01 10:{k % 60:02d}:00,10:{k % 60:02d}:00,{k},{k / 4}\n")
+
+        with self.assertNoLogs('apps.tools.csv.engines', level='INFO'):
+            df = engines.read_csv(path, engine='pyarrow')
+        pd.testing.assert_frame_equal(df, pd.read_csv(path))
+
+
+class AggregateTests(CSVAPITestCase):
+    def aggregate(self, file_id, aggregations, expected=201):
+        return self.post('/api/v1/tools/csv/aggregate/', {
+            'file_id': file_id, 'group_by': ['g'], 'aggregations': aggregations,
+        }, expected)
+
+    def test_values_past_the_sample_are_not_dropped(self):
+        rows = [f"a,{k}" for k in range(dates.PROFILE_SAMPLE_ROWS)] + ["a,n/a?", "b,5"]
+        file_id = self.upload('late.csv', "g,v\n" + "\n".join(rows) + "\n")
+
+        error = self.aggregate(file_id, [{'column': 'v', 'func': 'sum'}], expected=400)['error']
+        self.assertIn("'v'", error)
+        # Counting needs no numbers, so it still sees every value
+        result = self.aggregate(file_id, [{'column': 'v', 'func': 'count'}])
+        self.assertEqual(result['group_count'], 2)
+
+    def test_distinct_counts_switch_to_sketches(self):
+        rng = np.random.default_rng(4)
+        df = pd.DataFrame({
+            'g': np.array(['a', 'b', None], dtype=object)[rng.integers(3, size=30_000)],
+            'v': rng.integers(0, 5_000, size=30_000).astype(str).astype(object),
+        })
+        aggregation = aggregate.Aggregation(['g'], [{'column': 'v', 'func': 'distinct_count'}])
+        chunks = [df.iloc[k:k + 2_000] for k in range(0, len(df), 2_000)]
+        exact = df.fillna({'g': '-'}).groupby('g')['v'].nunique()
+
+        def counts():
+            result = aggregate.run_chunks(chunks, aggregation, ['g', 'v']).fillna({'g': '-'})
+            return result.set_index('g')['v_distinct_count'].sort_index()
+
+        self.assertEqual(counts().to_dict(), exact.to_dict())
+        # Past the exact limit each group keeps a fixed-size sketch
+        with mock.patch.object(aggregate, 'DISTINCT_EXACT_PAIRS', 1_000):
+            np.testing.assert_allclose(counts(), exact, rtol=0.05)
+
+    @override_settings(AGGREGATE_PROCESSES=0)
+    def test_no_process_pool_by_default(self):
+        self.assertIsNone(aggregate.process_pool())
+
+
+class JoinTests(CSVAPITestCase):
+    def tables(self):
+        rng = np.random.default_rng(2)
+        keys = np.array(['a', 'b', 'c', 'd', None, np.nan, 'e'], dtype=object)
+        left = pd.DataFrame({
+            'id': [f'l{k}' for k in range(300)],
+            'k1': keys[rng.integers(len(keys), size=300)],
+            'k2': rng.integers(3, size=300).astype(str).astype(object),
+        })
+        right = pd.DataFrame({
+            'rid': [f'r{k}' for k in range(90)],
+            'key': keys[rng.integers(len(keys), size=90)],
+            'k2': rng.integers(4, size=90).astype(str).astype(object),
+        })
+        return left, right
+
+    def joined(self, how, size=25):
+        left, right = self.tables()
+        chunks = lambda df: [df.iloc[k:k + size] for k in range(0, len(df), size)]
+        out = io.StringIO()
+        count = join.HashJoin(['k1', 'k2'], ['key', 'k2'], how).run(
+            chunks(left), chunks(right), list(left.columns), list(right.columns), len(right), out)
+        result = pd.read_csv(io.StringIO(out.getvalue()), dtype=str, keep_default_na=False)
+        self.assertEqual(count, len(result))
+        # Spilled output comes partition by partition; compare as sets of rows
+        return result.sort_values(list(result.columns)).reset_index(drop=True)
+
+    def test_spilled_join_matches_in_memory(self):
+        temp = os.path.join(self.media_root, 'temp')
+        for how in join.HOWS:
+            with self.subTest(how=how):
+                with override_settings(SPILL_MEMORY_BYTES=1 << 30):
+                    expected = self.joined(how)
+                with override_settings(SPILL_MEMORY_BYTES=2_000), \
+                        mock.patch.object(spill, 'partition_count', wraps=spill.partition_count) as partitioned:
+                    spilled = self.joined(how)
+                self.assertTrue(partitioned.called)
+                self.assertTrue(len(expected))
+                pd.testing.assert_frame_equal(spilled, expected)
+                # Blank keys match nothing
+                if 'rid' in expected:
+                    self.assertNotIn('', expected.loc[expected['rid'] != '', 'k1'].tolist())
+                self.assertEqual(os.listdir(temp), [])
+
+
+class DiffTests(CSVAPITestCase):
+    def upload_workbook(self, name, rows):
+        workbook = openpyxl.Workbook()
+        for row in rows:
+            workbook.active.append(row)
+        buffer = io.BytesIO()
+        workbook.save(buffer)
+        response = self.client.post(
+            '/api/v1/documents/upload/',
+            {'file': SimpleUploadedFile(name, buffer.getvalue())},
+            format='multipart',
+        )
+        self.assertEqual(response.status_code, 201, response.content)
+        return response.json()['id']
+
+    def test_header_only_sheet(self):
+        empty = self.upload_workbook('empty.xlsx', [['id', 'name']])
+        full = self.upload_workbook('full.xlsx', [['id', 'name'], [1, 'a'], [2, 'b']])
+
+        summary = self.post('/api/v1/tools/csv/diff/', {'old_file_id': empty, 'new_file_id': full, 'key': ['id']})['summary']
+        self.assertEqual(summary['added'], 2)
+        summary = self.post('/api/v1/tools/csv/diff/', {'old_file_id': full, 'new_file_id': empty, 'key': ['id']})['summary']
+        self.assertEqual(summary['removed'], 2)
+
+    def test_sheets_are_parsed_once(self):
+        from apps.tools.xlsx.services import XLSXService
+
+        old_rows = [['id', 'name', 'n']] + [[k, f'name{k}', k * 2] for k in range(20)]
+        new_rows = [row[:] for row in old_rows[:15]] + [[k, f'name{k}', k * 2] for k in range(20, 23)]
+        new_rows[3][1] = 'renamed'
+        new_rows[7][2] = -1
+        old = self.upload_workbook('old.xlsx', old_rows)
+        new = self.upload_workbook('new.xlsx', new_rows)
+
+        with mock.patch.object(diff, 'BATCH_ROWS', 2), \
+                mock.patch.object(XLSXService, 'iter_text_chunks', autospec=True,
+                                  side_effect=XLSXService.iter_text_chunks) as parsed:
+            result = self.post('/api/v1/tools/csv/diff/', {'old_file_id': old, 'new_file_id': new, 'key': ['id']})
+        self.assertEqual(parsed.call_count, 2)
+        summary = result['summary']
+        self.assertEqual((summary['added'], summary['removed'], summary['changed'], summary['changed_cells']), (3, 6, 2, 2))
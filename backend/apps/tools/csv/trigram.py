@@ -0,0 +1,267 @@
+import hashlib
+import logging
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from apps.tools import sidecar
+from . import engines, row_index, spill
+
+logger = logging.getLogger(__name__)
+
+# Inverted index from lowercase character trigrams to the rows whose cell
+# contains them, one per (document, column). A case-insensitive 'contains'
+# search intersects the posting lists of the needle's trigrams and only
+# parses the candidate rows, which are then checked against the real values:
+# the index may over-select, it never misses a row.
+#
+# A trigram is packed losslessly into one int64 (three 21-bit code points),
+# so keys are the same in every process. Postings are stored as one sorted
+# array memory-mapped on query, addressed through per-key offsets.
+#
+# Builds stay within the spill budget: (gram, row) pairs are sorted in runs
+# of bounded size written to scratch files, then merged one key range at a
+# time straight into a memory-mapped postings file.
+
+GRAM = 3
+BUILD_CHUNK_ROWS = 100_000
+# Columns the upload-time build looks at are those a sample leaves as text
+SAMPLE_ROWS = 1000
+# Memory held per gram while a run is collected (two Python ints in lists,
+# then their arrays and sort order), and while a merge window is sorted
+RUN_BYTES_PER_GRAM = 128
+MERGE_BYTES_PER_GRAM = 64
+MIN_RUN_GRAMS = 10_000
+
+_building = set()
+_building_lock = threading.Lock()
+
+
+def _kinds(column):
+    digest = hashlib.sha1(str(column).encode('utf-8')).hexdigest()[:12]
+    return f"trigram.{digest}.npz", f"trigram.{digest}.postings.npy"
+
+
+def _grams(text):
+    codes = [ord(c) for c in text]
+    return {(a << 42) | (b << 21) | c for a, b, c in zip(codes, codes[1:], codes[2:])}
+
+
+def build_index(file_path, column, directory, chunksize=BUILD_CHUNK_ROWS):
+    """
+    (sorted trigram keys, posting offsets, postings) of one column of a CSV.
+    Runs and the postings are written to `directory`; the postings returned
+    are memory-mapped from there, so it must outlive them.
+    """
+    run_grams = max(MIN_RUN_GRAMS, spill.memory_budget() // RUN_BYTES_PER_GRAM)
+    runs, keys, rows = [], [], []
+    position = 0
+    options = engines.dialect(file_path)
+    for chunk in pd.read_csv(file_path, usecols=[column], dtype=str, chunksize=chunksize, **options):
+        for offset, value in enumerate(chunk[column].str.lower()):
+            if isinstance(value, str) and len(value) >= GRAM:
+                grams = _grams(value)
+                keys.extend(grams)
+                rows.extend([position + offset] * len(grams))
+                if len(keys) >= run_grams:
+                    runs.append(_save_run(directory, len(runs), keys, rows))
+                    keys, rows = [], []
+        position += len(chunk)
+    if keys:
+        runs.append(_save_run(directory, len(runs), keys, rows))
+    return _merge_runs(directory, runs, position)
+
+
+def _save_run(directory, number, keys, rows):
+    """Paths of one run: its grams sorted, with their rows (a stable sort keeps them in order)."""
+    keys = np.array(keys, dtype=np.int64)
+    order = np.argsort(keys, kind='stable')
+    paths = tuple(os.path.join(directory, f"run.{number}.{kind}.npy") for kind in ('keys', 'rows'))
+    np.save(paths[0], keys[order])
+    np.save(paths[1], np.array(rows, dtype=np.int64)[order])
+    return paths
+
+
+def _merge_runs(directory, runs, nrows):
+    runs = [(np.load(keys, mmap_mode='r'), np.load(rows, mmap_mode='r')) for keys, rows in runs]
+    total = sum(len(keys) for keys, _ in runs)
+    dtype = np.uint32 if nrows < 2 ** 32 else np.int64
+    if not total:
+        return np.empty(0, dtype=np.int64), np.zeros(1, dtype=np.int64), np.empty(0, dtype=dtype)
+
+    postings = np.lib.format.open_memmap(os.path.join(directory, 'postings.npy'), mode='w+', dtype=dtype, shape=(total,))
+    step = max(MIN_RUN_GRAMS, spill.memory_budget() // (MERGE_BYTES_PER_GRAM * len(runs)))
+    cursors = [0] * len(runs)
+    unique, counts = [], []
+    written = 0
+    while written < total:
+        # A window ends before the smallest key `step` places ahead in any
+        # run, so no key straddles two windows; runs hold rows in file
+        # order, so concatenating them in order keeps postings sorted.
+        ahead = [keys[c + step] for (keys, _), c in zip(runs, cursors) if c + step < len(keys)]
+        if ahead:
+            bound = min(ahead)
+            ends = [c + int(np.searchsorted(keys[c:], bound)) for (keys, _), c in zip(runs, cursors)]
+            if ends == cursors:
+                # `step` grams of one key: take all of it
+                ends = [c + int(np.searchsorted(keys[c:], bound, side='right')) for (keys, _), c in zip(runs, cursors)]
+        else:
+            ends = [len(keys) for keys, _ in runs]
+
+        window_keys = np.concatenate([keys[c:e] for (keys, _), c, e in zip(runs, cursors, ends)])
+        window_rows = np.concatenate([rows[c:e] for (_, rows), c, e in zip(runs, cursors, ends)])
+        order = np.argsort(window_keys, kind='stable')
+        postings[written:written + len(order)] = window_rows[order]
+        window_unique, window_counts = np.unique(window_keys, return_counts=True)
+        unique.append(window_unique)
+        counts.append(window_counts)
+        written += len(order)
+        cursors = ends
+
+    counts = np.concatenate(counts)
+    offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+    return np.concatenate(unique), offsets, postings
+
+
+def save_index(file_path, column, index):
+    keys, offsets, postings = index
+    signature = np.array(sidecar.source_signature(file_path), dtype=np.int64)
+    meta_kind, postings_kind = _kinds(column)
+
+    def write_postings(tmp_path):
+        with open(tmp_path, 'wb') as f:
+            np.save(f, postings)
+
+    def write_meta(tmp_path):
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, signature=signature, keys=keys, offsets=offsets)
+
+    # Postings first: the metadata, written last, is what marks the index valid
+    sidecar.write_atomic(sidecar.sidecar_path(file_path, postings_kind), write_postings)
+    sidecar.write_atomic(sidecar.sidecar_path(file_path, meta_kind), write_meta)
+
+
+def load_index(file_path, column):
+    """The stored index of a column, or None if it is missing or stale."""
+    meta_kind, postings_kind = _kinds(column)
+    try:
+        with np.load(sidecar.sidecar_path(file_path, meta_kind)) as stored:
+            if list(stored['signature']) != sidecar.source_signature(file_path):
+                return None
+            keys, offsets = stored['keys'], stored['offsets']
+        postings = np.load(sidecar.sidecar_path(file_path, postings_kind), mmap_mode='r')
+    except (OSError, KeyError, ValueError):
+        return None
+    if len(postings) != offsets[-1]:
+        return None
+    return keys, offsets, postings
+
+
+def _build_and_save(file_path, column):
+    with spill.scratch_dir('trigram') as directory:
+        save_index(file_path, column, build_index(file_path, column, directory))
+
+
+def ensure_index(file_path, column):
+    index = load_index(file_path, column)
+    if index is None:
+        _build_and_save(file_path, column)
+        index = load_index(file_path, column)
+    return index
+
+
+def text_columns(file_path):
+    sample = pd.read_csv(file_path, nrows=SAMPLE_ROWS, **engines.dialect(file_path))
+    return [c for c in sample.columns if sample[c].dtype == object]
+
+
+def build_in_background(file_path, columns=None):
+    """
+    Build the indexes of `columns` (default: the text columns) on a daemon
+    thread. Requests keep scanning until an index is in place.
+    """
+    def run():
+        try:
+            for column in columns if columns is not None else text_columns(file_path):
+                key = (str(file_path), column)
+                with _building_lock:
+                    if key in _building:
+                        continue
+                    _building.add(key)
+                try:
+                    if load_index(file_path, column) is None:
+                        _build_and_save(file_path, column)
+                finally:
+                    with _building_lock:
+                        _building.discard(key)
+        except Exception as e:
+            # The document may be deleted or replaced while we work
+            logger.info("Trigram index of %s not built: %s", file_path, e)
+
+    threading.Thread(target=run, daemon=True).start()
+
+
+def _postings(index, gram):
+    keys, offsets, postings = index
+    k = int(np.searchsorted(keys, gram))
+    if k == len(keys) or keys[k] != gram:
+        return np.empty(0, dtype=np.int64)
+    return postings[offsets[k]:offsets[k + 1]]
+
+
+def lookup(index, needle):
+    """Sorted candidate rows whose value may contain `needle` (case-insensitive)."""
+    lists = sorted((_postings(index, g) for g in _grams(needle.lower())), key=len)
+    rows = np.asarray(lists[0], dtype=np.int64)
+    for other in lists[1:]:
+        if not len(rows):
+            break
+        rows = np.intersect1d(rows, other, assume_unique=True)
+    return rows
+
+
+def _indexable_leaves(node):
+    """The case-insensitive 'contains' leaves every match must satisfy."""
+    if not isinstance(node, dict):
+        return []
+    if 'and' in node and isinstance(node['and'], list):
+        return [leaf for child in node['and'] for leaf in _indexable_leaves(child)]
+    if (
+        'column' in node
+        and node.get('op', 'contains') == 'contains'
+        and not node.get('case_sensitive', False)
+        and node.get('value') is not None
+        and len(str(node['value'])) >= GRAM
+    ):
+        return [node]
+    return []
+
+
+def candidates(file_path, query):
+    """
+    Candidate rows of file_path for a compiled query, or None when no index
+    applies (no usable 'contains' condition, or its index isn't built yet;
+    missing indexes are then started in the background).
+    """
+    leaves = _indexable_leaves(query.node)
+    if not leaves:
+        return None
+    rows, missing = None, []
+    for leaf in leaves:
+        index = load_index(file_path, leaf['column'])
+        if index is None:
+            missing.append(leaf['column'])
+            continue
+        found = lookup(index, str(leaf['value']))
+        rows = found if rows is None else np.intersect1d(rows, found, assume_unique=True)
+    if missing:
+        build_in_background(file_path, list(dict.fromkeys(missing)))
+    return rows
+
+
+def read_candidates(file_path, rows, columns):
+    """The candidate rows as text, in file order."""
+    index = row_index.get_row_index(file_path)
+    return row_index.read_positions(file_path, index, rows, columns, dtype=str)
@@ -1,8 +1,20 @@
 from django.urls import path, re_path
-from .views import CSVReadView, CSVFilterView, CSVRemoveView
+from .views import (
+    CSVReadView, CSVFilterView, CSVAggregateView, CSVJoinView, CSVDiffView, CSVRemoveView, CSVBatchRemoveView, CSVCacheStatsView,
+    CSVExportView, CSVMaterializeView, CSVProfileView, CSVEngineView,
+)
 
 urlpatterns = [
     path('<uuid:file_id>/read/', CSVReadView.as_view(), name='csv-read'),
+    path('<uuid:file_id>/export/', CSVExportView.as_view(), name='csv-export'),
+    path('<uuid:file_id>/profile/', CSVProfileView.as_view(), name='csv-profile'),
+    path('<uuid:file_id>/engine/', CSVEngineView.as_view(), name='csv-engine'),
+    path('<uuid:file_id>/materialize/', CSVMaterializeView.as_view(), name='csv-materialize'),
     re_path(r'^filter/?$', CSVFilterView.as_view(), name='csv-filter'),
+    re_path(r'^aggregate/?$', CSVAggregateView.as_view(), name='csv-aggregate'),
+    re_path(r'^join/?$', CSVJoinView.as_view(), name='csv-join'),
+    re_path(r'^diff/?$', CSVDiffView.as_view(), name='csv-diff'),
     re_path(r'^remove/?$', CSVRemoveView.as_view(), name='csv-remove'),
+    re_path(r'^batch-remove/?$', CSVBatchRemoveView.as_view(), name='csv-batch-remove'),
+    re_path(r'^cache/stats/?$', CSVCacheStatsView.as_view(), name='csv-cache-stats'),
 ]
@@ -1,22 +1,86 @@
+import json
+import os
+from django.core.files.base import ContentFile
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from django.shortcuts import get_object_or_404
 from apps.documents.models import Document
+from apps.tools.conditional import conditional_get
 from .services import CSVService
+from .formats import ARROW_STREAM_TYPE, RESPONSE_FORMATS, arrow_response_headers
+from .frame_cache import frame_cache
+from .query import compile_query, simple_query
+from . import aggregate, engines, join, overlay
 from drf_spectacular.utils import extend_schema, OpenApiParameter
 from rest_framework import serializers
 
 class CSVReadSerializer(serializers.Serializer):
     file_id = serializers.UUIDField()
-    page = serializers.IntegerField(default=1)
-    page_size = serializers.IntegerField(default=50)
+    page = serializers.IntegerField(default=1, min_value=1)
+    page_size = serializers.IntegerField(default=50, min_value=1)
+    sort = serializers.CharField(required=False, help_text="Comma-separated columns, '-' prefix for descending, e.g. 'name,-price'")
+    response_format = serializers.ChoiceField(choices=RESPONSE_FORMATS, default='records', help_text="'columnar' returns one array per column; 'arrow' an Arrow IPC stream")
+    columns = serializers.CharField(required=False, help_text="Columns to return: repeat the parameter, or give one comma-separated list")
+    col_offset = serializers.IntegerField(default=0, help_text="First column of the window (within 'columns' when given)")
+    col_limit = serializers.IntegerField(required=False, help_text="Number of columns in the window")
 
 class CSVFilterSerializer(serializers.Serializer):
     file_id = serializers.UUIDField()
-    column = serializers.CharField()
-    value = serializers.CharField()
+    # Single condition...
+    column = serializers.CharField(required=False)
+    value = serializers.CharField(required=False)
     operator = serializers.ChoiceField(choices=['contains', 'equals', 'startswith'], default='contains')
+    # ...or an and/or tree of typed conditions, see query.py
+    query = serializers.JSONField(required=False)
+    # Record the edit on top of the source instead of writing a full copy
+    lazy = serializers.BooleanField(default=False)
+
+    def validate(self, attrs):
+        if 'query' in attrs:
+            try:
+                compile_query(attrs['query'])
+            except ValueError as e:
+                raise serializers.ValidationError({'query': str(e)})
+        elif not (attrs.get('column') and 'value' in attrs):
+            raise serializers.ValidationError("Provide either 'query' or 'column' and 'value'.")
+        return attrs
+
+    def raw_query(self):
+        """The query tree, built from the single condition when no 'query' was sent."""
+        data = self.validated_data
+        if 'query' in data:
+            return data['query']
+        return simple_query(data['column'], data['value'], data['operator'])
+
+class CSVAggregationSerializer(serializers.Serializer):
+    column = serializers.CharField(required=False, help_text="Value column; omit for 'count' to count rows")
+    func = serializers.ChoiceField(choices=aggregate.FUNCS)
+
+    def validate(self, attrs):
+        if attrs['func'] != 'count' and not attrs.get('column'):
+            raise serializers.ValidationError(f"'{attrs['func']}' needs a column.")
+        return attrs
+
+class CSVAggregateSerializer(serializers.Serializer):
+    file_id = serializers.UUIDField()
+    group_by = serializers.ListField(child=serializers.CharField(), min_length=1)
+    aggregations = serializers.ListField(child=CSVAggregationSerializer(), min_length=1)
+
+class CSVJoinSerializer(serializers.Serializer):
+    left_file_id = serializers.UUIDField()
+    right_file_id = serializers.UUIDField()
+    left_on = serializers.ListField(child=serializers.CharField(), min_length=1)
+    right_on = serializers.ListField(child=serializers.CharField(), required=False, help_text="Defaults to left_on")
+    how = serializers.ChoiceField(choices=join.HOWS, default='inner')
+
+class CSVDiffSerializer(serializers.Serializer):
+    old_file_id = serializers.UUIDField()
+    new_file_id = serializers.UUIDField()
+    key = serializers.ListField(child=serializers.CharField(), required=False, help_text="Primary-key column(s); rows compare as a whole without")
+    old_sheet = serializers.CharField(required=False, allow_null=True, default=None)
+    new_sheet = serializers.CharField(required=False, allow_null=True, default=None)
 
 class CSVRemoveSerializer(serializers.Serializer):
     file_id = serializers.UUIDField()
@@ -27,9 +91,81 @@ class CSVRemoveSerializer(serializers.Serializer):
     date_val = serializers.CharField(required=False, allow_blank=True) # for date
     start_date = serializers.CharField(required=False, allow_blank=True) # for date_range
     end_date = serializers.CharField(required=False, allow_blank=True) # for date_range
+    lazy = serializers.BooleanField(default=False)
+
+class CSVDateTargetSerializer(serializers.Serializer):
+    column = serializers.CharField(required=False, allow_blank=True)
+    date = serializers.CharField()
+
+class CSVDateRangeTargetSerializer(serializers.Serializer):
+    column = serializers.CharField(required=False, allow_blank=True)
+    start_date = serializers.CharField()
+    end_date = serializers.CharField()
+
+class CSVBatchRemoveSerializer(serializers.Serializer):
+    file_id = serializers.UUIDField()
+    row_indices = serializers.ListField(child=serializers.IntegerField(min_value=0), required=False, default=list)
+    columns = serializers.ListField(child=serializers.CharField(), required=False, default=list)
+    dates = serializers.ListField(child=CSVDateTargetSerializer(), required=False, default=list)
+    date_ranges = serializers.ListField(child=CSVDateRangeTargetSerializer(), required=False, default=list)
+    lazy = serializers.BooleanField(default=False)
+
+def save_streamed_csv(filename, write):
+    """
+    Create a CSV Document whose file is written in place by write(text_stream),
+    without buffering the content in memory first. Returns (document, result of write).
+    """
+    new_doc = Document.objects.create(
+        filename=filename,
+        file_type='csv',
+        processing_status='processing'
+    )
+    storage = new_doc.file.storage
+    name = storage.get_available_name(new_doc.file.field.generate_filename(new_doc, filename))
+    path = storage.path(name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    try:
+        with open(path, 'w', newline='', encoding='utf-8') as out:
+            result = write(out)
+    except Exception:
+        if os.path.exists(path):
+            os.remove(path)
+        new_doc.delete()
+        raise
+
+    new_doc.file.name = name
+    new_doc.file_size = os.path.getsize(path)
+    new_doc.processing_status = 'completed'
+    new_doc.save()
+    return new_doc, result
+
+def save_overlay(source_doc, filename, operations):
+    """
+    Create a CSV Document that records `operations` on top of source_doc (a
+    CSV or another overlay) instead of copying the data; see overlay.py.
+    Returns (document, number of rows it shows).
+    """
+    manifest = overlay.extend_manifest(source_doc.file.path, source_doc.file.name, operations)
+    new_doc = Document.objects.create(
+        filename=filename,
+        file_type='csv',
+        processing_status='completed',
+        # The overlay is unreadable once its base is gone, so it can't outlive it
+        expires_at=source_doc.expires_at,
+    )
+    # Fixed short name: long derived filenames would get truncated by the storage
+    new_doc.file.save(overlay.MANIFEST_NAME, ContentFile(json.dumps(manifest).encode('utf-8')))
+    return new_doc, overlay.row_count(new_doc.file.path, CSVService())
+
+def supports_overlay(service, doc):
+    return not service.is_excel(doc.file.path)
+
+def overlay_date_op(column, start_date, end_date):
+    return {'type': 'remove_dates', 'column': column or None, 'start': start_date, 'end': end_date}
 
 class CSVReadView(APIView):
     @extend_schema(parameters=[CSVReadSerializer])
+    @conditional_get
     def get(self, request, file_id):
         doc = get_object_or_404(Document, pk=file_id)
         if doc.file_type not in ['csv', 'xlsx']: # Support both for preview
@@ -38,11 +174,26 @@ class CSVReadView(APIView):
         try:
             page = int(request.query_params.get('page', 1))
             page_size = int(request.query_params.get('page_size', 50))
+            sort = request.query_params.get('sort')
+            response_format = request.query_params.get('response_format', 'records')
+            columns = request.query_params.getlist('columns')
+            if len(columns) == 1:
+                columns = [c.strip() for c in columns[0].split(',') if c.strip()]
+            col_offset = int(request.query_params.get('col_offset', 0))
+            col_limit = request.query_params.get('col_limit')
+            col_limit = int(col_limit) if col_limit is not None else None
             
             service = CSVService()
-            result = service.read_csv(doc.file.path, page=page, page_size=page_size)
+            result = service.read_csv(
+                doc.file.path, page=page, page_size=page_size, sort=sort, response_format=response_format,
+                columns=columns or None, col_offset=col_offset, col_limit=col_limit,
+            )
+            if response_format == 'arrow':
+                return HttpResponse(result['data'], content_type=ARROW_STREAM_TYPE, headers=arrow_response_headers(result))
             
             return Response(result)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
              return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -52,27 +203,42 @@ class CSVFilterView(APIView):
         serializer = CSVFilterSerializer(data=request.data)
         if serializer.is_valid():
             file_id = serializer.validated_data['file_id']
-            column = serializer.validated_data['column']
-            value = serializer.validated_data['value']
+            raw_query = serializer.raw_query()
+            try:
+                query = compile_query(raw_query)
+            except ValueError as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
             
             doc = get_object_or_404(Document, pk=file_id)
             service = CSVService()
+            new_filename = f"filtered_{doc.filename}"
             
             try:
-                # Assuming filter saves to new file or returns simplified data
-                # For v1, let's return filtered data preview
-                df = service.filter_csv(doc.file.path, column, value)
+                if serializer.validated_data['lazy'] and supports_overlay(service, doc):
+                    columns = service.read_header(doc.file.path)
+                    missing = [c for c in query.columns if c not in columns]
+                    if missing:
+                        return Response({'error': f"Unknown column(s): {', '.join(missing)}"}, status=status.HTTP_400_BAD_REQUEST)
+                    new_doc, match_count = save_overlay(doc, new_filename, [{'type': 'filter', 'query': raw_query}])
+                    return Response({'id': new_doc.id, 'match_count': match_count}, status=status.HTTP_201_CREATED)
+
+                if not service.is_excel(doc.file.path):
+                    # Stream matches straight into the new document's file
+                    new_doc, match_count = save_streamed_csv(
+                        new_filename,
+                        lambda out: service.filter_csv_to(doc.file.path, query, out),
+                    )
+                    return Response({'id': new_doc.id, 'match_count': match_count}, status=status.HTTP_201_CREATED)
+
+                df = service.filter_csv(doc.file.path, query)
                 
                 # Setup download (saving as new document)
-                import os
-                from django.core.files import File
                 from io import StringIO
                 
                 output_buffer = StringIO()
                 df.to_csv(output_buffer, index=False)
                 output_buffer.seek(0)
                 
-                new_filename = f"filtered_{doc.filename}"
                 new_doc = Document.objects.create(
                     filename=new_filename,
                     file_type='csv',
@@ -83,11 +249,115 @@ class CSVFilterView(APIView):
                 
                 return Response({'id': new_doc.id, 'match_count': len(df)}, status=status.HTTP_201_CREATED)
                 
+            except ValueError as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
             except Exception as e:
                 return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+class CSVAggregateView(APIView):
+    """Group rows and compute sum/count/mean/min/max/distinct_count per group, saved as a new CSV"""
+    @extend_schema(request=CSVAggregateSerializer)
+    def post(self, request):
+        serializer = CSVAggregateSerializer(data=request.data)
+        if serializer.is_valid():
+            doc = get_object_or_404(Document, pk=serializer.validated_data['file_id'])
+            service = CSVService()
+            if doc.file_type != 'csv' or service.is_excel(doc.file.path):
+                return Response({'error': 'Aggregation needs a CSV document'}, status=status.HTTP_400_BAD_REQUEST)
+
+            base, _ = os.path.splitext(doc.filename)
+            try:
+                new_doc, group_count = save_streamed_csv(
+                    f"{base}_aggregated.csv",
+                    lambda out: service.aggregate_to(
+                        doc.file.path,
+                        serializer.validated_data['group_by'],
+                        serializer.validated_data['aggregations'],
+                        out,
+                    ),
+                )
+                return Response({'id': new_doc.id, 'group_count': group_count}, status=status.HTTP_201_CREATED)
+            except ValueError as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            except Exception as e:
+                return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+class CSVJoinView(APIView):
+    """Join two CSV documents on key columns (inner, left or anti), saved as a new CSV"""
+    @extend_schema(request=CSVJoinSerializer)
+    def post(self, request):
+        serializer = CSVJoinSerializer(data=request.data)
+        if serializer.is_valid():
+            data = serializer.validated_data
+            left = get_object_or_404(Document, pk=data['left_file_id'])
+            right = get_object_or_404(Document, pk=data['right_file_id'])
+            service = CSVService()
+            for doc in (left, right):
+                if doc.file_type != 'csv' or service.is_excel(doc.file.path):
+                    return Response({'error': 'Joins need two CSV documents'}, status=status.HTTP_400_BAD_REQUEST)
+
+            left_base, _ = os.path.splitext(left.filename)
+            right_base, _ = os.path.splitext(right.filename)
+            try:
+                new_doc, row_count = save_streamed_csv(
+                    f"{left_base}_{data['how']}_join_{right_base}.csv",
+                    lambda out: service.join_to(
+                        left.file.path,
+                        right.file.path,
+                        data['left_on'],
+                        data.get('right_on') or data['left_on'],
+                        data['how'],
+                        out,
+                    ),
+                )
+                return Response({'id': new_doc.id, 'row_count': row_count}, status=status.HTTP_201_CREATED)
+            except ValueError as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            except Exception as e:
+                return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+class CSVDiffView(APIView):
+    """Row-level diff of two CSV/XLSX documents, saved as a CSV of changes plus summary counts"""
+    @extend_schema(request=CSVDiffSerializer)
+    def post(self, request):
+        serializer = CSVDiffSerializer(data=request.data)
+        if serializer.is_valid():
+            data = serializer.validated_data
+            old = get_object_or_404(Document, pk=data['old_file_id'])
+            new = get_object_or_404(Document, pk=data['new_file_id'])
+            for doc in (old, new):
+                if doc.file_type not in ['csv', 'xlsx', 'xls']:
+                    return Response({'error': 'Diffs need CSV or Excel documents'}, status=status.HTTP_400_BAD_REQUEST)
+
+            service = CSVService()
+            old_base, _ = os.path.splitext(old.filename)
+            new_base, _ = os.path.splitext(new.filename)
+            try:
+                new_doc, summary = save_streamed_csv(
+                    f"diff_{old_base}_{new_base}.csv",
+                    lambda out: service.diff_to(
+                        old.file.path,
+                        new.file.path,
+                        out,
+                        key=data.get('key'),
+                        old_sheet=data['old_sheet'],
+                        new_sheet=data['new_sheet'],
+                    ),
+                )
+                return Response({'id': new_doc.id, 'summary': summary}, status=status.HTTP_201_CREATED)
+            except (ValueError, KeyError) as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            except Exception as e:
+                return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
 class CSVRemoveView(APIView):
     @extend_schema(request=CSVRemoveSerializer)
     def post(self, request):
@@ -112,11 +382,22 @@ class CSVRemoveView(APIView):
                         target_data['start_date'] = serializer.validated_data.get('start_date')
                         target_data['end_date'] = serializer.validated_data.get('end_date')
 
+                if serializer.validated_data['lazy'] and supports_overlay(service, doc):
+                    if remove_type == 'row':
+                        row = target_data['row_index']
+                        operations = [{'type': 'drop_rows', 'rows': [row]}] if row is not None else []
+                    elif remove_type == 'column':
+                        operations = [{'type': 'drop_columns', 'columns': [target_data['column']]}]
+                    elif remove_type == 'date':
+                        operations = [overlay_date_op(target_data['column'], target_data['date'], target_data['date'])]
+                    else:
+                        operations = [overlay_date_op(target_data['column'], target_data['start_date'], target_data['end_date'])]
+                    new_doc, match_count = save_overlay(doc, f"removed_{remove_type}_{doc.filename}", operations)
+                    return Response({'id': new_doc.id, 'match_count': match_count}, status=status.HTTP_201_CREATED)
+
                 df = service.remove_data(doc.file.path, remove_type, target_data)
                 
                 # Setup download (saving as new document)
-                import os
-                from django.core.files import File
                 from io import StringIO
                 
                 output_buffer = StringIO()
@@ -140,3 +421,149 @@ class CSVRemoveView(APIView):
                 return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+class CSVProfileView(APIView):
+    """Per-column null count, dtype, min/max, distinct count, quantiles and top values"""
+    @extend_schema(parameters=[OpenApiParameter('sheet_name', str, description="Sheet of an XLSX file (default: the first)")])
+    def get(self, request, file_id):
+        doc = get_object_or_404(Document, pk=file_id)
+        if doc.file_type not in ['csv', 'xlsx', 'xls']:
+            return Response({'error': 'Invalid file type'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            result = CSVService().profile(doc.file.path, request.query_params.get('sheet_name'))
+            return Response(result)
+        except (KeyError, ValueError) as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+class CSVEngineSerializer(serializers.Serializer):
+    engine = serializers.ChoiceField(choices=list(engines.ENGINES) + [engines.AUTO])
+
+class CSVEngineView(APIView):
+    """Parser engine and sniffed dialect of a CSV document; POST overrides the engine"""
+    def get(self, request, file_id):
+        doc = get_object_or_404(Document, pk=file_id)
+        if doc.file_type != 'csv' or overlay.is_overlay(doc.file.path):
+            return Response({'error': 'Invalid file type'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            return Response({
+                'engine': engines.choose_engine(doc.file.path),
+                'override': engines.get_override(doc.file.path),
+                'dialect': engines.dialect(doc.file.path),
+            })
+        except Exception as e:
+            return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    @extend_schema(request=CSVEngineSerializer)
+    def post(self, request, file_id):
+        serializer = CSVEngineSerializer(data=request.data)
+        if serializer.is_valid():
+            doc = get_object_or_404(Document, pk=file_id)
+            if doc.file_type != 'csv' or overlay.is_overlay(doc.file.path):
+                return Response({'error': 'Invalid file type'}, status=status.HTTP_400_BAD_REQUEST)
+            engines.set_override(doc.file.path, serializer.validated_data['engine'])
+            return Response({'engine': engines.choose_engine(doc.file.path), 'override': engines.get_override(doc.file.path)})
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+class CSVCacheStatsView(APIView):
+    """Hit/miss/eviction counters of this worker's DataFrame cache"""
+    def get(self, request):
+        return Response(frame_cache.stats())
+
+class CSVBatchRemoveView(APIView):
+    """Remove many rows, columns and dates at once, producing a single new document"""
+    @extend_schema(request=CSVBatchRemoveSerializer)
+    def post(self, request):
+        serializer = CSVBatchRemoveSerializer(data=request.data)
+        if serializer.is_valid():
+            data = serializer.validated_data
+            doc = get_object_or_404(Document, pk=data['file_id'])
+            service = CSVService()
+            
+            try:
+                if data['lazy'] and supports_overlay(service, doc):
+                    before = service.count_rows(doc.file.path)
+                    operations = []
+                    if data['row_indices']:
+                        operations.append({'type': 'drop_rows', 'rows': sorted(set(data['row_indices']))})
+                    for item in data['dates']:
+                        operations.append(overlay_date_op(item.get('column'), item['date'], item['date']))
+                    for item in data['date_ranges']:
+                        operations.append(overlay_date_op(item.get('column'), item['start_date'], item['end_date']))
+                    if data['columns']:
+                        operations.append({'type': 'drop_columns', 'columns': data['columns']})
+                    new_doc, match_count = save_overlay(doc, f"removed_batch_{doc.filename}", operations)
+                    return Response({
+                        'id': new_doc.id,
+                        'match_count': match_count,
+                        'removed_rows': before - match_count,
+                    }, status=status.HTTP_201_CREATED)
+
+                df, removed_rows = service.remove_batch(
+                    doc.file.path,
+                    row_indices=data['row_indices'],
+                    columns=data['columns'],
+                    dates=data['dates'],
+                    date_ranges=data['date_ranges'],
+                )
+                new_doc, _ = save_streamed_csv(
+                    f"removed_batch_{doc.filename}",
+                    lambda out: df.to_csv(out, index=False),
+                )
+                return Response({
+                    'id': new_doc.id,
+                    'match_count': len(df),
+                    'removed_rows': removed_rows,
+                }, status=status.HTTP_201_CREATED)
+            except Exception as e:
+                return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+class CSVExportView(APIView):
+    """Download a CSV document, writing out overlay edits on the fly"""
+    def get(self, request, file_id):
+        doc = get_object_or_404(Document, pk=file_id)
+        if doc.file_type != 'csv':
+            return Response({'error': 'Invalid file type'}, status=status.HTTP_400_BAD_REQUEST)
+
+        if not overlay.is_overlay(doc.file.path):
+            return FileResponse(open(doc.file.path, 'rb'), as_attachment=True, filename=doc.filename)
+
+        service = CSVService()
+        try:
+            chunks = service.iter_csv_text(doc.file.path)
+            response = StreamingHttpResponse(chunks, content_type='text/csv')
+            response['Content-Disposition'] = f'attachment; filename="{doc.filename}"'
+            return response
+        except Exception as e:
+            return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+class CSVMaterializeView(APIView):
+    """Replace an overlay document's edit log with the full CSV it describes"""
+    def post(self, request, file_id):
+        doc = get_object_or_404(Document, pk=file_id)
+        if not overlay.is_overlay(doc.file.path):
+            return Response({'id': doc.id, 'url': doc.file.url})
+
+        service = CSVService()
+        manifest_path = doc.file.path
+        storage = doc.file.storage
+        name = storage.get_available_name(doc.file.field.generate_filename(doc, doc.filename))
+        path = storage.path(name)
+        try:
+            with open(path, 'w', newline='', encoding='utf-8') as out:
+                for text in service.iter_csv_text(manifest_path):
+                    out.write(text)
+        except Exception as e:
+            if os.path.exists(path):
+                os.remove(path)
+            return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        doc.file.name = name
+        doc.file_size = os.path.getsize(path)
+        doc.save()
+        os.remove(manifest_path)
+        return Response({'id': doc.id, 'url': doc.file.url})
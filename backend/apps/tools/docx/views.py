@@ -3,6 +3,7 @@ from rest_framework.response import Response
 from rest_framework import status
 from django.shortcuts import get_object_or_404
 from apps.documents.models import Document
+from apps.tools.conditional import conditional_get
 from .services import DocxService
 from drf_spectacular.utils import extend_schema
 from rest_framework import serializers
@@ -31,6 +32,7 @@ class DocxRemoveImageSerializer(serializers.Serializer):
     image_id = serializers.CharField(help_text="Relationship ID of image to remove")
 
 class DocxPreviewView(APIView):
+    @conditional_get
     def get(self, request, file_id):
         doc = get_object_or_404(Document, pk=file_id)
         if doc.file_type != 'docx':
@@ -209,6 +211,7 @@ class DocxRemoveImageView(APIView):
 
 class DocxPagesView(APIView):
     """Get page information for a DOCX file"""
+    @conditional_get
     def get(self, request, file_id):
         doc = get_object_or_404(Document, pk=file_id)
         
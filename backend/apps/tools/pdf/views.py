@@ -9,6 +9,7 @@ from django.conf import settings
 from django.shortcuts import get_object_or_404
 from django.core.files import File
 from apps.documents.models import Document
+from apps.tools.conditional import conditional_get
 from apps.documents.serializers import DocumentSerializer
 from .services import PDFService
 from .converters import convert_pdf, convert_to_pdf, TO_PDF_SOURCE_EXTS
@@ -304,6 +305,7 @@ class PDFToPDFView(APIView):
 
 class PDFTextSpansView(APIView):
     """Text spans (with geometry) for one page, for the inline text editor."""
+    @conditional_get
     def get(self, request, file_id):
         doc = get_object_or_404(Document, pk=file_id)
         if doc.file_type != 'pdf':
@@ -361,6 +363,7 @@ class PDFEditTextView(APIView):
 
 class PDFPagesView(APIView):
     """Get page information for a PDF file"""
+    @conditional_get
     def get(self, request, file_id):
         doc = get_object_or_404(Document, pk=file_id)
         
@@ -0,0 +1,67 @@
+import json
+import os
+import shutil
+import threading
+
+# Derived data (row indexes, caches, profiles, ...) lives in a hidden directory
+# beside the document's own file. Every worker sees the same copy, and it goes
+# away together with the document.
+SIDECAR_DIR = '.sidecar'
+
+
+def sidecar_dir(file_path):
+    return os.path.join(os.path.dirname(str(file_path)), SIDECAR_DIR)
+
+
+def sidecar_path(file_path, kind):
+    """Path of the `kind` sidecar of file_path, e.g. '.sidecar/data.csv.rowindex.npz'."""
+    return os.path.join(sidecar_dir(file_path), f"{os.path.basename(str(file_path))}.{kind}")
+
+
+def source_signature(file_path):
+    """(size, mtime_ns) of the source file; a sidecar is stale once this changes."""
+    st = os.stat(file_path)
+    return [st.st_size, st.st_mtime_ns]
+
+
+def write_atomic(path, write):
+    """Call write(tmp_path) and move the result into place in one step.
+
+    Several gunicorn workers may build the same sidecar at once; readers must
+    never see a half-written file.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def load_json(file_path, kind):
+    """Return the payload of a JSON sidecar, or None if it is missing or stale."""
+    path = sidecar_path(file_path, kind)
+    try:
+        with open(path) as f:
+            stored = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if stored.get('signature') != source_signature(file_path):
+        return None
+    return stored.get('payload')
+
+
+def save_json(file_path, kind, payload):
+    stored = {'signature': source_signature(file_path), 'payload': payload}
+
+    def write(tmp_path):
+        with open(tmp_path, 'w') as f:
+            json.dump(stored, f)
+
+    write_atomic(sidecar_path(file_path, kind), write)
+
+
+def remove_sidecars(file_path):
+    shutil.rmtree(sidecar_dir(file_path), ignore_errors=True)
@@ -1,6 +1,18 @@
+import datetime
+import numpy as np
 import openpyxl
 import pandas as pd
 import os
+from apps.tools.csv import columnar, formats
+from apps.tools.csv.frame_cache import frame_cache
+
+def _cell_text(value):
+    if value is None:
+        return None
+    if isinstance(value, datetime.datetime):
+        return value.isoformat(sep=' ')
+    return str(value)
+
 
 class XLSXService:
     def get_workbook_structure(self, file_path):
@@ -8,25 +20,32 @@ class XLSXService:
         wb = openpyxl.load_workbook(file_path, read_only=True)
         return wb.sheetnames
 
-    def read_sheet(self, file_path, sheet_name=None, page=1, page_size=50):
+    def read_sheet(self, file_path, sheet_name=None, page=1, page_size=50, response_format='records'):
         """Reads a specific sheet with pagination."""
         # Using pandas for efficient reading and JSON conversion
         # openpyxl is better for structure/editing, pandas for data reading
         
-        xls = pd.ExcelFile(file_path)
         if not sheet_name:
-            sheet_name = xls.sheet_names[0]
+            with pd.ExcelFile(file_path) as xls:
+                sheet_name = xls.sheet_names[0]
             
-        # Read only necessary rows if possible (pd.read_excel doesn't support skip/limit well for random access without reading all, 
-        # but we can use skiprows/nrows if we know total from metadata. For v1, read all is okay for small files)
-        
-        df = pd.read_excel(xls, sheet_name=sheet_name)
+        # pd.read_excel has no random access, so the parsed sheet is kept in
+        # memory (and in a columnar sidecar) for the following page requests.
+        df = frame_cache.get_or_load(
+            file_path,
+            lambda: columnar.load(
+                file_path,
+                lambda path: pd.read_excel(path, sheet_name=sheet_name),
+                sheet=sheet_name,
+            ),
+            sheet=sheet_name,
+        )
         
         total_rows = len(df)
         start = (page - 1) * page_size
         end = start + page_size
         
-        data = df.iloc[start:end].replace({float('nan'): None}).to_dict(orient='records')
+        data = formats.encode_page(df.iloc[start:end], response_format)
         columns = list(df.columns)
         
         return {
@@ -38,6 +57,55 @@ class XLSXService:
             'page_size': page_size
         }
 
+    def read_text_sheet(self, file_path, sheet_name=None):
+        """
+        The whole sheet as text cells, as iter_text_chunks gives them, parsed
+        once and then kept in the frame cache and a columnar sidecar.
+        """
+        def parse(_path):
+            return pd.concat(list(self.iter_text_chunks(file_path, sheet_name)), ignore_index=True)
+
+        def load():
+            df = columnar.load(file_path, parse, sheet=sheet_name, variant='text')
+            # Arrow hands back its own strings and NA; the text paths expect objects and NaN
+            return df.astype(object).where(df.notna(), np.nan)
+
+        return frame_cache.get_or_load(file_path, load, sheet=sheet_name, variant='text')
+
+    def iter_text_chunks(self, file_path, sheet_name=None, chunksize=100_000):
+        """
+        Rows of a sheet as DataFrames of text cells, `chunksize` rows at a
+        time, streamed with openpyxl's read-only mode so the sheet is never
+        fully in memory. Legacy .xls files have no streaming reader and are
+        parsed whole.
+        """
+        if not str(file_path).endswith('.xlsx'):
+            df = pd.read_excel(file_path, sheet_name=sheet_name or 0, dtype=str)
+            for start in range(0, max(len(df), 1), chunksize):
+                yield df.iloc[start:start + chunksize]
+            return
+
+        wb = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+        try:
+            ws = wb[sheet_name] if sheet_name else wb.worksheets[0]
+            rows = ws.iter_rows(values_only=True)
+            header = next(rows, ())
+            # Same names pd.read_excel gives to blank headers
+            columns = [str(h) if h is not None else f"Unnamed: {i}" for i, h in enumerate(header)]
+            batch = []
+            emitted = False
+            for row in rows:
+                batch.append([_cell_text(v) for v in row[:len(columns)]])
+                if len(batch) == chunksize:
+                    yield pd.DataFrame(batch, columns=columns, dtype=object)
+                    batch = []
+                    emitted = True
+            if batch or not emitted:
+                # An empty sheet, or one with only a header, still has its columns
+                yield pd.DataFrame(batch, columns=columns, dtype=object)
+        finally:
+            wb.close()
+
     def get_sheet_info(self, file_path):
         """
         Get information about all sheets in an XLSX file.
@@ -1,8 +1,11 @@
+from django.http import HttpResponse
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from django.shortcuts import get_object_or_404
 from apps.documents.models import Document
+from apps.tools.conditional import conditional_get
+from apps.tools.csv.formats import ARROW_STREAM_TYPE, RESPONSE_FORMATS, arrow_response_headers
 from .services import XLSXService
 from drf_spectacular.utils import extend_schema, OpenApiParameter
 from rest_framework import serializers
@@ -11,6 +14,7 @@ class XLSXReadSerializer(serializers.Serializer):
     page = serializers.IntegerField(default=1)
     page_size = serializers.IntegerField(default=50)
     sheet_name = serializers.CharField(required=False)
+    response_format = serializers.ChoiceField(choices=RESPONSE_FORMATS, default='records', help_text="'columnar' returns one array per column; 'arrow' an Arrow IPC stream")
 
 class XLSXStructureView(APIView):
     def get(self, request, file_id):
@@ -27,22 +31,29 @@ class XLSXStructureView(APIView):
 
 class XLSXReadView(APIView):
     @extend_schema(parameters=[XLSXReadSerializer])
+    @conditional_get
     def get(self, request, file_id):
         doc = get_object_or_404(Document, pk=file_id)
         
         page = int(request.query_params.get('page', 1))
         page_size = int(request.query_params.get('page_size', 50))
         sheet_name = request.query_params.get('sheet_name')
+        response_format = request.query_params.get('response_format', 'records')
         
         service = XLSXService()
         try:
-            result = service.read_sheet(doc.file.path, sheet_name, page, page_size)
+            result = service.read_sheet(doc.file.path, sheet_name, page, page_size, response_format)
+            if response_format == 'arrow':
+                return HttpResponse(result['data'], content_type=ARROW_STREAM_TYPE, headers=arrow_response_headers(result))
             return Response(result)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 class XLSXSheetsView(APIView):
     """Get sheet information for an XLSX file"""
+    @conditional_get
     def get(self, request, file_id):
         doc = get_object_or_404(Document, pk=file_id)
         
@@ -134,6 +134,29 @@ STORAGES = {
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "media"
 
+# Memory budget of the per-process DataFrame cache used by the CSV/XLSX tools,
+# measured with DataFrame.memory_usage(deep=True). Each gunicorn worker holds
+# its own cache, so keep workers * budget within the instance's memory.
+DATAFRAME_CACHE_BYTES = env.int("DATAFRAME_CACHE_BYTES", default=256 * 1024 * 1024)
+
+# Build trigram indexes of the text columns of uploaded CSVs in the background,
+# so substring filters read only candidate rows. Off by default: each build is
+# a full pass per text column in the web worker; without it, a column is
+# indexed on its first substring filter instead.
+TRIGRAM_INDEX_ON_UPLOAD = env.bool("TRIGRAM_INDEX_ON_UPLOAD", default=False)
+
+# Parser for full CSV loads: auto (by file size and core count), pandas,
+# pyarrow or chunked. A document can override it (see apps/tools/csv/engines.py).
+CSV_PARSER_ENGINE = env("CSV_PARSER_ENGINE", default="auto")
+
+# Processes each web worker may use to aggregate large CSVs (one pool, kept
+# for the worker's lifetime). 0 or 1 aggregates in the request's own process.
+AGGREGATE_PROCESSES = env.int("AGGREGATE_PROCESSES", default=0)
+
+# Memory the out-of-core CSV operations (joins, ...) may hold per request
+# before they partition their input into files under MEDIA_ROOT/temp.
+SPILL_MEMORY_BYTES = env.int("SPILL_MEMORY_BYTES", default=256 * 1024 * 1024)
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 